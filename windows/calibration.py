@@ -0,0 +1,123 @@
+"""
+Calibrated match thresholds and search regions of the template images.
+
+tools/calibrate_templates.py matches every template against labelled
+screenshots and writes CALIBRATION_PATH with, per template, the confidence
+that separates true matches from the best false ones, the lowest confidence
+a retry may decay to, and the screen region the template was ever found in.
+The messenger loads the profile at startup; templates without an entry, or
+whose image changed since the calibration, keep the values in the code.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import config
+import templates
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("calibration")
+
+_profile = {}  # template file name -> calibrated entry
+_lock = threading.Lock()
+
+
+def template_hash(path):
+    """
+    Args:
+        path (str): Template image path
+
+    Returns:
+        str: SHA-1 of the file, to tell whether a calibration still applies
+    """
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load(path=None):
+    """
+    Load a calibration profile, replacing the current one. Entries of
+    templates that are not configured or have changed are skipped.
+
+    Args:
+        path (str): Profile path, CALIBRATION_PATH if None
+
+    Returns:
+        int: Number of templates with calibrated values
+    """
+    global _profile
+    path = path or config.CALIBRATION_PATH
+    if not os.path.exists(path):
+        with _lock:
+            _profile = {}
+        return 0
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)["templates"]
+
+    profile = {}
+    for template in templates.template_paths():
+        name = os.path.basename(template)
+        entry = entries.get(name)
+        if entry is None:
+            continue
+        try:
+            current = template_hash(template)
+        except OSError:
+            continue
+        if entry.get("sha1") != current:
+            log.warning(f"Calibration of {name} is out of date, the template changed since; using defaults")
+            continue
+        profile[name] = entry
+    with _lock:
+        _profile = profile
+    log.info(f"Loaded calibration of {len(profile)} templates from {path}")
+    return len(profile)
+
+
+def forget(target):
+    """Drop the calibration of a template, e.g. after its image changed."""
+    with _lock:
+        _profile.pop(os.path.basename(target), None)
+
+
+def confidence(target, default):
+    """
+    Args:
+        target (str): Template path
+        default (float): Confidence used without a calibration
+
+    Returns:
+        float: Calibrated confidence for the template, or the default
+    """
+    entry = _profile.get(os.path.basename(target))
+    return default if entry is None else entry["confidence"]
+
+
+def floor(target, default):
+    """
+    Args:
+        target (str): Template path
+        default (float): Lowest retry confidence without a calibration
+
+    Returns:
+        float: Lowest confidence a retry may use without matching a wrong element
+    """
+    entry = _profile.get(os.path.basename(target))
+    return default if entry is None else entry["floor"]
+
+
+def region(target):
+    """
+    Args:
+        target (str): Template path
+
+    Returns:
+        tuple: (left, top, width, height) the template was found in, None if
+            unknown or anywhere on the screen
+    """
+    entry = _profile.get(os.path.basename(target))
+    if entry is None or entry.get("region") is None:
+        return None
+    return tuple(entry["region"])
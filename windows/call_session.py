@@ -0,0 +1,132 @@
+"""
+Tracking of the call started by a "call" press.
+
+Hanging up used to search the whole screen for CANCEL_CALL and, on a miss,
+bring LINE to the front and search twice more. A CallSession is created
+when START_CALL is clicked: while the call rings, a background thread finds
+the call window's cancel button once and keeps a fingerprint of it, an 8x8
+grayscale thumbnail. Hanging up, by the STOP_CALL_AFTER_SECONDS timer or by
+a "cancel" press, then only grabs the button's few pixels, compares them
+with the fingerprint and clicks: no screen search in the common case.
+"""
+import threading
+import time
+from threading import Thread, Event
+
+import pyautogui
+
+import calibration
+import config
+import templates
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("call")
+
+FINGERPRINT_SIZE = (8, 8)
+
+
+def fingerprint(image):
+    """
+    Args:
+        image (PIL.Image.Image): Screenshot of a UI element
+
+    Returns:
+        bytes: Gray levels of the element scaled down to FINGERPRINT_SIZE
+    """
+    return bytes(image.convert("L").resize(FINGERPRINT_SIZE).getdata())
+
+
+def difference(a, b):
+    """Mean gray-level difference of two fingerprints, 0-255."""
+    return sum(abs(x - y) for x, y in zip(a, b)) / len(a)
+
+
+class CallSession:
+    """
+    A call in progress: where its cancel button is and the auto-hangup timer.
+    """
+
+    def __init__(self, hang_up, hint=None):
+        """
+        Args:
+            hang_up (callable): Called with this session after STOP_CALL_AFTER_SECONDS
+            hint (Box): Where the cancel button was found last time, searched first
+        """
+        self.started = time.monotonic()
+        self.hint = hint
+        self.box = None
+        self.fingerprint = None
+        self.ended = Event()
+        self.timer = threading.Timer(config.STOP_CALL_AFTER_SECONDS, hang_up, args=(self,))
+        self.timer.daemon = True
+
+    def start(self):
+        """Start the auto-hangup timer and look for the call window."""
+        self.timer.start()
+        Thread(target=self._track, name="call-window", daemon=True).start()
+
+    def _track(self):
+        deadline = time.monotonic() + config.CALL_WINDOW_TIMEOUT
+        while not self.ended.is_set():
+            try:
+                box = self._find()
+                if box is not None:
+                    self.fingerprint = fingerprint(pyautogui.screenshot(region=tuple(box)))
+                    self.box = box
+                    log.debug("Call window's cancel button at %s, found after %.2fs",
+                              box, time.monotonic() - self.started)
+                    return
+            except Exception as e:
+                log.debug("Searching the call window failed: %s", e)
+            if time.monotonic() > deadline:
+                log.warning("Call window not found, hanging up will search the screen")
+                return
+            self.ended.wait(config.CALL_WINDOW_POLL_INTERVAL)
+
+    def _find(self):
+        template = templates.get(config.CANCEL_CALL)
+        confidence = calibration.confidence(config.CANCEL_CALL, config.IMAGE_SEARCH_CONFIDENCE)
+        region = calibration.region(config.CANCEL_CALL)
+        if self.hint is not None:
+            margin = config.UI_HINT_MARGIN
+            left, top = max(0, self.hint.left - margin), max(0, self.hint.top - margin)
+            region = (left, top, self.hint.left + self.hint.width + margin - left,
+                      self.hint.top + self.hint.height + margin - top)
+        if region is not None:
+            try:
+                found = pyautogui.locateOnScreen(template, confidence=confidence, region=region,
+                                                 grayscale=templates.GRAYSCALE)
+                if found is not None:
+                    return found
+            except pyautogui.ImageNotFoundException:
+                pass
+        try:
+            return pyautogui.locateOnScreen(template, confidence=confidence, grayscale=templates.GRAYSCALE)
+        except pyautogui.ImageNotFoundException:
+            return None
+
+    def cancel_button(self):
+        """
+        Check the tracked cancel button against its fingerprint.
+
+        Returns:
+            Box: The button's location if it is still there, None if it was not
+                found yet, moved, or the call window is gone
+        """
+        box = self.box
+        if box is None or self.ended.is_set():
+            return None
+        try:
+            shot = pyautogui.screenshot(region=tuple(box))
+        except Exception as e:
+            log.debug("Could not capture the cancel button: %s", e)
+            return None
+        if difference(fingerprint(shot), self.fingerprint) > config.CALL_FINGERPRINT_TOLERANCE:
+            return None
+        return box
+
+    def end(self):
+        """Stop the timer and the search, e.g. after hanging up."""
+        self.ended.set()
+        self.timer.cancel()
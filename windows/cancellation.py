@@ -0,0 +1,96 @@
+"""
+Cooperative cancellation of UI jobs.
+
+A send through the LINE UI is a chain of locates, clicks and waits that can
+take a minute when an element does not show up. The processor hands every
+job a CancelToken; the messenger checks it before every step and in every
+wait, so a more urgent press can stop the job in progress between two steps
+instead of waiting for it to run to completion.
+
+A step that cannot be undone, posting the message or starting the call,
+commits the job first: from then on it runs to completion whatever happens
+to the token, so it is never interrupted halfway and never sent twice.
+"""
+import threading
+import time
+
+
+class JobCancelled(Exception):
+    """Raised at a checkpoint of a job whose token was cancelled."""
+    pass
+
+
+class CancelToken:
+    """
+    Cancellation flag of one job, checked by the job at its checkpoints.
+    """
+
+    def __init__(self, event=None, on_commit=None):
+        """
+        Args:
+            event: threading.Event, or a multiprocessing Event shared with a
+                worker process, a new threading.Event if None
+            on_commit (callable): Called once when the job commits, e.g. to
+                tell the bridge from a worker process
+        """
+        self.event = event if event is not None else threading.Event()
+        self.on_commit = on_commit
+        self.reason = None
+        self.committed = False
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self, reason=None):
+        """
+        Ask the job to stop at its next checkpoint.
+
+        Args:
+            reason (str): Why, e.g. the press that preempted the job
+        """
+        self.reason = reason
+        self.event.set()
+
+    def commit(self):
+        """
+        Mark the job as past its point of no return: checkpoints stop raising
+        and waits last their full time.
+        """
+        if self.committed:
+            return
+        self.committed = True
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def check(self):
+        """
+        Raises:
+            JobCancelled: If the job was cancelled before it committed
+        """
+        if self.event.is_set() and not self.committed:
+            raise JobCancelled(self.reason or "cancelled")
+
+    def wait(self, seconds):
+        """
+        Wait without raising, returning early if the job is cancelled before
+        it committed.
+
+        Returns:
+            bool: True if the job was cancelled and has not committed
+        """
+        if self.committed:
+            time.sleep(seconds)
+            return False
+        return self.event.wait(seconds)
+
+    def sleep(self, seconds):
+        """
+        Wait as a checkpoint.
+
+        Raises:
+            JobCancelled: If the job is cancelled before or during the wait
+                and has not committed
+        """
+        if self.wait(seconds):
+            raise JobCancelled(self.reason or "cancelled")
@@ -0,0 +1,256 @@
+"""
+Coordination between bridge instances sharing a broker.
+
+Every instance publishes a retained heartbeat on `CLUSTER_TOPIC/nodes/<id>`
+and registers a retained last will on the same topic, so a crashed instance
+is reported dead by the broker at once and a hung one stops heartbeating.
+In "standby" mode the leader is the alive instance with the lowest
+(priority, node id) and only the leader sends to LINE. In "partitioned" mode
+every target group is owned by one instance chosen by rendezvous hashing,
+so groups are delivered in parallel while each group keeps its order.
+Every instance receives every event; the ones not responsible for it hold
+it until the responsible instance acknowledges it on `CLUSTER_TOPIC/done`,
+and deliver whatever is left unacknowledged when they take over.
+"""
+import hashlib
+import json
+import time
+from threading import Thread, Event, RLock
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("cluster")
+
+
+def event_key(topic, payload):
+    """
+    Key identifying the same MQTT event on every instance.
+
+    zigbee2mqtt often sends identical payloads for repeated presses, so the
+    key is not unique per press: acknowledgements also carry the press's
+    receive time, and match only within CLUSTER_ACK_TOLERANCE of it.
+
+    Args:
+        topic (str): MQTT topic
+        payload (bytes): MQTT payload
+
+    Returns:
+        str: Short hash of topic and payload
+    """
+    return hashlib.sha1(topic.encode() + b"\0" + payload).hexdigest()[:16]
+
+
+class ClusterMember:
+    """
+    Membership, leader election and target group ownership of one bridge instance.
+    """
+
+    def __init__(self, node_id=None, priority=None, health=None):
+        """
+        Initialize the member.
+
+        Args:
+            node_id (str): Unique name of this instance, CLUSTER_NODE_ID if None
+            priority (int): Lower values are preferred as leader, CLUSTER_PRIORITY if None
+            health (callable): Returns False while this instance cannot deliver;
+                heartbeats pause so another instance takes over
+        """
+        self.node_id = node_id or config.CLUSTER_NODE_ID
+        self.priority = config.CLUSTER_PRIORITY if priority is None else priority
+        self.health = health
+        self.prefix = config.CLUSTER_TOPIC
+        self.node_topic = f"{self.prefix}/nodes/{self.node_id}"
+        self.done_topic = f"{self.prefix}/done"
+        self.client = None
+        self.peers = {}  # node id -> (priority, monotonic time of the last live heartbeat)
+        self.lock = RLock()
+        self.started_at = None
+        self.leader = False
+        self.view = (False, ())  # (delivering, sorted member ids) as last reported
+        self.members = {}        # alive node id -> priority, including this instance
+        self.listeners = []
+        self.should_stop = Event()
+        self.thread = None
+
+    # ---- MQTTConnection hooks ---------------------------------------------
+
+    def attach(self, client):
+        """
+        Register the last will on a new client, before it connects.
+
+        Args:
+            client (paho.mqtt.client.Client): The connection's client
+        """
+        self.client = client
+        client.will_set(self.node_topic, self._payload("dead"), qos=1, retain=True)
+
+    def on_connected(self):
+        """Subscribe to the membership topics and announce this instance."""
+        self.client.subscribe(f"{self.prefix}/#", qos=1)
+        self._heartbeat()
+        if self.thread is None:
+            self.started_at = time.monotonic()
+            self.thread = Thread(target=self._run, name="cluster", daemon=True)
+            self.thread.start()
+
+    def handles(self, topic):
+        """Whether a topic belongs to the cluster protocol."""
+        return topic.startswith(self.prefix + "/")
+
+    def on_message(self, msg):
+        """
+        Process a heartbeat, last will or acknowledgement.
+
+        Args:
+            msg: MQTT message object from paho-mqtt
+        """
+        if msg.topic == self.done_topic:
+            data = json.loads(msg.payload)
+            if data.get("node") != self.node_id:
+                self._notify("acked", (data.get("key"), data.get("received")))
+            return
+        if not msg.payload:
+            return
+        data = json.loads(msg.payload)
+        node_id = data.get("node")
+        if node_id == self.node_id:
+            return
+        with self.lock:
+            if data.get("state") != "alive":
+                if self.peers.pop(node_id, None) is not None:
+                    log.warning(f"Node {node_id} left the cluster")
+            elif not msg.retain:
+                # Retained heartbeats may be stale, only live ones prove liveness
+                if node_id not in self.peers:
+                    log.info(f"Node {node_id} joined the cluster")
+                self.peers[node_id] = (data.get("priority", 0), time.monotonic())
+        self._update_membership()
+
+    # ---- election ----------------------------------------------------------
+
+    def _payload(self, state):
+        return json.dumps({"node": self.node_id, "state": state,
+                           "priority": self.priority, "ts": time.time()})
+
+    def _heartbeat(self):
+        if self.health is not None and not self.health():
+            log.warning("Instance unhealthy, pausing heartbeats")
+            return
+        self.client.publish(self.node_topic, self._payload("alive"), qos=1, retain=True)
+
+    def _alive_peers(self):
+        now = time.monotonic()
+        with self.lock:
+            for node_id, (_, last_seen) in list(self.peers.items()):
+                if now - last_seen > config.CLUSTER_FAILOVER_TIMEOUT:
+                    log.warning(f"No heartbeat from node {node_id} for {now - last_seen:.1f}s, "
+                                "considering it dead")
+                    del self.peers[node_id]
+            return {node_id: priority for node_id, (priority, _) in self.peers.items()}
+
+    def _owner(self, group, members):
+        if config.CLUSTER_MODE == "partitioned":
+            # Rendezvous hashing: only the groups of a joining or leaving node move
+            return max(members, key=lambda node_id: hashlib.sha1(f"{node_id}|{group or ''}".encode()).digest())
+        return min(members, key=lambda node_id: (members[node_id], node_id))
+
+    def _update_membership(self):
+        # Give peers a few heartbeats to show up before delivering anything
+        settled = (self.started_at is not None and
+                   time.monotonic() - self.started_at >= 2 * config.CLUSTER_HEARTBEAT_INTERVAL)
+        healthy = self.health is None or self.health()
+        with self.lock:
+            members = self._alive_peers()
+            if healthy:
+                members[self.node_id] = self.priority
+            view = (settled and healthy, tuple(sorted(members)))
+            changed = view != self.view
+            self.view, self.members = view, members
+            leader = (config.CLUSTER_MODE != "partitioned" and view[0]
+                      and self._owner(None, members) == self.node_id)
+            leadership_changed = leader != self.leader
+            self.leader = leader
+
+        if leadership_changed:
+            if leader:
+                log.critical(f"Node {self.node_id} is now the leader")
+            else:
+                log.warning(f"Node {self.node_id} is now standby")
+            self._notify("leadership", leader)
+        if changed:
+            log.info(f"Cluster members: {', '.join(view[1])}")
+            self._notify("membership", view[1])
+
+    def _run(self):
+        while not self.should_stop.wait(config.CLUSTER_HEARTBEAT_INTERVAL):
+            try:
+                self._heartbeat()
+                self._update_membership()
+            except Exception as e:
+                log.error(f"Error in cluster heartbeat: {e}")
+
+    # ---- public API --------------------------------------------------------
+
+    def is_leader(self):
+        """Whether this instance is the leader in standby mode."""
+        return self.leader
+
+    def owner(self, group=None):
+        """
+        Instance responsible for a target group in the current membership view.
+
+        Args:
+            group (str): Target group, None for the default group
+
+        Returns:
+            str: Node id, or None if there are no alive members
+        """
+        members = self.members
+        return self._owner(group, members) if members else None
+
+    def should_deliver(self, group=None):
+        """
+        Whether this instance should deliver a message for the target group:
+        as leader in standby mode, or as the group's owner in partitioned mode.
+        """
+        return self.view[0] and self.owner(group) == self.node_id
+
+    def add_listener(self, callback):
+        """
+        Register a callback for cluster events.
+
+        Args:
+            callback (callable): Called with ("leadership", bool) when this
+                instance becomes leader or standby, with ("membership", node ids)
+                when the alive instances change, and with ("acked", (key, receive time))
+                when another instance finished an event
+        """
+        self.listeners.append(callback)
+
+    def _notify(self, kind, value):
+        for callback in self.listeners:
+            try:
+                callback(kind, value)
+            except Exception as e:
+                log.error(f"Error in cluster listener: {e}")
+
+    def ack(self, key, received=None):
+        """
+        Tell the standbys that an event has been handled.
+
+        Args:
+            key (str): Event key from event_key()
+            received (float): Wall-clock time the event was received, tells
+                apart presses with the same key
+        """
+        if self.client is not None and key:
+            self.client.publish(self.done_topic, json.dumps({"node": self.node_id, "key": key,
+                                                             "received": received}), qos=1)
+
+    def stop(self):
+        """Leave the cluster cleanly so a standby takes over immediately."""
+        self.should_stop.set()
+        if self.client is not None:
+            self.client.publish(self.node_topic, self._payload("dead"), qos=1, retain=True)
@@ -3,6 +3,9 @@ Configuration settings for the MQTT to LINE messaging system.
 """
 import os
 import argparse
+import json
+import socket
+import threading
 from pathlib import Path
 import logging
 
@@ -11,8 +14,12 @@ MQTT_BROKER = "192.168.108.128"
 MQTT_PORT = 1883
 MQTT_TOPIC = "zigbee2mqtt/#"
 MQTT_QOS = 0
-MQTT_RECONNECT_DELAY = 5  # seconds
-MQTT_MAX_RECONNECT_ATTEMPTS = 10
+MQTT_KEEPALIVE = 15               # seconds
+MQTT_RECONNECT_DELAY = 0.5        # seconds, first retry, doubled on every failure
+MQTT_RECONNECT_MAX_DELAY = 30     # seconds, upper bound of the backoff, retries never stop
+MQTT_WATCHDOG_TOPIC = "emergency-button/watchdog"
+MQTT_WATCHDOG_SILENCE = 30        # seconds without traffic before probing the broker
+MQTT_WATCHDOG_PROBE_TIMEOUT = 5   # seconds to wait for the probe before forcing a reconnect
 
 ############# Button Behavior ############
 BUTTON_ACTION_BEHAVIOR = {  # "call", "cancel", "debug"
@@ -21,12 +28,45 @@ BUTTON_ACTION_BEHAVIOR = {  # "call", "cancel", "debug"
     "long"  : "debug"
 }
 STOP_CALL_AFTER_SECONDS = 30
+CALL_WINDOW_TIMEOUT = 10           # seconds to find the call window's cancel button after starting a call
+CALL_WINDOW_POLL_INTERVAL = 0.25   # seconds between searches for it
+CALL_FINGERPRINT_TOLERANCE = 12    # mean gray-level difference (0-255) at which the button still counts as there
 
 ############ Button Alert Thresholds ############
 BATTERY_ALARM_THRESHOLD = 30    # %
 VOLTAGE_ALARM_THRESHOLD = 2400  # mV
 LINK_ALARM_THRESHOLD = 60       # quality
 
+############ Device Liveness ############
+DEVICE_MONITOR_ENABLED = True
+DEVICE_MONITOR_TICK = 1            # seconds per timer wheel slot, resolution of the alerts
+DEVICE_MONITOR_SLOTS = 4096        # timer wheel size, longer timeouts take several turns
+DEVICE_MIN_SAMPLES = 5             # reports needed before the learned interval is used
+DEVICE_SILENCE_DEFAULT = 2 * 3600  # seconds of silence before an alert while still learning
+DEVICE_SILENCE_FACTOR = 3          # alert after this many learned intervals without a report
+DEVICE_SILENCE_MIN = 10 * 60       # seconds, bounds of the learned timeout
+DEVICE_SILENCE_MAX = 24 * 3600
+
+############ UI Worker Process ############
+# Run the LINE UI automation in a separate, supervised process
+UI_WORKER_ENABLED = True
+UI_WORKER_START_TIMEOUT = 120      # seconds for a new worker to find LINE
+UI_WORKER_JOB_TIMEOUT = 120        # seconds before a send or self-check is considered hung
+UI_WORKER_PING_INTERVAL = 5        # seconds between liveness pings of an idle worker
+UI_WORKER_PING_TIMEOUT = 10
+UI_WORKER_RESTART_DELAY = 30       # seconds before retrying after a worker failed to start
+
+############ Latency Objective ############
+# Seconds from receiving a press to the end of its send (the call click for "call")
+SLO_ENABLED = True
+SLO_ACTIONS = ("call", "cancel")   # Actions measured against the budgets
+SLO_EVENT_BUDGET = 30              # Any single press slower than this is escalated
+SLO_P95_BUDGET = 15                # The window's p95 above this is escalated
+SLO_WINDOW = 3600                  # seconds covered by the rolling percentiles
+SLO_WINDOW_SLOTS = 12              # The window moves in steps of SLO_WINDOW / SLO_WINDOW_SLOTS
+SLO_MIN_SAMPLES = 5                # Presses in the window before the p95 is judged
+SLO_SKETCH_ACCURACY = 0.02         # Relative error of the percentiles
+
 ############ LINE Automation Settings ############
 MOUSE_MOVE_DURATION = 0.0       # seconds
 SLEEP_AFTER_CLICK = 0.0         # seconds
@@ -35,6 +75,61 @@ IMAGE_RETRY_COUNT = 10
 IMAGE_RETRY_INTERVAL = 0.25     # seconds
 IMAGE_SEARCH_TIMEOUT = 60       # seconds
 IMAGE_CACHE_LIFETIME = 3        # seconds, won't search again if cached
+GROUP_NAVIGATION_MODE = "list"  # "list": find the group's image in the group list,
+                                # "search": paste its name into LINE's search, the list is the fallback
+TARGET_GROUP_SEARCH_TEXT = ""   # name typed into the search for TARGET_GROUP_NAME
+TARGET_GROUP_SEARCH_TEXTS = {}  # group -> name typed into the search, the group name if missing
+GROUP_SEARCH_HOTKEY = ("ctrl", "f")
+GROUP_SEARCH_TIMEOUT = 1.5      # seconds to wait for the search result
+GROUP_SEARCH_POLL_INTERVAL = 0.15  # seconds
+UI_HINT_MARGIN = 40             # pixels around the last known location that are searched first
+IDLE_CHECK_INTERVAL = 60        # seconds, self-check LINE after being idle this long, 0 disables
+# Confidences and search regions per template, written by tools/calibrate_templates.py
+CALIBRATION_PATH = str(Path(__file__).parent / "data" / "calibration.json")
+
+############ Outbox Settings ############
+OUTBOX_ENABLED = True
+OUTBOX_PATH = str(Path(__file__).parent / "data" / "outbox.sqlite3")
+OUTBOX_REPLAY_MAX_AGE = 300        # seconds, unfinished messages older than this are not replayed
+OUTBOX_RETENTION = 7 * 24 * 3600   # seconds, finished entries are purged after this
+
+############ Event History ############
+# Every processed event, for the /presses and /failed_sends Discord commands
+HISTORY_ENABLED = True
+HISTORY_PATH = str(Path(__file__).parent / "data" / "history.sqlite3")
+HISTORY_FLUSH_INTERVAL = 2         # seconds events are collected before being written in one transaction
+HISTORY_QUEUE_SIZE = 10000         # events waiting to be written before new ones are dropped
+HISTORY_RETENTION = 365 * 24 * 3600  # seconds, older events are deleted
+
+############ Fallback Delivery ############
+# Alerts go to LINE first; if LINE fails or is late they also go out on the fallback channels
+DELIVERY_FALLBACKS = ("webhook", "discord")  # "webhook" needs WEBHOOK_URL, "discord" the Discord bot
+DELIVERY_HEDGE_ACTIONS = ("call",)  # Actions sent on the fallbacks, others only go to LINE
+DELIVERY_HEDGE_AFTER = 20          # seconds LINE may take before the fallbacks are used as well
+WEBHOOK_URL = os.environ.get("ALERT_WEBHOOK_URL", "")  # JSON POST endpoint, empty disables the channel
+WEBHOOK_HEADERS = {}               # e.g. {"Authorization": "Bearer ..."}
+WEBHOOK_TIMEOUT = 5                # seconds per request
+WEBHOOK_POOL_SIZE = 2              # idle keep-alive connections
+DISCORD_ALERT_TIMEOUT = 10         # seconds to wait for Discord to accept an alert
+
+############ Job Priority ############
+# Queued messages are sent in this order; a more urgent one interrupts the send in progress
+ACTION_PRIORITY = {"cancel": 0, "call": 1, "debug": 2}  # lower is more urgent, others come last
+PREEMPT_ENABLED = True             # False lets every send run to completion
+PREEMPT_TIMEOUT = 5                # seconds an interrupted UI worker may take to stop before it is restarted
+
+############ Multiple Bridges ############
+# Run several bridges against one broker; if one fails the others take over its messages
+CLUSTER_ENABLED = False
+CLUSTER_MODE = "standby"           # "standby": the leader delivers everything,
+                                   # "partitioned": target groups are spread over the instances
+CLUSTER_NODE_ID = os.environ.get("BRIDGE_NODE_ID", socket.gethostname())  # unique per instance
+CLUSTER_PRIORITY = 0               # lower is preferred as leader, ties are broken by node id
+CLUSTER_TOPIC = "emergency-button/cluster"
+CLUSTER_HEARTBEAT_INTERVAL = 1     # seconds
+CLUSTER_FAILOVER_TIMEOUT = 5       # seconds without heartbeat before the leader is considered dead
+CLUSTER_STUCK_TIMEOUT = 120        # seconds a single send may take before this instance steps down
+CLUSTER_ACK_TOLERANCE = 2          # seconds between two instances receiving the same press, incl. clock skew
 
 ############ Image Paths ############
 # using pathlib for cross-platform compatibility
@@ -52,41 +147,164 @@ CALL_SELECTION       = str(IMAGE_DIR / "call-selection.png")
 START_CALL           = str(IMAGE_DIR / "start-call.png")
 CANCEL_CALL          = str(IMAGE_DIR / "cancel-call.png")
 MINI_CANCEL_PREVIEW  = str(IMAGE_DIR / "mini-cancel-preview.png")
+# Further LINE groups: group name -> image of its entry in the group list.
+# Messages of devices not in DEVICE_TARGET_GROUP go to TARGET_GROUP_NAME.
+TARGET_GROUPS = {}
+DEVICE_TARGET_GROUP = {}           # device (last topic segment, glob patterns allowed) -> group name
+TEMPLATE_KEYS = (
+    "LINE_ICON", "LINE_LEFT_BAR_ICON_1", "LINE_LEFT_BAR_ICON_3", "LINE_LOGIN",
+    "GROUP_TAB", "GROUP_TAB_ACTIVATED", "TARGET_GROUP_NAME", "INPUT_BOX",
+    "CALL_ICON", "CALL_SELECTION", "START_CALL", "CANCEL_CALL", "MINI_CANCEL_PREVIEW",
+)
 
 ############ Log Configs ############
 LOG_ROTATE_WHEN = "W0"             # When to trigger check, 'H', "M", "S", "D", "W0-W6", "midnight"
 LOG_ROTATE_INTERVAL = 7            # How many 'when' in one file
 LOG_ROTATE_BACKUPCOUNT = 8         # Preserve how many files
+LOG_COMPRESS = True                # Gzip rotated log files on a background thread
+LOG_MAX_TOTAL_BYTES = 1024 ** 3    # Oldest rotated files are deleted above this total size, 0 for no cap
+LOG_ASYNC = True                   # Format and write logs on a background thread
+TRACE_ENABLED = True               # Write per-stage JSON-lines spans to logs/trace.log
+RECORDER_ENABLED = False           # Record screenshots and actions of every send for tools/replay_session.py
+RECORDER_DIR = str(Path(__file__).parent.parent / "logs" / "sessions")
+RECORDER_KEEP = 50                 # Recorded sessions to keep, the oldest are deleted
+RECORDER_KEYFRAME_INTERVAL = 30    # Frames between full (not delta encoded) frames
+PROFILE_DIR = str(Path(__file__).parent.parent / "logs")  # Where profiler dumps (*.folded) are written
+PROFILE_CONTROL_TOPIC = "emergency-button/control/profile"  # Publish here to profile a running bridge
+PROFILE_SAMPLE_INTERVAL = 0.01     # seconds between stack samples
+PROFILE_DEFAULT_SECONDS = 30       # Length of a profiling window unless requested otherwise
+PROFILE_MAX_SECONDS = 600
 ENABLE_DISOCRD_BOT_LOGGING = True  #
 BOT_LOG_LEVEL = logging.CRITICAL   #
+BOT_QUEUE_MAXSIZE = 500            # Buffered records before the oldest are dropped
+BOT_RATE_LIMIT_MESSAGES = 5        # Discord allows about 5 messages per 5 seconds per channel
+BOT_RATE_LIMIT_PERIOD = 5          # seconds
+
+############ Hot Reload ############
+# Optional JSON file overriding any setting above, e.g. {"STOP_CALL_AFTER_SECONDS": 45}.
+# It is applied at startup and re-applied to the running bridge whenever it changes.
+SETTINGS_FILE = str(Path(__file__).parent / "settings.json")
+CONFIG_WATCH_INTERVAL = 2          # seconds between checks of the settings file and template images
+
+# Held while new settings are applied and while a message is being processed,
+# so a send never sees a half-applied reload
+lock = threading.RLock()
 
 
 ############ Validation ################################################
 
-def validate_config():
-    """Validate configuration settings."""
-    if not IMAGE_DIR.exists():
-        raise FileNotFoundError(f"Image directory not found: {IMAGE_DIR}")
+def validate_config(settings=None):
+    """
+    Validate configuration settings.
+
+    Args:
+        settings (dict): Settings to validate instead of the current module values
+    """
+    s = globals() if settings is None else settings
+    if not Path(s["IMAGE_DIR"]).exists():
+        raise FileNotFoundError(f"Image directory not found: {s['IMAGE_DIR']}")
 
     # Validate thresholds
-    if not 0 <= BATTERY_ALARM_THRESHOLD <= 100:
-        raise ValueError(f"Battery threshold must be between 0-100%: {BATTERY_ALARM_THRESHOLD}")
+    if not 0 <= s["BATTERY_ALARM_THRESHOLD"] <= 100:
+        raise ValueError(f"Battery threshold must be between 0-100%: {s['BATTERY_ALARM_THRESHOLD']}")
 
-    if not 0 <= VOLTAGE_ALARM_THRESHOLD <= 3300:
-        raise ValueError(f"Voltage threshold must be between 0-3300mV: {VOLTAGE_ALARM_THRESHOLD}")
+    if not 0 <= s["VOLTAGE_ALARM_THRESHOLD"] <= 3300:
+        raise ValueError(f"Voltage threshold must be between 0-3300mV: {s['VOLTAGE_ALARM_THRESHOLD']}")
 
-    if not 0 <= LINK_ALARM_THRESHOLD <= 100:
-        raise ValueError(f"Link quality threshold must be between 0-100: {LINK_ALARM_THRESHOLD}")
+    if not 0 <= s["LINK_ALARM_THRESHOLD"] <= 100:
+        raise ValueError(f"Link quality threshold must be between 0-100: {s['LINK_ALARM_THRESHOLD']}")
 
     # Validate image files exist
     image_files = [
-        LINE_ICON, LINE_LEFT_BAR_ICON_1, LINE_LEFT_BAR_ICON_3,
-        GROUP_TAB, GROUP_TAB_ACTIVATED, TARGET_GROUP_NAME,
-        INPUT_BOX, CALL_ICON, CALL_SELECTION, START_CALL, CANCEL_CALL
-    ]
+        s["LINE_ICON"], s["LINE_LEFT_BAR_ICON_1"], s["LINE_LEFT_BAR_ICON_3"],
+        s["GROUP_TAB"], s["GROUP_TAB_ACTIVATED"], s["TARGET_GROUP_NAME"],
+        s["INPUT_BOX"], s["CALL_ICON"], s["CALL_SELECTION"], s["START_CALL"], s["CANCEL_CALL"]
+    ] + list(s["TARGET_GROUPS"].values())
+
+    unknown_groups = set(s["DEVICE_TARGET_GROUP"].values()) - set(s["TARGET_GROUPS"])
+    if unknown_groups:
+        raise ValueError(f"DEVICE_TARGET_GROUP refers to groups missing from TARGET_GROUPS: {unknown_groups}")
+
+    if s["GROUP_NAVIGATION_MODE"] not in ("list", "search"):
+        raise ValueError(f"GROUP_NAVIGATION_MODE must be 'list' or 'search': {s['GROUP_NAVIGATION_MODE']}")
+
+    if s["CLUSTER_MODE"] not in ("standby", "partitioned"):
+        raise ValueError(f"CLUSTER_MODE must be 'standby' or 'partitioned': {s['CLUSTER_MODE']}")
+
+    unknown_channels = set(s["DELIVERY_FALLBACKS"]) - {"webhook", "discord"}
+    if unknown_channels:
+        raise ValueError(f"DELIVERY_FALLBACKS must name 'webhook' or 'discord': {unknown_channels}")
+
+    unknown_actions = set(s["ACTION_PRIORITY"]) - {"call", "cancel", "debug"}
+    if unknown_actions:
+        raise ValueError(f"ACTION_PRIORITY must only rank 'call', 'cancel' and 'debug': {unknown_actions}")
 
     missing_files = [img for img in image_files if not Path(img).exists()]
     if missing_files:
         raise FileNotFoundError(f"Missing image files: {', '.join(missing_files)}")
 
-validate_config()
\ No newline at end of file
+
+############ Settings File ################################################
+
+def current_settings():
+    """
+    Returns:
+        dict: Every upper-case setting of this module
+    """
+    return {k: v for k, v in globals().items() if k.isupper()}
+
+
+# Values defined in this file, before the settings file is applied
+DEFAULTS = current_settings()
+
+
+def load_settings_file(path=None):
+    """
+    Read the overrides from the settings file.
+    Template paths may be given relative to IMAGE_DIR and log levels by name.
+
+    Args:
+        path (str): Settings file, SETTINGS_FILE if None
+
+    Returns:
+        dict: Normalized overrides, empty if the file does not exist
+
+    Raises:
+        ValueError: If the file is not valid JSON or names an unknown setting
+    """
+    path = Path(path or SETTINGS_FILE)
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError(f"{path} must contain a JSON object")
+
+    unknown = [k for k in overrides if k not in DEFAULTS]
+    if unknown:
+        raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+
+    image_dir = Path(overrides.get("IMAGE_DIR", DEFAULTS["IMAGE_DIR"]))
+    for key, value in overrides.items():
+        if key == "IMAGE_DIR":
+            overrides[key] = image_dir
+        elif key in TEMPLATE_KEYS:
+            overrides[key] = str(image_dir / value)
+        elif key == "TARGET_GROUPS":
+            overrides[key] = {group: str(image_dir / path) for group, path in value.items()}
+        elif key == "BOT_LOG_LEVEL" and isinstance(value, str):
+            overrides[key] = logging.getLevelName(value.upper())
+    return overrides
+
+
+def build_settings(overrides):
+    """
+    Returns:
+        dict: The defaults with the given overrides applied
+    """
+    settings = dict(DEFAULTS)
+    settings.update(overrides)
+    return settings
+
+
+globals().update(load_settings_file())
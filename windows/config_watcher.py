@@ -0,0 +1,122 @@
+"""
+Hot reload of the settings file and the template images.
+
+The watcher polls SETTINGS_FILE and the configured template images. When one
+of them changes, the new settings are validated as a whole and then applied
+to the config module in place, so caches, the LINE window and the MQTT
+connection stay warm. Components that keep their own copy of a setting
+register a listener to pick up the change.
+"""
+import os
+import traceback
+from threading import Thread, Event
+
+import config
+import templates
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("config")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ConfigWatcher(Thread):
+    """
+    Background thread applying changes of the settings file and the template
+    images to the running bridge.
+    """
+
+    def __init__(self, interval=None):
+        """
+        Initialize the watcher.
+
+        Args:
+            interval (float): Seconds between checks, CONFIG_WATCH_INTERVAL if None
+        """
+        super().__init__(name="config-watcher", daemon=True)
+        self.interval = interval or config.CONFIG_WATCH_INTERVAL
+        self.should_stop = Event()
+        self.listeners = []
+        self.mtimes = self._snapshot()
+
+    def add_listener(self, callback):
+        """
+        Register a callback for applied changes.
+
+        Args:
+            callback (callable): Called with (changed setting names, changed template paths)
+        """
+        self.listeners.append(callback)
+
+    def _snapshot(self):
+        """
+        Returns:
+            dict: Modification time of the settings file and every template image
+        """
+        paths = [config.SETTINGS_FILE] + templates.template_paths()
+        return {path: _mtime(path) for path in paths}
+
+    def check(self):
+        """
+        Apply changes made since the last check.
+
+        Returns:
+            bool: True if anything was applied
+        """
+        mtimes = self._snapshot()
+        changed_files = {path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime}
+        if not changed_files:
+            return False
+
+        try:
+            settings = config.build_settings(config.load_settings_file())
+            config.validate_config(settings)
+        except Exception as e:
+            # Keep running with the current settings, but retry after the next edit
+            self.mtimes = mtimes
+            log.error(f"Ignoring invalid configuration: {e}")
+            return False
+
+        with config.lock:
+            current = config.current_settings()
+            changed_keys = {k for k, v in settings.items() if current.get(k) != v}
+            for key in changed_keys:
+                setattr(config, key, settings[key])
+        changed_templates = set(templates.template_paths()) & changed_files
+        changed_templates |= {settings[key] for key in changed_keys & set(config.TEMPLATE_KEYS)}
+        if "TARGET_GROUPS" in changed_keys:
+            changed_templates |= set(settings["TARGET_GROUPS"].values())
+
+        self.mtimes = self._snapshot()
+        if not changed_keys and not changed_templates:
+            return False
+        if changed_keys:
+            log.info(f"Configuration reloaded: {', '.join(sorted(changed_keys))}")
+        if changed_templates:
+            log.info(f"Template images reloaded: {', '.join(sorted(os.path.basename(p) for p in changed_templates))}")
+
+        for callback in self.listeners:
+            try:
+                callback(changed_keys, changed_templates)
+            except Exception as e:
+                log.error(f"Error applying configuration change: {e}")
+                log.error(traceback.format_exc())
+        return True
+
+    def run(self):
+        """Check for changes until stopped."""
+        while not self.should_stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                log.error(f"Error checking configuration: {e}")
+
+    def stop(self):
+        """Signal the watcher to stop."""
+        self.should_stop.set()
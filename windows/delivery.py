@@ -0,0 +1,312 @@
+"""
+Delivery of alerts over one or more channels.
+
+LINE through the desktop UI is the primary channel, but it is also the slow
+and fragile one: a navigation failure or a slow UI used to mean the alert
+simply did not go out. `Delivery` sends every message to LINE first and,
+if LINE has not confirmed within DELIVERY_HEDGE_AFTER seconds or has
+already failed, sends the same alert on the fallback channels at the same
+time: an HTTP webhook (e.g. a pager or chat gateway) and the Discord bot.
+The outcome of a message is still LINE's: an alert that only got out on a
+fallback is logged as such but reported as failed, so the outbox, history
+and latency objective see the LINE failure.
+
+A channel is anything with a `name`, `available()` and
+`deliver(action, message, trace, group)` returning True once the
+receiving side has confirmed.
+"""
+import http.client
+import json
+import queue
+import socket
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("delivery")
+
+# Settings the fallback channels are created from
+CHANNEL_SETTINGS = {"DELIVERY_FALLBACKS", "WEBHOOK_URL", "WEBHOOK_HEADERS", "WEBHOOK_TIMEOUT", "WEBHOOK_POOL_SIZE"}
+
+
+class Channel:
+    """Interface of a delivery channel."""
+
+    name = "channel"
+
+    def available(self):
+        """Whether the channel is configured and can be used."""
+        return True
+
+    def warm(self):
+        """Prepare for the first delivery, e.g. open connections."""
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        """
+        Deliver an alert.
+
+        Args:
+            action (str): "call", "cancel" or "debug"
+            message (str): Message text
+            trace (Trace): Trace of the event
+            group (str): Target group from TARGET_GROUPS, None for the default
+            token (CancelToken): Cancellation of the job, only slow channels check it
+
+        Returns:
+            bool: True once the receiving side confirmed the alert
+        """
+        raise NotImplementedError
+
+
+class LineChannel(Channel):
+    """The LINE desktop UI, in this process or in the UI worker."""
+
+    name = "line"
+
+    def __init__(self, send):
+        """
+        Args:
+            send (callable): send_message of line_messenger or of a UIWorker
+        """
+        self.send = send
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        return bool(self.send(action, message, trace=trace, group=group, token=token))
+
+
+class WebhookChannel(Channel):
+    """
+    JSON POST to WEBHOOK_URL over a small pool of keep-alive connections,
+    so an alert does not pay for a TCP (and TLS) handshake.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url=None, timeout=None, pool_size=None, headers=None):
+        """
+        Args:
+            url (str): http:// or https:// endpoint, WEBHOOK_URL if None
+            timeout (float): Seconds per request, WEBHOOK_TIMEOUT if None
+            pool_size (int): Idle connections kept open, WEBHOOK_POOL_SIZE if None
+            headers (dict): Extra request headers, WEBHOOK_HEADERS if None
+        """
+        self.url = config.WEBHOOK_URL if url is None else url
+        self.timeout = timeout or config.WEBHOOK_TIMEOUT
+        self.headers = {"Content-Type": "application/json",
+                        **(config.WEBHOOK_HEADERS if headers is None else headers)}
+        self.idle = queue.LifoQueue(maxsize=pool_size or config.WEBHOOK_POOL_SIZE)
+        self.connections_opened = 0
+        parts = urllib.parse.urlsplit(self.url)
+        self.https = parts.scheme == "https"
+        self.host, self.port = parts.hostname, parts.port
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+    def available(self):
+        return bool(self.url)
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        connection = connection_class(self.host, self.port, timeout=self.timeout)
+        connection.connect()
+        # Alerts are small, send them without waiting for the ACK of the previous segment
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections_opened += 1
+        return connection
+
+    def _release(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def warm(self):
+        if self.available() and self.idle.empty():
+            self._release(self._connect())
+
+    def post(self, payload):
+        """
+        POST a JSON payload, reusing an idle connection if there is one.
+
+        Returns:
+            int: HTTP status
+        """
+        body = json.dumps(payload).encode()
+        while True:
+            try:
+                connection, reused = self.idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+            try:
+                connection.request("POST", self.path, body, self.headers)
+                response = connection.getresponse()
+                response.read()
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError) as e:
+                connection.close()
+                if reused:
+                    # The server closed the idle connection, try the next one
+                    log.debug(f"Webhook connection closed by the server ({e}), reconnecting")
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(connection)
+            return response.status
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        payload = {"action": action, "message": message, "group": group,
+                   "trace": trace.trace_id if trace else None, "time": time.time()}
+        try:
+            status = self.post(payload)
+        except Exception as e:
+            log.error(f"Webhook delivery failed: {e}")
+            return False
+        if not 200 <= status < 300:
+            log.error(f"Webhook delivery failed with HTTP {status}")
+            return False
+        return True
+
+
+class DiscordChannel(Channel):
+    """The Discord bot's log channel, sent directly instead of through the log buffer."""
+
+    name = "discord"
+
+    def available(self):
+        return config.ENABLE_DISOCRD_BOT_LOGGING
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        from logger import send_discord_alert
+        prefix = {"call": "🚨", "cancel": "✅"}.get(action, "ℹ️")
+        target = f" → {group}" if group else ""
+        return send_discord_alert(f"{prefix} **{action}**{target}\n{message}", config.DISCORD_ALERT_TIMEOUT)
+
+
+CHANNELS = {"webhook": WebhookChannel, "discord": DiscordChannel}
+
+
+def fallback_channels(names=None):
+    """
+    Create the configured fallback channels.
+
+    Args:
+        names (tuple): Channel names, DELIVERY_FALLBACKS if None
+
+    Returns:
+        list: Channels that are available
+    """
+    channels = [CHANNELS[name]() for name in (config.DELIVERY_FALLBACKS if names is None else names)]
+    return [channel for channel in channels if channel.available()]
+
+
+class Delivery:
+    """
+    Sends alerts on the primary channel and hedges them on the fallbacks
+    when the primary is slow or fails.
+    """
+
+    def __init__(self, primary, fallbacks=()):
+        """
+        Args:
+            primary (Channel): Channel every message goes to, normally LINE
+            fallbacks (list): Channels used when the primary is late or fails
+        """
+        self.primary = primary
+        self.fallbacks = []
+        self.executor = None
+        self._set_fallbacks(fallbacks)
+
+    def _set_fallbacks(self, fallbacks):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        self.fallbacks = list(fallbacks)
+        self.executor = ThreadPoolExecutor(max_workers=1 + len(self.fallbacks),
+                                           thread_name_prefix="delivery") if self.fallbacks else None
+
+    def warm(self):
+        """Open the fallback channels' connections ahead of the first alert."""
+        for channel in self.fallbacks:
+            channel.warm()
+        return True
+
+    def on_config_changed(self, changed_keys, changed_templates):
+        """
+        Configuration reload listener: recreate the fallback channels when
+        their settings changed. They are swapped under config.lock, which
+        the processor holds while it delivers, so a send in flight keeps
+        its channels and executor.
+
+        Args:
+            changed_keys (set): Names of the changed settings
+            changed_templates (set): Paths of the changed template images
+        """
+        if changed_keys & CHANNEL_SETTINGS:
+            with config.lock:
+                self._set_fallbacks(fallback_channels())
+            log.info(f"Fallback channels: {', '.join(c.name for c in self.fallbacks) or 'none'}")
+
+    def _run(self, channel, action, message, trace, group, token=None):
+        start = time.monotonic()
+        try:
+            ok = channel.deliver(action, message, trace=trace, group=group, token=token)
+        except Exception as e:
+            log.error(f"Delivery on {channel.name} failed: {e}")
+            ok = False
+        if trace is not None and channel is not self.primary:
+            trace.record(f"channel_{channel.name}", start, ok=ok)
+        return ok
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        """
+        Deliver a message, hedged on the fallback channels for
+        DELIVERY_HEDGE_ACTIONS. Returns only when the primary has finished,
+        since it drives the single LINE window.
+
+        Args:
+            token (CancelToken): Cancellation of the job, passed to the
+                primary. A job cancelled before it was hedged is not: it is
+                either superseded or sent again later.
+
+        Returns:
+            bool: True if the primary confirmed the message, whether or not
+                a fallback did as well
+        """
+        executor, fallbacks = self.executor, self.fallbacks
+        if not fallbacks or action not in config.DELIVERY_HEDGE_ACTIONS:
+            return self.primary.deliver(action, message, trace=trace, group=group, token=token)
+
+        primary = executor.submit(self._run, self.primary, action, message, trace, group, token)
+        done, _ = wait([primary], timeout=config.DELIVERY_HEDGE_AFTER)
+        if token is not None and token.cancelled and not token.committed:
+            return primary.result()  # stops at its next checkpoint
+        if done and primary.result():
+            return True
+
+        reason = "failed" if done else f"has not confirmed after {config.DELIVERY_HEDGE_AFTER}s"
+        names = ", ".join(channel.name for channel in fallbacks)
+        log.warning(f"{self.primary.name} {reason}, also sending on {names}")
+        if trace is not None:
+            trace.event("hedged", reason="failed" if done else "late", channels=names)
+        pending = {executor.submit(self._run, channel, action, message, trace, group): channel
+                   for channel in fallbacks}
+        confirmed = []
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                channel = pending.pop(future)
+                if future.result():
+                    confirmed.append(channel.name)
+
+        primary_ok = primary.result()
+        if not primary_ok and confirmed:
+            log.critical(f"{self.primary.name} delivery failed, alert delivered on fallback: {', '.join(confirmed)}")
+            if trace is not None:
+                trace.event("delivered_on_fallback", channels=", ".join(confirmed))
+        return primary_ok
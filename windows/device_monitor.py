@@ -0,0 +1,188 @@
+"""
+Liveness monitor for the Zigbee devices reporting on `zigbee2mqtt/<device>`.
+
+A button with a dead battery or one that dropped off the mesh just goes
+silent. The monitor learns how often every device normally reports and
+raises an alert when one misses its expected check-in. Deadlines are kept in
+a hashed timer wheel, so both recording a message and advancing the clock
+cost O(1) regardless of the number of devices.
+"""
+import math
+import time
+from threading import Thread, Event, Lock
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("dev_mon")
+
+# Zigbee2MQTT sub-topics that are not reports of the device itself
+IGNORED_SUFFIXES = ("availability", "set", "get")
+# Smoothing factor of the learned report interval
+INTERVAL_ALPHA = 0.2
+# Messages closer together than this belong to the same report
+MIN_GAP = 1.0
+
+
+def format_duration(seconds):
+    """Human readable duration, e.g. `1h 05m`."""
+    minutes = int(seconds // 60)
+    if minutes < 60:
+        return f"{minutes}m {int(seconds % 60):02d}s"
+    return f"{minutes // 60}h {minutes % 60:02d}m"
+
+
+class DeviceState:
+    """What the monitor knows about one device."""
+
+    __slots__ = ("name", "last_seen", "interval", "samples", "slot", "rounds", "silent")
+
+    def __init__(self, name):
+        self.name = name
+        self.last_seen = None
+        self.interval = None  # learned seconds between reports
+        self.samples = 0
+        self.slot = None      # wheel slot holding the deadline, None if not scheduled
+        self.rounds = 0       # full wheel turns left before the deadline
+        self.silent = False
+
+    def timeout(self):
+        """
+        Returns:
+            float: Seconds of silence after which the device is reported
+        """
+        if self.samples < config.DEVICE_MIN_SAMPLES:
+            return config.DEVICE_SILENCE_DEFAULT
+        return min(config.DEVICE_SILENCE_MAX,
+                   max(config.DEVICE_SILENCE_MIN, config.DEVICE_SILENCE_FACTOR * self.interval))
+
+
+class DeviceMonitor(Thread):
+    """
+    Tracks the last report of every device and alerts on silent ones.
+    """
+
+    def __init__(self, tick=None, slots=None, clock=time.monotonic):
+        """
+        Initialize the monitor.
+
+        Args:
+            tick (float): Seconds per wheel slot, DEVICE_MONITOR_TICK if None
+            slots (int): Number of wheel slots, DEVICE_MONITOR_SLOTS if None
+            clock (callable): Time source, monotonic seconds
+        """
+        super().__init__(name="device-monitor", daemon=True)
+        self.tick = tick or config.DEVICE_MONITOR_TICK
+        self.wheel = [dict() for _ in range(slots or config.DEVICE_MONITOR_SLOTS)]
+        self.clock = clock
+        self.current_tick = int(clock() / self.tick)
+        self.devices = {}
+        self.lock = Lock()
+        self.should_stop = Event()
+
+    @staticmethod
+    def device_from_topic(topic):
+        """
+        Args:
+            topic (str): MQTT topic
+
+        Returns:
+            str: Device name, or None if the topic is not a device report
+        """
+        parts = topic.split("/")[1:]
+        if not parts or parts[0] == "bridge" or parts[-1] in IGNORED_SUFFIXES:
+            return None
+        return "/".join(parts)
+
+    def observe(self, topic, now=None):
+        """
+        Record a message, if it is a device report.
+
+        Args:
+            topic (str): MQTT topic of the message
+            now (float): Receive time, the current time if None
+        """
+        device = self.device_from_topic(topic)
+        if device is not None:
+            self.seen(device, now)
+
+    def seen(self, device, now=None):
+        """
+        Record a report of a device and move its deadline.
+
+        Args:
+            device (str): Device name
+            now (float): Receive time, the current time if None
+        """
+        now = self.clock() if now is None else now
+        with self.lock:
+            state = self.devices.get(device)
+            if state is None:
+                state = self.devices[device] = DeviceState(device)
+            elif now - state.last_seen >= MIN_GAP:
+                gap = now - state.last_seen
+                state.interval = gap if state.interval is None else state.interval + INTERVAL_ALPHA * (gap - state.interval)
+                state.samples += 1
+            else:
+                return
+            was_silent, silent_for = state.silent, now - state.last_seen if state.last_seen else 0
+            state.last_seen = now
+            state.silent = False
+            self._schedule(state, now)
+        if was_silent:
+            log.warning(f"Device {device} is back after {format_duration(silent_for)} of silence")
+
+    def _schedule(self, state, now):
+        if state.slot is not None:
+            self.wheel[state.slot].pop(state.name, None)
+        deadline_tick = math.ceil((now + state.timeout()) / self.tick)
+        ticks_ahead = max(1, deadline_tick - self.current_tick)
+        state.slot = (self.current_tick + ticks_ahead) % len(self.wheel)
+        state.rounds = (ticks_ahead - 1) // len(self.wheel)
+        self.wheel[state.slot][state.name] = state
+
+    def advance(self, now=None):
+        """
+        Move the wheel up to the given time and report the devices whose
+        deadline passed.
+
+        Args:
+            now (float): Current time, the clock if None
+
+        Returns:
+            list: DeviceState of every device that just went silent
+        """
+        now = self.clock() if now is None else now
+        target = int(now / self.tick)
+        expired = []
+        with self.lock:
+            while self.current_tick < target:
+                self.current_tick += 1
+                bucket = self.wheel[self.current_tick % len(self.wheel)]
+                for name, state in list(bucket.items()):
+                    if state.rounds:
+                        state.rounds -= 1
+                        continue
+                    del bucket[name]
+                    state.slot = None
+                    state.silent = True
+                    expired.append(state)
+        for state in expired:
+            expected = (f"expected a report about every {format_duration(state.interval)}"
+                        if state.samples >= config.DEVICE_MIN_SAMPLES else "interval not learned yet")
+            log.critical(f"Device {state.name} silent for {format_duration(now - state.last_seen)} "
+                         f"({expected}). Check its battery and connection.")
+        return expired
+
+    def run(self):
+        """Advance the wheel every tick until stopped."""
+        while not self.should_stop.wait(self.tick):
+            try:
+                self.advance()
+            except Exception as e:
+                log.error(f"Error in device monitor: {e}")
+
+    def stop(self):
+        """Signal the monitor to stop."""
+        self.should_stop.set()
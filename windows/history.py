@@ -0,0 +1,226 @@
+"""
+Local history of processed button events.
+
+Every event the processor finishes is stored with its device, action,
+target group, outcome and latency in a SQLite database (WAL mode), indexed
+for the questions asked about it: presses per device over the last days,
+and recent failed sends. The processor only puts a tuple on a queue; a
+writer thread inserts whatever has accumulated in one transaction every
+HISTORY_FLUSH_INTERVAL seconds, so storing an event costs the send nothing.
+"""
+import queue
+import sqlite3
+import time
+import threading
+from pathlib import Path
+from threading import Thread, Event
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("history")
+
+COLUMNS = ("time", "device", "action", "group_name", "ok", "latency", "trace_id", "message")
+
+
+def day_start(days_ago=0):
+    """
+    Args:
+        days_ago (int): 0 for today
+
+    Returns:
+        float: Unix time of local midnight that many days ago
+    """
+    today = time.localtime()
+    return time.mktime((today.tm_year, today.tm_mon, today.tm_mday - days_ago, 0, 0, 0, 0, 0, -1))
+
+
+class EventHistory(Thread):
+    """
+    Store of processed events with a batching writer thread.
+    """
+
+    def __init__(self, path=None, flush_interval=None):
+        """
+        Open the database, creating the table and indexes if needed.
+
+        Args:
+            path (str): Path to the SQLite database file, HISTORY_PATH if None
+            flush_interval (float): Seconds between batched writes, HISTORY_FLUSH_INTERVAL if None
+        """
+        super().__init__(name="history", daemon=True)
+        self.path = str(path or config.HISTORY_PATH)
+        self.flush_interval = flush_interval or config.HISTORY_FLUSH_INTERVAL
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self.pending = queue.Queue(maxsize=config.HISTORY_QUEUE_SIZE)
+        self.should_stop = Event()
+        self.wakeup = Event()
+        self.flushed = Event()
+        self.dropped = 0
+        self.last_purge = 0.0
+
+        # Written only by the writer thread, queried from the Discord bot's thread
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " id INTEGER PRIMARY KEY,"
+            " time REAL NOT NULL,"
+            " device TEXT,"
+            " action TEXT NOT NULL,"
+            " group_name TEXT,"
+            " ok INTEGER NOT NULL,"
+            " latency REAL,"
+            " trace_id TEXT,"
+            " message TEXT)"
+        )
+        # Covers the per-device counts, so they never touch the table itself
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_time ON events (time, device, action, ok)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_device ON events (device, time)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_action ON events (action, time)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS events_failed ON events (time) WHERE ok = 0")
+        self.reader = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.reader_lock = threading.Lock()
+
+    def record(self, device, action, ok, group=None, latency=None, trace_id=None, message=None, at=None):
+        """
+        Queue an event for the next batched write. Never blocks.
+
+        Args:
+            device (str): Device name, the last segment of its topic
+            action (str): Action that was sent
+            ok (bool): Whether it was delivered
+            group (str): Target group, None for TARGET_GROUP_NAME
+            latency (float): Seconds from receiving the press to the end of the send
+            trace_id (str): Trace id of the press
+            message (str): Message text
+            at (float): Unix time of the event, now if None
+        """
+        row = (time.time() if at is None else at, device, action, group, int(bool(ok)), latency, trace_id, message)
+        try:
+            self.pending.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        while not self.should_stop.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if rows:
+                self.db.execute("BEGIN")
+                self.db.executemany(f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES "
+                                    f"({', '.join('?' * len(COLUMNS))})", rows)
+                self.db.execute("COMMIT")
+            if self.dropped:
+                log.warning(f"History queue full, {self.dropped} events were not stored")
+                self.dropped = 0
+            if time.time() - self.last_purge > 24 * 3600:
+                self.last_purge = time.time()
+                self.db.execute("DELETE FROM events WHERE time < ?", (time.time() - config.HISTORY_RETENTION,))
+        except sqlite3.Error as e:
+            log.error(f"Could not store {len(rows)} events: {e}")
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK")
+        self.flushed.set()
+
+    def flush(self, timeout=None):
+        """
+        Write the queued events now, e.g. before answering a query.
+
+        Args:
+            timeout (float): Maximum seconds to wait for the writer
+
+        Returns:
+            bool: True if the events were written in time
+        """
+        if not self.is_alive():
+            self._flush()
+            return True
+        self.flushed.clear()
+        self.wakeup.set()
+        return self.flushed.wait(timeout)
+
+    def close(self):
+        """Write the remaining events and close the database."""
+        self.should_stop.set()
+        self.wakeup.set()
+        if self.is_alive():
+            self.join()
+        else:
+            self._flush()
+        self.db.close()
+        with self.reader_lock:
+            self.reader.close()
+
+    # ---- queries -----------------------------------------------------------
+
+    def _query(self, sql, params):
+        with self.reader_lock:
+            return self.reader.execute(sql, params).fetchall()
+
+    def presses_per_device(self, since, until=None):
+        """
+        Args:
+            since (float): Unix time of the first event counted
+            until (float): Unix time the count stops at, now if None
+
+        Returns:
+            list: (device, {action: count}, failed) tuples, most presses first
+        """
+        rows = self._query(
+            "SELECT device, action, COUNT(*), SUM(ok = 0) FROM events "
+            "WHERE time >= ? AND time < ? GROUP BY device, action",
+            (since, time.time() if until is None else until))
+        devices = {}
+        for device, action, count, failed in rows:
+            actions, failures = devices.get(device, ({}, 0))
+            actions[action] = count
+            devices[device] = (actions, failures + failed)
+        return sorted(((device, actions, failed) for device, (actions, failed) in devices.items()),
+                      key=lambda item: sum(item[1].values()), reverse=True)
+
+    def failures(self, since, limit=20):
+        """
+        Args:
+            since (float): Unix time of the first event returned
+            limit (int): Maximum number of events
+
+        Returns:
+            list: (time, device, action, group, trace_id) tuples, newest first
+        """
+        return self._query(
+            "SELECT time, device, action, group_name, trace_id FROM events "
+            "WHERE ok = 0 AND time >= ? ORDER BY time DESC LIMIT ?", (since, limit))
+
+
+# Shared instance of the processor and the Discord commands, created on first use
+history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """
+    Return the shared EventHistory, opening it and starting its writer on first use.
+
+    Returns:
+        EventHistory: The shared instance
+    """
+    global history
+    with _history_lock:
+        if history is None:
+            history = EventHistory()
+            history.start()
+        return history
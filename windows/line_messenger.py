@@ -7,8 +7,13 @@ import time
 import os
 import threading
 
+import calibration
+from call_session import CallSession
+from cancellation import JobCancelled
 from logger import setup_logger
+from tracing import Trace
 import config
+import templates
 
 # Setup logger
 logger = setup_logger("line_msngr")
@@ -23,16 +28,33 @@ class LineMessenger:
     Uses image recognition to navigate the interface and send messages.
     """
 
-    def __init__(self):
+    def __init__(self, replay=None):
+        """
+        Args:
+            replay (recorder.ReplayScreen): Run against a recorded session
+                instead of the screen, actions are not executed
+        """
         # Cache for UI element locations
         self.ui_cache = {}
         self.cache_lifetime = config.IMAGE_CACHE_LIFETIME  # seconds
         self.cache_timestamps = {}
-        self.ensure_line_app_opened()
-        self.call_timer = None
+        self.cache_targets = {}  # cache key -> template it was found with
+        self.ui_hints = {}       # template -> last location it was found at
+        self.recorder = None     # SessionRecorder of the send in progress
+        self.replay = replay
+        self.call_session = None  # CallSession of the call in progress
+        self.call_lock = threading.Lock()  # the timer and a "cancel" press may hang up at once
+        self.job = threading.local()  # CancelToken of the send running on this thread, see _checkpoint
+        self.undo = {}  # step -> hotkeys that undo it if the send is interrupted there
+        try:
+            calibration.load()
+        except Exception as e:
+            logger.error(f"Could not load the calibration profile, using default confidences: {e}")
+        if replay is None:
+            self.ensure_line_app_opened()
 
     def locate_on_screen(self, target, confidence=None, click=False,
-                        move_before_click=True, cache_key=None):
+                        move_before_click=True, cache_key=None, hint_key=None, calibrated=True):
         """
         Locate an image on screen, optionally click it, and cache the result.
 
@@ -42,35 +64,55 @@ class LineMessenger:
             click (bool): Whether to click the found location
             move_before_click (bool): Whether to move mouse before clicking
             cache_key (str): Key to cache the result under
+            hint_key (str): Key of the last known location searched first,
+                the target itself if None. Use a separate key for an image
+                that shows up in more than one place.
+            calibrated (bool): Whether the calibrated confidence of the target,
+                if any, replaces the given one
 
         Returns:
             Box: Found location box or None if not found
         """
+        self._checkpoint()
         confidence = confidence or config.IMAGE_SEARCH_CONFIDENCE
+        if calibrated:
+            confidence = calibration.confidence(target, confidence)
 
         # Check cache if a cache key is provided
         if cache_key is not None:
             current_time = time.time()
-            if (cache_key in self.ui_cache and
+            if self.replay is not None:
+                found = self.replay.cached(cache_key)
+            elif (cache_key in self.ui_cache and
                 current_time - self.cache_timestamps.get(cache_key, 0) < self.cache_lifetime):
                 found = self.ui_cache[cache_key]
-                logger.debug(f"Using cached location for {target} ({cache_key})")
+            else:
+                found = None
+            if found is not None:
+                logger.debug("Using cached location for %s (%s)", target, cache_key)
+                if self.recorder is not None:
+                    self.recorder.event("cached", key=cache_key, box=list(found))
 
                 if click:
                     self._click_location(found, move_before_click)
                 return found
 
         try:
-            logger.debug(f"Looking for {target} with confidence {confidence}")
-            found = pyautogui.locateOnScreen(target, confidence=confidence)
+            logger.debug("Looking for %s with confidence %s", target, confidence)
+            hint_key = hint_key or target
+            found = self._locate_near_hint(target, confidence, hint_key)
+            if found is None:
+                found = self._locate(target, confidence)
 
             if found:
-                logger.debug(f"Found {target} at {found}")
+                logger.debug("Found %s at %s", target, found)
+                self.ui_hints[hint_key] = found
 
                 # Cache the result if a cache key is provided
                 if cache_key is not None:
                     self.ui_cache[cache_key] = found
                     self.cache_timestamps[cache_key] = time.time()
+                    self.cache_targets[cache_key] = target
 
                 if click:
                     self._click_location(found, move_before_click)
@@ -78,12 +120,156 @@ class LineMessenger:
                 return found
             return None
         except pyautogui.ImageNotFoundException:
-            logger.debug(f"Image not found: {target}")
+            logger.debug("Image not found: %s", target)
             return None
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error locating image {target}: {e}")
             return None
 
+    def _locate_near_hint(self, target, confidence, hint_key):
+        """
+        Search only around the location the target was last found at, or
+        before it was ever found, in its calibrated region. UI elements rarely
+        move, and a small region is much faster to scan.
+
+        Returns:
+            Box: Found location box or None if not found near the hint
+        """
+        hint = self.ui_hints.get(hint_key)
+        if hint is not None:
+            margin = config.UI_HINT_MARGIN
+            left, top = max(0, hint.left - margin), max(0, hint.top - margin)
+            region = (left, top, hint.left + hint.width + margin - left, hint.top + hint.height + margin - top)
+        elif hint_key == target:
+            region = calibration.region(target)
+            if region is None:
+                return None
+        else:
+            return None
+        try:
+            return self._locate(target, confidence, region)
+        except pyautogui.ImageNotFoundException:
+            return None
+        except Exception as e:
+            # e.g. region partly off screen after a resolution change
+            logger.debug("Hinted search for %s failed: %s", target, e)
+            self.ui_hints.pop(hint_key, None)
+            return None
+
+    def _locate(self, target, confidence, region=None):
+        """
+        Search the screen, or the replayed frame, for a template. While a
+        session is recorded the screenshot and the result are recorded too.
+
+        Args:
+            target (str): Path to the target image
+            confidence (float): Recognition confidence (0-1)
+            region (tuple): (left, top, width, height) to search, the whole screen if None
+
+        Returns:
+            Box: Found location box or None if not found
+        """
+        if self.recorder is None and self.replay is None:
+            return pyautogui.locateOnScreen(templates.get(target), confidence=confidence, region=region,
+                                            grayscale=templates.GRAYSCALE)
+
+        import recorder
+        frame_index = None
+        if self.replay is not None:
+            frame = self.replay.grab(target)
+            if frame is None:
+                return None
+        else:
+            frame, frame_index = self.recorder.capture(pyautogui.screenshot())
+        try:
+            found = pyautogui.locate(templates.get(target), recorder.crop(frame, region), confidence=confidence,
+                                     grayscale=templates.GRAYSCALE)
+        except pyautogui.ImageNotFoundException:
+            found = None
+        if found is not None and region is not None:
+            found = recorder.Box(found.left + region[0], found.top + region[1], found.width, found.height)
+        if self.recorder is not None:
+            self.recorder.event("locate", target=os.path.basename(target), frame=frame_index,
+                                region=region and list(region), confidence=confidence,
+                                found=found and list(found))
+        return found
+
+    def _act(self, kind, **fields):
+        """
+        Record a mouse or keyboard action of the current session.
+
+        Returns:
+            bool: Whether to execute the action, False while replaying
+        """
+        if self.recorder is not None:
+            self.recorder.event(kind, **fields)
+        return self.replay is None
+
+    def _checkpoint(self):
+        """
+        Stop here if the send running on this thread was cancelled. Other
+        threads, e.g. the call timer, are never interrupted.
+
+        Raises:
+            JobCancelled: If the send's CancelToken was cancelled
+        """
+        token = getattr(self.job, "token", None)
+        if token is not None:
+            token.check()
+
+    def _sleep(self, seconds):
+        """Wait for the UI as a checkpoint, skipped while replaying."""
+        token = getattr(self.job, "token", None)
+        if token is not None:
+            token.check()
+        if self.replay is None:
+            if token is None:
+                time.sleep(seconds)
+            else:
+                token.sleep(seconds)
+
+    def _settle(self, seconds):
+        """
+        Let the UI react to a click, skipped while replaying. Never raises:
+        the click has landed, and stopping here would hide what it did from
+        the undo steps. An interrupted send stops at its next checkpoint.
+        """
+        if self.replay is not None:
+            return
+        token = getattr(self.job, "token", None)
+        if token is None:
+            time.sleep(seconds)
+        else:
+            token.wait(seconds)
+
+    def _commit(self):
+        """
+        Mark the send as past its point of no return, before posting the
+        message or starting the call: it then runs to completion even if a
+        more urgent send arrives, so it is never undone halfway or sent twice.
+        """
+        token = getattr(self.job, "token", None)
+        if token is not None:
+            token.commit()
+
+    def _recover(self):
+        """
+        Bring the UI back to a known state after an interrupted send: close
+        the search and clear a pasted but unsent message.
+        """
+        for step, combos in reversed(list(self.undo.items())):
+            logger.debug("Undoing %s", step)
+            for keys in combos:
+                if self._act("hotkey", keys=list(keys)):
+                    pyautogui.hotkey(*keys)
+        self.undo.clear()
+        # Locations may have changed with the interrupted clicks
+        self.ui_cache.clear()
+        self.cache_timestamps.clear()
+        self.cache_targets.clear()
+
     def _click_location(self, location, move_before_click=True):
         """
         Click at the specified location.
@@ -92,16 +278,21 @@ class LineMessenger:
             location: PyAutoGUI box location
             move_before_click: Whether to move mouse before clicking
         """
+        self._checkpoint()
         try:
             if move_before_click:
                 x = location.left + int(location.width // 2)
                 y = location.top + int(location.height // 2)
-                logger.debug(f"Moving to {x}, {y}")
-                pyautogui.moveTo(x, y, duration=config.MOUSE_MOVE_DURATION)
-
-            pyautogui.click(location)
-            logger.debug(f"Clicked at {location}")
-            time.sleep(config.SLEEP_AFTER_CLICK)
+                logger.debug("Moving to %s, %s", x, y)
+                if self._act("move", x=x, y=y):
+                    pyautogui.moveTo(x, y, duration=config.MOUSE_MOVE_DURATION)
+
+            if self._act("click", box=list(location)):
+                pyautogui.click(location)
+            logger.debug("Clicked at %s", location)
+            self._settle(config.SLEEP_AFTER_CLICK)
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error clicking location {location}: {e}")
 
@@ -123,7 +314,8 @@ class LineMessenger:
         Returns:
             Box: Found location box or None if not found
         """
-        confidence = confidence or config.IMAGE_SEARCH_CONFIDENCE
+        confidence = calibration.confidence(target, confidence or config.IMAGE_SEARCH_CONFIDENCE)
+        lowest = calibration.floor(target, 0.6)
         retry_n = retry_n or config.IMAGE_RETRY_COUNT
         retry_interval = retry_interval or config.IMAGE_RETRY_INTERVAL
         timeout = timeout or config.IMAGE_SEARCH_TIMEOUT
@@ -141,14 +333,15 @@ class LineMessenger:
                 logger.warning(f"Timeout waiting for {target} after {timeout} seconds")
                 return None
 
-            logger.debug(f"Waiting for {target}, attempt {i+1}/{retry_n}")
-            time.sleep(retry_interval)
+            logger.debug("Waiting for %s, attempt %d/%d", target, i + 1, retry_n)
+            self._sleep(retry_interval)
 
-            # Gradually decrease confidence for more flexibility
-            adjusted_confidence = max(0.6, confidence * (0.99 ** i))
+            # Gradually decrease confidence for more flexibility, but not below
+            # the best score of a wrong element when the template is calibrated
+            adjusted_confidence = max(lowest, confidence * (0.99 ** i))
 
             found = self.locate_on_screen(target, adjusted_confidence, click,
-                                         move_before_click, cache_key)
+                                         move_before_click, cache_key, calibrated=False)
             if found:
                 return found
 
@@ -163,15 +356,23 @@ class LineMessenger:
             text (str): Text to input
             enter (bool): Whether to press Enter after inputting
         """
+        self._checkpoint()
         try:
-            pyperclip.copy(text)
-            pyautogui.hotkey('ctrl', 'v')
+            if self._act("paste", text=text):
+                pyperclip.copy(text)
+                pyautogui.hotkey('ctrl', 'v')
             logger.debug(f"Input text (length: {len(text)})")
 
             if enter:
-                time.sleep(0.1)  # Small delay before pressing Enter
-                pyautogui.press('enter')
+                self.undo["input"] = [("ctrl", "a"), ("delete",)]
+                self._sleep(0.1)  # Small delay before pressing Enter
+                self._commit()  # the message is posted from here on
+                if self._act("press", key="enter"):
+                    pyautogui.press('enter')
+                self.undo.pop("input", None)
                 logger.debug("Pressed Enter")
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error inputting text: {e}")
 
@@ -242,7 +443,7 @@ class LineMessenger:
                     logger.info(f"\tLINE app opened successfully after attempt {attempt+1}.")
                     return True
                 logger.info(f"\tSleep for 0.1 seconds to wait for line to open")
-                time.sleep(0.1)
+                self._sleep(0.1)
 
             if self.found_line_logged_in_and_started():
                 logger.info(f"\tLINE app opened successfully after attempt {attempt+1}.")
@@ -251,14 +452,21 @@ class LineMessenger:
         logger.critical("Failed to open LINE app after multiple attempts.")
         raise LineUIException("Could not open LINE application after multiple attempts")
 
-    def navigate_to_target_group(self):
+    def navigate_to_target_group(self, group=None):
         """
         Navigate to the target chat group in LINE.
 
+        Args:
+            group (str): Group from TARGET_GROUPS, None for TARGET_GROUP_NAME
+
         Returns:
             bool: True if successfully navigated, False otherwise
         """
-        logger.info("\tNavigating to target chat group")
+        logger.info("\tNavigating to target chat group" + (f" {group}" if group else ""))
+        if group is None:
+            group_name, group_key = config.TARGET_GROUP_NAME, "target_group_name"
+        else:
+            group_name, group_key = config.TARGET_GROUPS[group], f"target_group_name:{group}"
 
         try:
             group_tab = self.locate_on_screen(config.GROUP_TAB, cache_key="group_tab", confidence=0.9993)
@@ -280,9 +488,11 @@ class LineMessenger:
                 x = icon1.left + int(icon1.width // 2)
                 y = int((icon1.top + icon3.top + icon3.height)//2)
                 logger.debug(f"\t\tClicking chat area at {x}, {y}")
-                pyautogui.moveTo(x, y, duration=config.MOUSE_MOVE_DURATION)
-                pyautogui.click(x, y)
-                time.sleep(config.SLEEP_AFTER_CLICK)
+                if self._act("move", x=x, y=y):
+                    pyautogui.moveTo(x, y, duration=config.MOUSE_MOVE_DURATION)
+                if self._act("click", x=x, y=y):
+                    pyautogui.click(x, y)
+                self._settle(config.SLEEP_AFTER_CLICK)
             else:
                 logger.debug(f"\t\tAlready found group tabs, skip. "\
                     f"group_tab: {bool(group_tab)}, group_tab_activated: {bool(group_tab_activated)}")
@@ -296,41 +506,141 @@ class LineMessenger:
             else:
                 logger.debug("\t\tgroup tab already activated, skip clicking on group tab")
 
-            logger.debug("\t\twait for group name")
+            opened = False
+            if config.GROUP_NAVIGATION_MODE == "search":
+                opened = self._search_group(group, group_name)
+                if not opened:
+                    logger.warning("\t\tGroup search failed, falling back to the group list")
 
-            if not self.wait_for_image(config.TARGET_GROUP_NAME, click=True):
-                logger.error("\t\tCould not find target group")
-                return False
+            if not opened:
+                logger.debug("\t\twait for group name")
+                if not self.wait_for_image(group_name, click=True, cache_key=group_key):
+                    logger.error("\t\tCould not find target group")
+                    return False
 
             logger.debug("\t\twait for input box")
 
-            if not self.wait_for_image(config.INPUT_BOX, click=True):
+            if not self.wait_for_image(config.INPUT_BOX, click=True, cache_key="input_box"):
                 logger.error("\t\tCould not find message input box")
                 return False
 
             logger.info("\t\tSuccessfully navigated to target group")
             return True
 
+        except JobCancelled:
+            raise
         except Exception as e:
             logger.error(f"\t\tError navigating to target group: {e}", exc_info=True)
             return False
 
+    def _search_group(self, group, group_name):
+        """
+        Open a group through LINE's chat search: paste its name into the
+        search box and click the result after confirming it by image. The
+        result shows up in the same place for every group, so after the first
+        search the confirmation only scans the region around it.
+
+        Args:
+            group (str): Group from TARGET_GROUPS, None for TARGET_GROUP_NAME
+            group_name (str): Template of the group's entry
+
+        Returns:
+            bool: True if the group was opened
+        """
+        if group is None:
+            text = config.TARGET_GROUP_SEARCH_TEXT
+        else:
+            text = config.TARGET_GROUP_SEARCH_TEXTS.get(group, group)
+        if not text:
+            logger.debug("\t\tNo search text configured for this group")
+            return False
+
+        logger.debug("\t\tSearching for group %s", text)
+        if self._act("hotkey", keys=list(config.GROUP_SEARCH_HOTKEY)):
+            pyautogui.hotkey(*config.GROUP_SEARCH_HOTKEY)
+        self.undo["search"] = [("esc",)]
+        if self._act("hotkey", keys=["ctrl", "a"]):
+            pyautogui.hotkey('ctrl', 'a')
+        self.input_text(text, enter=False)
+
+        deadline = time.time() + config.GROUP_SEARCH_TIMEOUT
+        while True:
+            self._sleep(config.GROUP_SEARCH_POLL_INTERVAL)  # Let the results render
+            if self.locate_on_screen(group_name, click=True, hint_key=f"search:{group_name}"):
+                self.undo.pop("search", None)
+                return True
+            if time.time() > deadline:
+                break
+        if self._act("press", key="esc"):
+            pyautogui.press('esc')  # Clear the search before using the list
+        self.undo.pop("search", None)
+        return False
+
+    def _call_window(self):
+        """
+        Location of the current call's cancel button if the call window is
+        still showing it, checked by fingerprint instead of a screen search.
+
+        Returns:
+            Box: The cancel button, or None if unknown or gone
+        """
+        if self.replay is not None:
+            found = self.replay.cached("call_session")
+        elif self.call_session is not None:
+            found = self.call_session.cancel_button()
+        else:
+            found = None
+        if found is not None and self.recorder is not None:
+            self.recorder.event("cached", key="call_session", box=list(found))
+        return found
+
+    def _end_call(self, session):
+        if session is not None:
+            session.end()
+            if session.box is not None:
+                self.ui_hints[config.CANCEL_CALL] = session.box  # the next call window opens there too
+        if self.call_session is session:
+            self.call_session = None
+
+    def _hang_up_after_timeout(self, session):
+        """Auto-hangup timer of a CallSession."""
+        if self.call_session is session:
+            logger.info(f"Call reached {config.STOP_CALL_AFTER_SECONDS} seconds")
+            self.cancel_call()
+
     def cancel_call(self):
+        """
+        Hang up the current call: a single click on the tracked cancel button
+        if it is still there, otherwise search the screen for it.
+
+        Returns:
+            bool: True if the cancel button was clicked
+        """
         logger.info("Cancel Call")
-        if self.locate_on_screen(config.CANCEL_CALL, click=True):
-            self.call_timer.cancel()
-            self.call_timer = None
-            return True
-        # Try to find and click LINE icon on desktop/taskbar
-        if self.locate_on_screen(config.LINE_ICON, confidence=0.9, click=True):
-            if self.locate_on_screen(config.MINI_CANCEL_PREVIEW, confidence=0.8, click=True):
-                if self.locate_on_screen(config.CANCEL_CALL, click=True):
-                    self.call_timer.cancel()
-                    self.call_timer = None
-                    return True
-        return False
+        with self.call_lock:
+            session = self.call_session
+            found = self._call_window()
+            if found is not None:
+                self._click_location(found)
+                self._end_call(session)
+                return True
+            if session is not None and session.box is not None:
+                # The window moved or is covered, search around where it was first
+                self.ui_hints[config.CANCEL_CALL] = session.box
+            if self.locate_on_screen(config.CANCEL_CALL, click=True):
+                self._end_call(session)
+                return True
+            # Try to find and click LINE icon on desktop/taskbar
+            if self.locate_on_screen(config.LINE_ICON, confidence=0.9, click=True):
+                if self.locate_on_screen(config.MINI_CANCEL_PREVIEW, confidence=0.8, click=True):
+                    if self.locate_on_screen(config.CANCEL_CALL, click=True):
+                        self._end_call(session)
+                        return True
+            if session is not None and session.box is not None:
+                self._end_call(session)  # the call window is gone, the call has ended
+            return False
 
-    def send_message(self, action, message=""):
+    def send_message(self, action, message="", trace=None, group=None, token=None):
         """
         Send a message to the target chat group in LINE.
 
@@ -340,10 +650,44 @@ class LineMessenger:
                 - "cancel": cancel the call and send the message.
                 - "debug": send a debug message
             message (str): Message text to send
+            trace (Trace): Trace of the event, a new one is started if None
+            group (str): Group from TARGET_GROUPS, None for TARGET_GROUP_NAME
+            token (CancelToken): Checked between every step, the send stops
+                and undoes its half-done steps when it is cancelled before
+                it posted the message
 
         Returns:
             bool: True if message sent successfully, False otherwise
         """
+        trace = trace or Trace()
+        self.job.token = token
+        try:
+            return self._record_send(action, message, trace, group)
+        finally:
+            self.job.token = None
+
+    def _record_send(self, action, message, trace, group):
+        """Perform send_message(), in a recorded session if RECORDER_ENABLED."""
+        if not config.RECORDER_ENABLED or self.replay is not None:
+            return self._send_message(action, message, trace, group)
+
+        import recorder
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{trace.trace_id}-{action}.lnrec"
+        self.recorder = recorder.SessionRecorder(os.path.join(config.RECORDER_DIR, name),
+                                                 keyframe_interval=config.RECORDER_KEYFRAME_INTERVAL)
+        result = False
+        try:
+            self.recorder.event("session", action=action, message=message, group=group)
+            result = self._send_message(action, message, trace, group)
+            return result
+        finally:
+            self.recorder.event("result", ok=result)
+            self.recorder.close()
+            self.recorder = None
+            recorder.prune(config.RECORDER_DIR, config.RECORDER_KEEP)
+
+    def _send_message(self, action, message, trace, group):
+        """Perform send_message(), recorded or replayed if enabled."""
         if message is None:
             logger.debug(f"send_message Get empty message.")
         else:
@@ -353,64 +697,216 @@ class LineMessenger:
         try:
             if action == "cancel":
                 # Cancel call
-                if self.cancel_call():
+                with trace.span("cancel_call") as span:
+                    span["ok"] = self.cancel_call()
+                if span["ok"]:
                     logger.info("Cancel Call")
                 else:
                     logger.warning("Failed to cancel call")
 
             # Ensure LINE is open
-            self.ensure_line_app_opened()
+            with trace.span("ensure_line"):
+                self.ensure_line_app_opened()
 
             # Navigate to target group
-            if not self.navigate_to_target_group():
+            with trace.span("navigate") as span:
+                span["ok"] = self.navigate_to_target_group(group)
+            if not span["ok"]:
                 logger.error("Failed to navigate to target group")
                 return False
 
-            self.input_text(message, True)
+            with trace.span("input_text"):
+                self.input_text(message, True)
 
             if action == "call":
                 logger.info("Call")
-                if self.locate_on_screen(config.CANCEL_CALL, click=False):
+                if self._call_window() or self.locate_on_screen(config.CANCEL_CALL, click=False):
                     logger.info("Already in call, skip.")
                     return True
-                if not self.wait_for_image(config.CALL_ICON, click=True):
-                    logger.error("Could not find call icon.")
-                    return False
-                if not self.wait_for_image(config.CALL_SELECTION, click=True):
-                    logger.error("Could not find call selection.")
-                    return False
-                if not self.wait_for_image(config.START_CALL, click=True):
-                    logger.error("Could not find start call.")
-                    return False
-                # register a timer to stop the call
-                self.call_timer = threading.Timer(
-                    config.STOP_CALL_AFTER_SECONDS,
-                    self.cancel_call)
-                self.call_timer.start()
-                return True
+                with trace.span("call_click") as span:
+                    span["ok"] = self._start_call()
+                return span["ok"]
             return True
 
+        except JobCancelled as e:
+            logger.warning(f"Send interrupted by {e}, undoing its steps")
+            trace.event("interrupted", reason=str(e))
+            self._recover()
         except Exception as e:
             logger.error(f"Failed to send message: {e}")
+            self.undo.clear()
             # Clear cache to force fresh UI detection
             self.ui_cache.clear()
             self.cache_timestamps.clear()
+            self.cache_targets.clear()
             logger.debug(f"Sleep for 2 second before retry")
-            time.sleep(2)  # Wait before retry
+            token = getattr(self.job, "token", None)
+            if self.replay is not None:
+                pass
+            elif token is None:
+                time.sleep(2)  # Wait before retry
+            else:
+                token.wait(2)  # Wait before retry, unless a more urgent send is waiting
 
         return False
 
+    def _start_call(self):
+        """
+        Click through the call icon, call selection and start call buttons,
+        then track the call in a CallSession, which hangs up after
+        STOP_CALL_AFTER_SECONDS.
 
-# Singleton instance for use throughout the application
-messenger = LineMessenger()
+        Returns:
+            bool: True if the call was started
+        """
+        if not self.wait_for_image(config.CALL_ICON, click=True, cache_key="call_icon"):
+            logger.error("Could not find call icon.")
+            return False
+        if not self.wait_for_image(config.CALL_SELECTION, click=True):
+            logger.error("Could not find call selection.")
+            return False
+        start_call = self.wait_for_image(config.START_CALL)
+        if not start_call:
+            logger.error("Could not find start call.")
+            return False
+        self._commit()  # the call rings from here on and needs its CallSession
+        self._click_location(start_call)
+        if self.replay is not None:
+            return True
+        with self.call_lock:
+            self._end_call(self.call_session)
+            self.call_session = CallSession(self._hang_up_after_timeout, hint=self.ui_hints.get(config.CANCEL_CALL))
+            self.call_session.start()
+        return True
+
+    def self_check(self, should_yield=None):
+        """
+        Look at LINE's current state without clicking anything, refreshing the
+        cached locations of the elements a send needs on the way.
 
-def send_message(action, msg=""):
+        Args:
+            should_yield (callable): Checked between searches, the check stops
+                as soon as it returns True
+
+        Returns:
+            list: Problems found, or None if the check was interrupted
+        """
+        def interrupted():
+            return should_yield is not None and should_yield()
+
+        problems = []
+        if interrupted():
+            return None
+        if self.locate_on_screen(config.LINE_LOGIN, confidence=0.5):
+            return ["LINE is not logged in"]
+
+        if interrupted():
+            return None
+        if not (self.locate_on_screen(config.LINE_LEFT_BAR_ICON_1, cache_key="left_bar_icon_1")
+                or self.locate_on_screen(config.LINE_LEFT_BAR_ICON_3, cache_key="left_bar_icon_3")):
+            return ["LINE window is not visible (minimized or covered)"]
+
+        if interrupted():
+            return None
+        if not (self.locate_on_screen(config.GROUP_TAB, cache_key="group_tab", confidence=0.9993)
+                or self.locate_on_screen(config.GROUP_TAB_ACTIVATED, cache_key="group_tab_activated", confidence=0.9993)):
+            problems.append("group tab not found")
+
+        # Whether these are visible depends on the open chat, so they are only reported
+        for target, cache_key in ((config.TARGET_GROUP_NAME, "target_group_name"),
+                                  (config.INPUT_BOX, "input_box"),
+                                  (config.CALL_ICON, "call_icon")):
+            if interrupted():
+                return None
+            if not self.locate_on_screen(target, cache_key=cache_key):
+                logger.debug("Self-check: %s not visible", os.path.basename(target))
+        return problems
+
+    def on_config_changed(self, changed_keys, changed_templates):
+        """
+        Apply a configuration reload without restarting LINE detection.
+        Only cached locations found with a changed template are dropped.
+
+        Args:
+            changed_keys (set): Names of the changed settings
+            changed_templates (set): Paths of the changed template images
+        """
+        if "IMAGE_CACHE_LIFETIME" in changed_keys:
+            self.cache_lifetime = config.IMAGE_CACHE_LIFETIME
+        if "CALIBRATION_PATH" in changed_keys:
+            try:
+                calibration.load()
+            except Exception as e:
+                logger.error(f"Could not load the calibration profile: {e}")
+        for target in changed_templates:
+            calibration.forget(target)
+        configured = set(templates.template_paths())
+        for key, target in list(self.cache_targets.items()):
+            if target in changed_templates or target not in configured:
+                self.ui_hints.pop(target, None)
+                self.ui_hints.pop(f"search:{target}", None)
+                self.ui_cache.pop(key, None)
+                self.cache_timestamps.pop(key, None)
+                self.cache_targets.pop(key, None)
+                logger.debug("Dropped cached location %s after template change", key)
+
+
+# Singleton instance for use throughout the application, created on first use
+# because creating it searches the screen for LINE
+messenger = None
+_messenger_lock = threading.Lock()
+
+def get_messenger():
+    """
+    Return the shared LineMessenger, creating it on first use.
+
+    Returns:
+        LineMessenger: The singleton instance
+    """
+    global messenger
+    with _messenger_lock:
+        if messenger is None:
+            messenger = LineMessenger()
+        return messenger
+
+def on_config_changed(changed_keys, changed_templates):
+    """
+    Configuration reload listener: refresh the decoded templates and, if it
+    exists, the messenger's cached UI locations.
+
+    Args:
+        changed_keys (set): Names of the changed settings
+        changed_templates (set): Paths of the changed template images
+    """
+    for path in changed_templates:
+        templates.invalidate(path)
+    if messenger is not None:
+        messenger.on_config_changed(changed_keys, changed_templates)
+
+def self_check(should_yield=None):
+    """
+    Check LINE's state without clicking, if the messenger has been created.
+
+    Args:
+        should_yield (callable): Checked between searches, stops the check when True
+
+    Returns:
+        list: Problems found, or None if there is no messenger yet or the check was interrupted
+    """
+    if messenger is None:
+        return None
+    return messenger.self_check(should_yield)
+
+def send_message(action, msg="", trace=None, group=None, token=None):
     """
     Public function to send a message using the LineMessenger.
 
     Args:
         action (str): "call", "cancel", "debug"
         msg (str): Message to send
+        trace (Trace): Trace of the event, optional
+        group (str): Group from TARGET_GROUPS, None for TARGET_GROUP_NAME
+        token (CancelToken): Cancellation token of the send, optional
 
     Returns:
         bool: True if successful, False otherwise
@@ -418,12 +914,12 @@ def send_message(action, msg=""):
     if action not in ["call", "cancel", "debug"]:
         logger.error(f"Invalid action: {action}")
         return False
-    return messenger.send_message(action=action, message=msg)
+    return get_messenger().send_message(action=action, message=msg, trace=trace, group=group, token=token)
 
 
 if __name__ == '__main__':
     # Test the messenger
-    # Test the messenger
+    config.validate_config()
     print("Create call request")
     send_message("call", "Test message\nfrom LineMessenger\n\nTimestamp: " + str(time.time()))
     time.sleep(config.STOP_CALL_AFTER_SECONDS)
@@ -1 +1,2 @@
-from .setup_logger import setup_logger
\ No newline at end of file
+from .setup_logger import setup_logger, enable_discord_bot, set_discord_log_level, send_discord_alert, \
+    forward_records
@@ -2,9 +2,14 @@
 Discord slash commands for managing log messages.
 """
 
+import asyncio
+import os
+
 import discord
 from discord.ext import commands
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+
+from purge import purge_messages
 
 
 def register_commands(bot, channel_id):
@@ -15,6 +20,17 @@ def register_commands(bot, channel_id):
         bot: The Discord bot instance
         channel_id: The ID of the channel where logs are sent
     """
+
+    def author_filter(all_users):
+        # If all_users is False, only delete messages from this bot
+        if all_users:
+            return None
+        return lambda message: message.author.id == bot.user.id
+
+    def progress_reporter(interaction):
+        async def progress(stats):
+            await interaction.edit_original_response(content=f"{stats}...")
+        return progress
     
     @bot.tree.command(name="delete_logs", description="Delete the last N messages in the channel")
     async def delete_logs(interaction: discord.Interaction, count: int = 5, all_users: bool = True):
@@ -30,46 +46,24 @@ def register_commands(bot, channel_id):
             await interaction.followup.send("Channel not found.", ephemeral=True)
             return
             
-        deleted = 0
         try:
-            # Get messages to delete
-            messages = []
-            async for message in channel.history(limit=count):
-                # If all_users is False, only delete messages from this bot
-                if all_users or message.author.id == bot.user.id:
-                    messages.append(message)
-            
-            # Delete the messages
-            if messages:
-                if len(messages) == 1:
-                    await messages[0].delete()
-                    deleted = 1
-                else:
-                    # Bulk delete only works for messages less than 14 days old
-                    try:
-                        await channel.delete_messages(messages)
-                        deleted = len(messages)
-                    except discord.errors.HTTPException:
-                        # Fall back to individual deletion if bulk deletion fails
-                        for msg in messages:
-                            try:
-                                await msg.delete()
-                                deleted += 1
-                            except Exception:
-                                pass
+            stats = await purge_messages(
+                channel, channel.history(limit=count),
+                should_delete=author_filter(all_users))
         except Exception as e:
             print(f"Error deleting messages: {e}")
             await interaction.followup.send(f"Error occurred: {str(e)}", ephemeral=True)
             return
         
-        await interaction.followup.send(f"Deleted {deleted} messages.", ephemeral=True)
+        await interaction.followup.send(f"Deleted {stats.deleted} messages.", ephemeral=True)
     
     @bot.tree.command(name="delete_time_range", description="Delete messages within a specified time range")
     async def delete_time_range(
         interaction: discord.Interaction, 
         hours_ago: int = 0, 
         minutes_ago: int = 0,
-        all_users: bool = True
+        all_users: bool = True,
+        limit: int = 1000
     ):
         """Delete messages within a certain time range"""
         if hours_ago < 0 or minutes_ago < 0:
@@ -79,9 +73,13 @@ def register_commands(bot, channel_id):
         if hours_ago == 0 and minutes_ago == 0:
             await interaction.response.send_message("Please specify a non-zero time range.", ephemeral=True)
             return
+
+        if limit <= 0 or limit > 10000:
+            await interaction.response.send_message("Please specify a limit between 1 and 10000.", ephemeral=True)
+            return
             
         # Calculate the cutoff time
-        cutoff_time = datetime.utcnow() - timedelta(hours=hours_ago, minutes=minutes_ago)
+        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=hours_ago, minutes=minutes_ago)
         
         await interaction.response.defer(ephemeral=True)
         
@@ -90,50 +88,96 @@ def register_commands(bot, channel_id):
             await interaction.followup.send("Channel not found.", ephemeral=True)
             return
             
-        deleted = 0
-        bulk_eligible = []
-        
         try:
-            # Get messages within the time range, up to Discord's limit
-            async for message in channel.history(limit=1000, after=cutoff_time):
-                # If all_users is False, only delete messages from this bot
-                if all_users or message.author.id == bot.user.id:
-                    # Messages older than 14 days can't be bulk deleted
-                    # Ensure we're comparing timezone-aware with timezone-aware
-                    # Discord message timestamps are timezone-aware
-                    two_weeks_ago = datetime.utcnow().replace(tzinfo=message.created_at.tzinfo) - timedelta(days=14)
-                    
-                    if message.created_at > two_weeks_ago:
-                        bulk_eligible.append(message)
-                        
-                        # Bulk delete in chunks of 100 (Discord API limit)
-                        if len(bulk_eligible) >= 100:
-                            try:
-                                await channel.delete_messages(bulk_eligible)
-                                deleted += len(bulk_eligible)
-                                bulk_eligible = []
-                            except Exception as e:
-                                print(f"Error bulk deleting: {e}")
-                    else:
-                        # Delete individually if older than 14 days
-                        try:
-                            await message.delete()
-                            deleted += 1
-                        except Exception:
-                            pass
-            
-            # Delete any remaining messages
-            if bulk_eligible:
-                if len(bulk_eligible) == 1:
-                    await bulk_eligible[0].delete()
-                    deleted += 1
-                else:
-                    await channel.delete_messages(bulk_eligible)
-                    deleted += len(bulk_eligible)
-                    
+            # History is paged 100 messages per request while deletes are already running
+            stats = await purge_messages(
+                channel, channel.history(limit=limit, after=cutoff_time),
+                should_delete=author_filter(all_users),
+                progress=progress_reporter(interaction))
         except Exception as e:
             print(f"Error deleting messages: {e}")
             await interaction.followup.send(f"Error occurred: {str(e)}", ephemeral=True)
             return
         
-        await interaction.followup.send(f"Deleted {deleted} messages from the last {hours_ago}h {minutes_ago}m.", ephemeral=True)
\ No newline at end of file
+        await interaction.followup.send(f"{stats} from the last {hours_ago}h {minutes_ago}m.", ephemeral=True)
+
+    @bot.tree.command(name="profile", description="Profile the bridge for N seconds and upload the flame graph data")
+    async def profile(interaction: discord.Interaction, seconds: int = 30):
+        """Sample all threads of the running bridge and upload the folded stacks"""
+        import config
+        from profiler import profiler
+
+        if seconds <= 0 or seconds > config.PROFILE_MAX_SECONDS:
+            await interaction.response.send_message(
+                f"Please specify a number between 1 and {config.PROFILE_MAX_SECONDS}.", ephemeral=True)
+            return
+        if not profiler.start(seconds):
+            await interaction.response.send_message("Profiling already in progress.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(f"Profiling for {seconds}s...", ephemeral=True)
+        # Wait off the event loop so the bot keeps sending logs meanwhile
+        path = await asyncio.get_running_loop().run_in_executor(None, profiler.wait, seconds + 30)
+        if path is None:
+            await interaction.followup.send("Profiling failed, see the logs.", ephemeral=True)
+        elif os.path.getsize(path) > 8 * 1024 * 1024:  # Discord's upload limit
+            await interaction.followup.send(f"Profile written to {path} (too large to upload).", ephemeral=True)
+        else:
+            await interaction.followup.send(f"Profile written to {path}", file=discord.File(path), ephemeral=True)
+
+    @bot.tree.command(name="presses", description="Button presses per device over the last N days")
+    async def presses(interaction: discord.Interaction, days: int = 7):
+        """Count the processed presses of every device, from the event history"""
+        import config
+        from history import get_history, day_start
+
+        if days <= 0 or days > 366:
+            await interaction.response.send_message("Please specify a number between 1 and 366.", ephemeral=True)
+            return
+        if not config.HISTORY_ENABLED:
+            await interaction.response.send_message("Event history is disabled.", ephemeral=True)
+            return
+
+        # Flushing can outlast Discord's 3s reply deadline, e.g. during the daily purge
+        await interaction.response.defer(ephemeral=True)
+        # Include the events still waiting for the batched write
+        history = get_history()
+        await asyncio.get_running_loop().run_in_executor(None, history.flush, 5)
+        rows = history.presses_per_device(day_start(days - 1))
+        period = "today" if days == 1 else f"the last {days} days"
+        if not rows:
+            await interaction.followup.send(f"No presses {period}.", ephemeral=True)
+            return
+        lines = [f"Presses {period}:"]
+        for device, actions, failed in rows:
+            detail = ", ".join(f"{action} {count}" for action, count in sorted(actions.items()))
+            lines.append(f"`{device}` {sum(actions.values())} ({detail})" + (f", **{failed} failed**" if failed else ""))
+        await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
+
+    @bot.tree.command(name="failed_sends", description="Events that could not be delivered over the last N days")
+    async def failed_sends(interaction: discord.Interaction, days: int = 1, limit: int = 20):
+        """List the failed sends, newest first, from the event history"""
+        import config
+        from history import get_history, day_start
+
+        if days <= 0 or days > 366 or limit <= 0 or limit > 50:
+            await interaction.response.send_message(
+                "Please specify 1-366 days and a limit between 1 and 50.", ephemeral=True)
+            return
+        if not config.HISTORY_ENABLED:
+            await interaction.response.send_message("Event history is disabled.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        history = get_history()
+        await asyncio.get_running_loop().run_in_executor(None, history.flush, 5)
+        rows = history.failures(day_start(days - 1), limit)
+        period = "today" if days == 1 else f"in the last {days} days"
+        if not rows:
+            await interaction.followup.send(f"No failed sends {period}.", ephemeral=True)
+            return
+        lines = [f"Failed sends {period} (newest first):"]
+        for at, device, action, group, trace_id in rows:
+            when = datetime.fromtimestamp(at).strftime("%m-%d %H:%M:%S")
+            lines.append(f"{when} `{device}` {action}" + (f" → {group}" if group else "") + f" (ID {trace_id})")
+        await interaction.followup.send("\n".join(lines)[:2000], ephemeral=True)
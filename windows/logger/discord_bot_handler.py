@@ -16,8 +16,10 @@ if curr_folder not in sys_path:
 import logging
 import asyncio
 import threading
+import time
+from collections import deque
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 
 from commands import register_commands
 
@@ -26,10 +28,16 @@ class DiscordBotHandler(logging.Handler):
     A logging handler that sends log messages to a Discord channel.
     
     This handler starts a Discord bot in a separate thread and uses it to
-    send log messages to a specified channel.
+    send log messages to a specified channel. Records are kept in a bounded
+    buffer (oldest dropped first) and delivered on demand, packed into as few
+    messages as the 2000-character limit allows, without exceeding the
+    channel's rate limit.
     """
+
+    MAX_MESSAGE_LENGTH = 2000
     
-    def __init__(self, bot_token, channel_id, level=logging.NOTSET):
+    def __init__(self, bot_token, channel_id, level=logging.NOTSET,
+                 max_queue=500, rate_limit=5, rate_period=5.0):
         """
         Initialize the handler with bot token and channel ID.
         
@@ -37,12 +45,23 @@ class DiscordBotHandler(logging.Handler):
             bot_token (str): The Discord bot token
             channel_id (str or int): The Discord channel ID
             level (int, optional): The logging level. Defaults to logging.NOTSET.
+            max_queue (int): Maximum number of buffered records, oldest are dropped beyond it
+            rate_limit (int): Maximum messages sent to the channel per rate_period
+            rate_period (float): Length of the rate-limit window in seconds
         """
         super().__init__(level)
         self.bot_token = bot_token
         self.channel_id = int(channel_id)  # Channel IDs must be integers
         self.bot = None
-        self.queue = asyncio.Queue()
+        self.records = deque()
+        self.records_lock = threading.Lock()
+        self.max_queue = max_queue
+        self.dropped = 0        # Dropped since the last report to the channel
+        self.total_dropped = 0
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.sent_times = deque(maxlen=rate_limit)
+        self.wakeup = asyncio.Event()
         self.ready = asyncio.Event()
         self.commands_synced = False
         
@@ -67,32 +86,113 @@ class DiscordBotHandler(logging.Handler):
                 print(f'Bot connected as {self.bot.user}')
                 print("Bot ready and accepting logs")
                 
-                self.ready.set()
-                self.process_queue.start()
+                if not self.ready.is_set():
+                    self.ready.set()
+                    self.loop.create_task(self._deliver())
                 
                 await self.sync_commands()
             
-            @tasks.loop(seconds=1)
-            async def process_queue():
-                if not self.queue.empty():
-                    try:
-                        while not self.queue.empty():
-                            message = self.queue.get_nowait()
-                            channel = self.bot.get_channel(self.channel_id)
-                            if channel:
-                                await channel.send(message)
-                                # print(f"Sent message to Discord: {message}")
-                            else:
-                                print(f"Channel {self.channel_id} not found")
-                    except Exception as e:
-                        print(f"Error sending to Discord: {e}")
-            
-            self.process_queue = process_queue
             self.loop.run_until_complete(self.bot.start(self.bot_token))
         
         self.thread = threading.Thread(target=run_bot, daemon=True)
         self.thread.start()
+
+    def _take_batch(self):
+        """
+        Pop as many buffered records as fit into one Discord message.
+
+        Returns:
+            str: Message content, or None if nothing is buffered
+        """
+        limit = self.MAX_MESSAGE_LENGTH
+        with self.records_lock:
+            if not self.records and not self.dropped:
+                return None
+            lines = []
+            length = 0
+            if self.dropped:
+                lines.append(f"⚠️ Dropped {self.dropped} log records (queue full, {self.total_dropped} in total)")
+                length = len(lines[0])
+                self.dropped = 0
+            while self.records:
+                line = self.records[0]
+                if len(line) > limit:
+                    line = line[:limit - 1] + "…"
+                if lines and length + 1 + len(line) > limit:
+                    break
+                self.records.popleft()
+                length += len(line) + (1 if lines else 0)
+                lines.append(line)
+            return "\n".join(lines)
+
+    async def _wait_rate_limit(self):
+        """Sleep until another message can be sent within the rate limit."""
+        if len(self.sent_times) == self.rate_limit:
+            wait = self.sent_times[0] + self.rate_period - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def _deliver(self):
+        """Send buffered records whenever new ones arrive."""
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.records or self.dropped:
+                # Records keep accumulating while we wait, so batches grow under load
+                await self._wait_rate_limit()
+                message = self._take_batch()
+                if message is None:
+                    break
+                try:
+                    channel = self.bot.get_channel(self.channel_id)
+                    if channel:
+                        self.sent_times.append(time.monotonic())
+                        await channel.send(message)
+                    else:
+                        print(f"Channel {self.channel_id} not found")
+                except discord.HTTPException as e:
+                    retry_after = getattr(e, "retry_after", None)
+                    print(f"Error sending to Discord: {e}")
+                    if retry_after:
+                        await asyncio.sleep(retry_after)
+                except Exception as e:
+                    print(f"Error sending to Discord: {e}")
     
+    def send_now(self, text, timeout):
+        """
+        Send a message right away, outside the record buffer and its rate
+        limit, and wait for Discord to accept it. Called from other threads.
+
+        Args:
+            text (str): Message content, cut to MAX_MESSAGE_LENGTH
+            timeout (float): Seconds to wait for the bot and the send
+
+        Returns:
+            bool: True if Discord accepted the message
+        """
+        deadline = time.monotonic() + timeout
+        while not self.ready.is_set():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.1)
+
+        async def send():
+            channel = self.bot.get_channel(self.channel_id)
+            if channel is None:
+                print(f"Channel {self.channel_id} not found")
+                return False
+            self.sent_times.append(time.monotonic())
+            await channel.send(text[:self.MAX_MESSAGE_LENGTH])
+            return True
+
+        future = asyncio.run_coroutine_threadsafe(send(), self.loop)
+        try:
+            return future.result(max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            future.cancel()
+            print(f"Error sending to Discord: {e!r}")
+            return False
+
     async def sync_commands(self):
         if self.commands_synced:  # Prevent multiple syncs
             return
@@ -106,15 +206,21 @@ class DiscordBotHandler(logging.Handler):
 
     def emit(self, record):
         """
-        Process a log record by putting it in the queue.
+        Process a log record by putting it in the buffer and waking the sender.
         
         Args:
             record: The log record to process
         """
         try:
             msg = self.format(record)
-            # Add the formatted message to the queue
-            asyncio.run_coroutine_threadsafe(self.queue.put(msg), self.loop)
+            with self.records_lock:
+                if len(self.records) >= self.max_queue:
+                    self.records.popleft()
+                    self.dropped += 1
+                    self.total_dropped += 1
+                self.records.append(msg)
+            if self.loop.is_running():
+                self.loop.call_soon_threadsafe(self.wakeup.set)
         except Exception as e:
             print(f"Error in emit: {e}")
     
@@ -0,0 +1,137 @@
+"""
+Fast deletion of Discord channel history for the log purge commands.
+
+Messages are split in a single pass over the history: recent ones go to
+bulk deletes of up to 100, older ones (which Discord cannot bulk delete)
+are deleted individually and concurrently, within a rate limit. Deletes run
+while the history is still being paged. Works on any object with the
+discord.py channel/message interface, so it can be benchmarked offline.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+BULK_DELETE_MAX = 100
+# Discord rejects bulk deletes of messages older than 14 days, keep a margin
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter allowing `rate` operations per `period` seconds.
+    """
+
+    def __init__(self, rate, period):
+        self.rate = rate
+        self.period = period
+        self.times = []
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.times = [t for t in self.times if now - t < self.period]
+                if len(self.times) < self.rate:
+                    self.times.append(now)
+                    return
+                await asyncio.sleep(self.times[0] + self.period - now)
+
+
+class PurgeStats:
+    """Counters reported while and after purging."""
+
+    def __init__(self):
+        self.scanned = 0
+        self.deleted = 0
+        self.failed = 0
+
+    def __str__(self):
+        text = f"Deleted {self.deleted} of {self.scanned} messages"
+        if self.failed:
+            text += f", {self.failed} could not be deleted"
+        return text
+
+
+async def purge_messages(channel, history, should_delete=None, progress=None,
+                         concurrency=5, rate=5, period=1.0, bulk_rate=1, bulk_period=1.0,
+                         progress_interval=2.0):
+    """
+    Delete the messages yielded by `history`.
+
+    Args:
+        channel: Channel supporting `delete_messages(list)`
+        history: Async iterable of messages supporting `delete()` and `created_at`
+        should_delete (callable): Filter on a message, all messages if None
+        progress (coroutine function): Called with PurgeStats at most every progress_interval seconds
+        concurrency (int): Maximum individual deletes in flight
+        rate (int): Individual deletes allowed per period
+        period (float): Rate-limit window in seconds
+        bulk_rate (int): Bulk deletes allowed per bulk_period
+        bulk_period (float): Rate-limit window of bulk deletes in seconds
+        progress_interval (float): Seconds between progress reports
+
+    Returns:
+        PurgeStats: Final counters
+    """
+    stats = PurgeStats()
+    limiter = RateLimiter(rate, period)
+    bulk_limiter = RateLimiter(bulk_rate, bulk_period)
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+    bulk_cutoff = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE
+    last_report = time.monotonic()
+
+    async def delete_one(message):
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                await message.delete()
+                stats.deleted += 1
+            except Exception:
+                stats.failed += 1
+
+    async def delete_bulk(messages):
+        if len(messages) == 1:
+            await delete_one(messages[0])
+            return
+        await bulk_limiter.acquire()
+        try:
+            await channel.delete_messages(messages)
+            stats.deleted += len(messages)
+        except Exception:
+            # Fall back to individual deletion if bulk deletion fails
+            await asyncio.gather(*(delete_one(m) for m in messages))
+
+    async def report(force=False):
+        nonlocal last_report
+        if progress and (force or time.monotonic() - last_report >= progress_interval):
+            last_report = time.monotonic()
+            try:
+                await progress(stats)
+            except Exception as e:
+                print(f"Error reporting purge progress: {e}")
+
+    bulk = []
+    async for message in history:
+        stats.scanned += 1
+        if should_delete is not None and not should_delete(message):
+            continue
+        if message.created_at > bulk_cutoff:
+            bulk.append(message)
+            if len(bulk) >= BULK_DELETE_MAX:
+                tasks.append(asyncio.create_task(delete_bulk(bulk)))
+                bulk = []
+        else:
+            tasks.append(asyncio.create_task(delete_one(message)))
+        await report()
+
+    if bulk:
+        tasks.append(asyncio.create_task(delete_bulk(bulk)))
+
+    pending = set(tasks)
+    while pending:
+        _, pending = await asyncio.wait(pending, timeout=progress_interval)
+        await report()
+    await report(force=True)
+    return stats
@@ -1,6 +1,14 @@
 """
 Logger configuration module for the MQTT to LINE messaging system.
 Uses TimedRotatingFileHandler for automatic log rotation with reliable cleanup.
+
+With LOG_ASYNC enabled, loggers only put records on an in-memory queue;
+a single background listener thread formats them and writes to the console,
+the log files and Discord, so logging never does I/O on the calling thread.
+
+With LOG_COMPRESS enabled, rotation only renames the file; closed segments
+are gzipped by a separate background thread, which also deletes the oldest
+segments while the logs directory is over LOG_MAX_TOTAL_BYTES.
 """
 import os
 import sys
@@ -10,47 +18,327 @@ curr_folder = os.path.abspath(os.path.dirname(__file__))
 if curr_folder not in sys_path:
     sys.path.insert(0, curr_folder)
 
+import atexit
+import gzip
 import logging
+import multiprocessing
+import queue
+import re
+import shutil
+import threading
 from datetime import datetime
-from logging.handlers import TimedRotatingFileHandler
-from dotenv import load_dotenv
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
 import config
-from .discord_bot_handler import DiscordBotHandler
-
-load_dotenv()
 
 # Create logs directory if it doesn't exist
 log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "logs")
 os.makedirs(log_dir, exist_ok=True)
 
-# To prevent bot being init multiple times
+
+# Closed segments written by TimedRotatingFileHandler, e.g. main.log.2025-01-06 or main.log.2025-01-06.gz
+segment_pattern = re.compile(r"^[^.].*\.log\.\d{4}-\d{2}-\d{2}(_[\d-]+)?(\.gz)?$")
+
+
+class SegmentCompressor(threading.Thread):
+    """
+    Background thread that gzips rotated log segments and keeps the logs
+    directory under a total size, so neither slows down the thread that
+    rotates the file.
+    """
+
+    def __init__(self, directory, max_total_bytes=None):
+        """
+        Args:
+            directory (str): The logs directory
+            max_total_bytes (int): Size cap of all log files, LOG_MAX_TOTAL_BYTES if None, 0 for no cap
+        """
+        super().__init__(name="log-compressor", daemon=True)
+        self.directory = directory
+        self.max_total_bytes = config.LOG_MAX_TOTAL_BYTES if max_total_bytes is None else max_total_bytes
+        self.pending = queue.SimpleQueue()
+
+    def submit(self, path):
+        """Queue a closed segment for compression."""
+        self.pending.put(path)
+
+    def rotate(self, source, dest):
+        """
+        Rotator for TimedRotatingFileHandler: rename only, compress later.
+
+        Args:
+            source (str): The active log file
+            dest (str): Name of the closed segment
+        """
+        if os.path.exists(source):
+            os.replace(source, dest)
+            self.submit(dest)
+
+    def compress(self, path):
+        """
+        Gzip one segment next to itself and delete the original. The archive
+        is written under a hidden temporary name, so a half written file is
+        never mistaken for a segment.
+
+        Returns:
+            str: Path of the compressed segment, None if the segment is gone
+        """
+        directory, name = os.path.split(path)
+        temp = os.path.join(directory, f".{name}.gz.part")
+        try:
+            with open(path, "rb") as src, gzip.open(temp, "wb", compresslevel=6) as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except FileNotFoundError:
+            # Already deleted by backupCount
+            return None
+        os.replace(temp, path + ".gz")
+        os.remove(path)
+        return path + ".gz"
+
+    def enforce_size_cap(self):
+        """
+        Delete the oldest segments while all log files together exceed the cap.
+
+        Returns:
+            int: Number of segments deleted
+        """
+        if not self.max_total_bytes:
+            return 0
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and (entry.name.endswith(".log") or segment_pattern.match(entry.name)):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, entry.path, stat.st_size))
+        total = sum(size for *_, size in files)
+        deleted = 0
+        for _, name, path, size in sorted(files):
+            if total <= self.max_total_bytes:
+                break
+            if name.endswith(".log"):
+                continue  # active files stay, however large
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            deleted += 1
+        return deleted
+
+    def run(self):
+        # Segments left uncompressed by a previous run
+        for name in os.listdir(self.directory):
+            if segment_pattern.match(name) and not name.endswith(".gz"):
+                self.submit(os.path.join(self.directory, name))
+        self.enforce_size_cap()
+        while True:
+            path = self.pending.get()
+            try:
+                self.compress(path)
+                self.enforce_size_cap()
+            except Exception as e:
+                print(f"Error compressing log segment {path}: {e}", file=sys.stderr)
+
+
+log_compressor = None
+compressor_lock = threading.Lock()
+
+
+def _get_compressor():
+    """Start the segment compressor on first use."""
+    global log_compressor
+    with compressor_lock:
+        if log_compressor is None:
+            log_compressor = SegmentCompressor(log_dir)
+            log_compressor.start()
+        return log_compressor
+
+
+def _rotate(source, dest):
+    _get_compressor().rotate(source, dest)
+
+
+class LazyDiscordHandler(logging.Handler):
+    """
+    Placeholder for the Discord bot handler that defers importing discord,
+    reading `.env` and starting the bot until it is actually needed: when the
+    first record at or above its level is emitted, or when `start()` is called.
+    """
+
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self.handler = None
+        self.unavailable = False
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the Discord bot if it is not running yet.
+
+        Returns:
+            DiscordBotHandler: The running handler, or None if it cannot be started
+        """
+        with self.start_lock:
+            if self.handler is not None or self.unavailable:
+                return self.handler
+
+            from dotenv import load_dotenv
+            load_dotenv()
+            bot_token = os.environ.get("DISCORD_BOT_TOKEN")
+            channel_id = os.environ.get("DISCORD_CHANNEL_ID")
+            if bot_token is None or channel_id is None:
+                print("Please set DISCORD_BOT_TOKEN and DISCORD_CHANNEL_ID environment variables.")
+                self.unavailable = True
+                return None
+
+            from .discord_bot_handler import DiscordBotHandler
+            handler = DiscordBotHandler(
+                bot_token=bot_token,
+                channel_id=channel_id,
+                max_queue=config.BOT_QUEUE_MAXSIZE,
+                rate_limit=config.BOT_RATE_LIMIT_MESSAGES,
+                rate_period=config.BOT_RATE_LIMIT_PERIOD
+            )
+            # Create Discord-specific formatter
+            discord_formatter = logging.Formatter(
+                '%(asctime)s - **%(levelname)s** - `%(message)s`',
+                '%Y-%m-%d %H:%M:%S'
+            )
+            # Set the specific log level for the Discord handler
+            handler.setLevel(self.level)
+            handler.setFormatter(discord_formatter)
+            self.handler = handler
+            return handler
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        if self.handler is not None:
+            self.handler.setLevel(level)
+
+    def emit(self, record):
+        handler = self.handler or self.start()
+        if handler is not None:
+            handler.handle(record)
+
+    def close(self):
+        if self.handler is not None:
+            self.handler.close()
+        super().close()
+
+
+# One shared handler, so only one Discord bot is ever started
 discord_handler = None
 if config.ENABLE_DISOCRD_BOT_LOGGING:
-    # Launch only 1 discord bot
-    bot_token = os.environ.get("DISCORD_BOT_TOKEN")
-    channel_id = os.environ.get("DISCORD_CHANNEL_ID")
-    if bot_token is None or channel_id is None:
-        print("Please set DISCORD_BOT_TOKEN and DISCORD_CHANNEL_ID environment variables.")
-    else:
-        discord_handler = DiscordBotHandler(
-            bot_token=bot_token,
-            channel_id=channel_id
-        )
-        # Create Discord-specific formatter
-        discord_formatter = logging.Formatter(
-            '%(asctime)s - **%(levelname)s** - `%(message)s`',
-            '%Y-%m-%d %H:%M:%S'
-        )
+    discord_handler = LazyDiscordHandler(config.BOT_LOG_LEVEL)
+
+
+def enable_discord_bot():
+    """
+    Start the Discord bot now instead of waiting for the first record that
+    reaches BOT_LOG_LEVEL, e.g. so the slash commands are available.
+
+    Returns:
+        bool: True if the bot is running
+    """
+    if discord_handler is None:
+        return False
+    return discord_handler.start() is not None
+
+
+def send_discord_alert(text, timeout=10):
+    """
+    Send a message to the Discord channel right away instead of through the
+    log buffer, starting the bot if needed.
+
+    Args:
+        text (str): Message content
+        timeout (float): Seconds to wait for the bot and the send
+
+    Returns:
+        bool: True if Discord accepted the message
+    """
+    if discord_handler is None:
+        return False
+    handler = discord_handler.start()
+    if handler is None:
+        return False
+    return handler.send_now(text, timeout)
 
-        # Set the specific log level for the Discord handler
-        discord_handler.setLevel(config.BOT_LOG_LEVEL)
-        discord_handler.setFormatter(discord_formatter)
+
+def set_discord_log_level(level):
+    """
+    Change the level of records sent to Discord on the fly, e.g. after a
+    configuration reload.
+
+    Args:
+        level (int): New logging level
+    """
+    if discord_handler is None:
+        return
+    discord_handler.setLevel(level)
+    # Loggers drop records below their lowest handler level, so recompute those
+    for name in discord_loggers:
+        logger = logging.getLogger(name)
+        handlers = log_listener.routes.get(name, []) if config.LOG_ASYNC else logger.handlers
+        logger.setLevel(min((h.level for h in handlers), default=logging.CRITICAL))
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, leaving message formatting to the
+    listener thread. Arguments are formatted later, so do not mutate objects
+    passed as logging arguments after the call.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class RoutingQueueListener(QueueListener):
+    """
+    Queue listener that dispatches each record to the handlers configured for
+    the logger that emitted it.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue, respect_handler_level=True)
+        self.routes = {}
+
+    def set_route(self, name, handlers):
+        """Replace the handlers of the named logger, closing the old ones."""
+        old = self.routes.get(name, [])
+        self.routes[name] = handlers
+        for handler in old:
+            if handler is not discord_handler and handler not in handlers:
+                handler.close()
+
+    def handle(self, record):
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+
+log_queue = queue.SimpleQueue()
+discord_loggers = set()
+configured_loggers = set()
+forward_queue = None
+log_listener = RoutingQueueListener(log_queue)
+listener_lock = threading.Lock()
+
+
+def _ensure_listener():
+    """Start the listener thread on first use and stop it at exit to flush pending records."""
+    with listener_lock:
+        if log_listener._thread is None:
+            log_listener.start()
+            atexit.register(log_listener.stop)
 
 def setup_logger(name,
         console_log_level=logging.INFO, console_output=True,
         file_log_level=logging.DEBUG, file_output=True,
-        dc_output=True):
+        dc_output=True, file_format=None):
     """
     Configure and return a logger with the specified name.
     Uses TimedRotatingFileHandler to automatically rotate logs by time.
@@ -62,6 +350,7 @@ def setup_logger(name,
         file_log_level (int): The logging level for file output (default: logging.DEBUG)
         file_output (bool): Whether to output logs to file
         dc_output (bool): Whether to output logs to DC Bot
+        file_format (str): Format of file records, defaults to the console format
 
     Returns:
         logging.Logger: Configured logger instance
@@ -72,8 +361,9 @@ def setup_logger(name,
     # Remove existing handlers to avoid duplicates
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
+    configured_loggers.add(name)
 
-    logger.setLevel(logging.DEBUG)
+    handlers = []
 
     # Add console handler if requested
     if console_output:
@@ -84,13 +374,13 @@ def setup_logger(name,
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(formatter)
         console_handler.setLevel(console_log_level)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
     # Add timed rotating file handler if requested
     if file_output:
         log_file = os.path.join(log_dir, f"{name}.log")
         formatter = logging.Formatter(
-            '%(asctime)s.%(msecs)03d - %(name)-10s - %(levelname)-5s - %(message)s',
+            file_format or '%(asctime)s.%(msecs)03d - %(name)-10s - %(levelname)-5s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         # Create a timed rotating file handler
@@ -103,6 +393,12 @@ def setup_logger(name,
             delay=True  # Only open file when first record is emitted
         )
 
+        if config.LOG_COMPRESS:
+            file_handler.rotator = _rotate
+            if multiprocessing.parent_process() is None:
+                # Also compresses what a previous run left behind; worker processes never write log files
+                _get_compressor()
+
         # Apply the formatter to the file handler
         file_handler.setFormatter(formatter)
         file_handler.setLevel(file_log_level)
@@ -111,10 +407,43 @@ def setup_logger(name,
         # Don't modify this unless you also modify the namer and rotator functions
         # file_handler.suffix = "%Y-%m-%d-%H-%M-%S"
 
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    # Add Discord Bot Handler For logs at specified level, the bot starts on first use
+    if dc_output and discord_handler is not None:
+        handlers.append(discord_handler)
+        discord_loggers.add(name)
+
+    # Let the logger drop records no handler wants before they are created
+    logger.setLevel(min((h.level for h in handlers), default=logging.CRITICAL))
+
+    if forward_queue is not None:
+        logger.addHandler(QueueHandler(forward_queue))
+    elif config.LOG_ASYNC:
+        log_listener.set_route(name, handlers)
+        queue_handler = DeferredQueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+        _ensure_listener()
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
+    return logger
+
 
-    # Add Discord Bot Handler For logs at specified level
-    if dc_output and config.ENABLE_DISOCRD_BOT_LOGGING and discord_handler:
-        logger.addHandler(discord_handler)
+def forward_records(target_queue):
+    """
+    Send the records of every logger to a queue instead of writing them, in
+    a worker process whose parent owns the log files and the Discord bot.
+    The parent passes them on with `logging.getLogger(record.name).handle(record)`.
 
-    return logger
\ No newline at end of file
+    Args:
+        target_queue (multiprocessing.Queue): Queue read by the parent process
+    """
+    global forward_queue
+    forward_queue = target_queue
+    for name in configured_loggers:
+        logger = logging.getLogger(name)
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        logger.addHandler(QueueHandler(target_queue))
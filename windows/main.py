@@ -11,14 +11,27 @@ if curr_folder not in sys_path:
     sys.path.insert(0, curr_folder)
 
 import config
-from logger import setup_logger
+import templates
+import line_messenger
+from logger import setup_logger, enable_discord_bot, set_discord_log_level
+from config_watcher import ConfigWatcher
+from cluster import ClusterMember
+from device_monitor import DeviceMonitor
 from mqtt_connection import MQTTConnection
 from message_queue_processor import MessageQueueProcessor
 from message_handler import MessageHandler
+from profiler import profiler
+from ui_worker import UIWorker
+from warmup import Warmup
 
 # Setup logger
 log = setup_logger("main")
 
+def on_log_config_changed(changed_keys, changed_templates):
+    """Apply a reloaded BOT_LOG_LEVEL to the Discord handler."""
+    if "BOT_LOG_LEVEL" in changed_keys:
+        set_discord_log_level(config.BOT_LOG_LEVEL)
+
 def main():
     """
     Main entry point of the application.
@@ -26,28 +39,70 @@ def main():
     log.info("Starting MQTT to LINE messaging bridge")
 
     try:
-        # Create message processor
-        processor = MessageQueueProcessor()
+        # Join the other bridge instances, if any; only the leader delivers
+        cluster = ClusterMember() if config.CLUSTER_ENABLED else None
+
+        # LINE automation in its own process, so a hung UI cannot stall MQTT
+        ui = UIWorker() if config.UI_WORKER_ENABLED else None
+
+        # Create message processor, the first send waits for LINE to be ready
+        processor = MessageQueueProcessor(cluster=cluster, ui=ui)
         processor.start()
+        if cluster is not None:
+            cluster.health = processor.is_healthy
         
+        # Alert on buttons that stopped reporting
+        monitor = None
+        if config.DEVICE_MONITOR_ENABLED:
+            monitor = DeviceMonitor()
+            monitor.start()
+
         # Create message handler
-        handler = MessageHandler(processor)
+        handler = MessageHandler(processor, monitor)
         
         # Create MQTT connection with the message handler
         connection = MQTTConnection(
             broker=config.MQTT_BROKER, 
             port=config.MQTT_PORT, 
             topic=config.MQTT_TOPIC,
-            message_callback=handler.handle_message
+            message_callback=handler.handle_message,
+            cluster=cluster
         )
-        
-        # Connect to MQTT broker
-        if connection.connect():
-            # Wait for messages
-            connection.wait_for_messages()
+
+        # Profile the running process on request, without a restart
+        connection.add_control(config.PROFILE_CONTROL_TOPIC, profiler.on_control_message)
+        profiler.install_signal_handler()
+
+        # Warm up everything in parallel. The Discord bot is started up front
+        # so its slash commands are available; MQTT keeps retrying in the background.
+        warmup = Warmup()
+        warmup.add("config", config.validate_config)
+        warmup.add("logging", enable_discord_bot, required=False)
+        if ui is None:
+            warmup.add("templates", templates.preload)
+            warmup.add("line", line_messenger.get_messenger)
         else:
-            log.error("Failed to connect to MQTT broker. Exiting.")
-            sys.exit(1)
+            # The worker decodes the templates and finds LINE itself
+            warmup.add("line", ui.start)
+        warmup.add("delivery", processor.delivery.warm, required=False)
+        warmup.add("mqtt", connection.connect, required=False)
+        results = warmup.run()
+
+        if not results["mqtt"]:
+            log.error("Failed to connect to MQTT broker, will keep retrying.")
+
+        # Apply edits of settings.json and the template images without a restart
+        watcher = ConfigWatcher()
+        watcher.add_listener(line_messenger.on_config_changed)
+        watcher.add_listener(processor.delivery.on_config_changed)
+        if ui is not None:
+            watcher.add_listener(ui.on_config_changed)
+        watcher.add_listener(connection.on_config_changed)
+        watcher.add_listener(on_log_config_changed)
+        watcher.start()
+
+        # Wait for messages
+        connection.wait_for_messages()
             
     except KeyboardInterrupt:
         log.critical("Received interrupt signal, shutting down...")
@@ -56,11 +111,21 @@ def main():
         sys.exit(1)
     finally:
         # Clean shutdown
+        if 'watcher' in locals():
+            watcher.stop()
+        if locals().get('monitor') is not None:
+            monitor.stop()
+        if locals().get('cluster') is not None:
+            cluster.stop()
         if 'connection' in locals():
             connection.disconnect()
         if 'processor' in locals():
             processor.stop()
             processor.wait_completion()
+        if locals().get('ui') is not None:
+            ui.stop()
+        if locals().get('processor') is not None and processor.history is not None:
+            processor.history.close()
         
     log.critical("Program terminated")
 
@@ -1,6 +1,7 @@
 """
 Handler for MQTT message parsing and processing.
 """
+import fnmatch
 import json
 import time
 from datetime import datetime
@@ -10,7 +11,9 @@ from threading import Thread
 import nanoid  # To generate Identifier
 
 import config
+from cluster import event_key
 from logger import setup_logger
+from tracing import Trace
 
 # Setup logger
 log = setup_logger("msg_hdl")
@@ -20,14 +23,16 @@ class MessageHandler:
     Handles MQTT message parsing and processing logic.
     """
     
-    def __init__(self, message_queue_processor):
+    def __init__(self, message_queue_processor, device_monitor=None):
         """
         Initialize the message handler.
         
         Args:
             message_queue_processor: The processor to handle queued messages
+            device_monitor (DeviceMonitor): Liveness monitor told about every message, optional
         """
         self.processor = message_queue_processor
+        self.device_monitor = device_monitor
     
     def handle_message(self, msg):
         """
@@ -36,49 +41,59 @@ class MessageHandler:
         Args:
             msg: MQTT message object from paho-mqtt
         """
+        if self.device_monitor is not None:
+            self.device_monitor.observe(msg.topic)
         # Start parsing in a separate thread to avoid blocking MQTT client
-        Thread(target=self._parse_message, args=(msg,), daemon=True).start()
+        Thread(target=self._parse_message, args=(msg, time.monotonic()), daemon=True).start()
     
-    def _parse_message(self, msg):
+    def _parse_message(self, msg, received_at=None):
         """
         Parse an MQTT message and add it to the processing queue.
+
+        Args:
+            msg: MQTT message object from paho-mqtt
+            received_at (float): Monotonic time the message was received
         """
         identifier = nanoid.generate(size=8)
+        trace = Trace(identifier, received_at)
 
         try:
             msg_text = msg.payload.decode()
             topic = msg.topic
-            log.debug(f"ID {identifier} | Received message on {msg.topic}: {msg_text[:200]}...")
+            log.debug("ID %s | Received message on %s: %s...", identifier, msg.topic, msg_text[:200])
 
             # Parse JSON data
             data = json.loads(msg_text)
 
             if "logging" in topic:
-                log.debug(f"ID {identifier} | ignore msg from `logging`")
+                log.debug("ID %s | ignore msg from `logging`", identifier)
                 return
 
             if type(data) is not dict:
-                log.debug(f"ID {identifier} | ignore data type {type(data)}")
+                log.debug("ID %s | ignore data type %s", identifier, type(data))
                 return
 
             if "action" not in data:
-                log.debug(f"ID {identifier} | ignore msg without 'action' key")
+                log.debug("ID %s | ignore msg without 'action' key", identifier)
                 return
 
             # Enrich data with topic
             data.update({'topic': topic.split("/")[-1]})
             identifier += f" - {topic}"
-            log.debug(f"ID {identifier} | Parsed message: topic={topic}, data={data}")
+            log.debug("ID %s | Parsed message: topic=%s, data=%s", identifier, topic, data)
 
             # Compose message
             action, message = self._compose_message(data)
             
             # Skip adding to queue if it's just a background ping
             if action == "bg_ping":
-                log.debug(f"ID {identifier} | Background check, still alive.")
+                log.debug("ID %s | Background check, still alive.", identifier)
                 return
                 
-            success = self.processor.enqueue_message(identifier, action, message)
+            trace.record("parse", trace.start, topic=topic, action=action)
+            success = self.processor.enqueue_message(identifier, action, message, trace=trace,
+                                                     key=event_key(topic, msg.payload),
+                                                     group=self._target_group(data['topic']))
             if success:
                 log.info(f"ID {identifier} | Added to processing queue")
 
@@ -88,6 +103,24 @@ class MessageHandler:
             log.error(f"ID {identifier} | Error parsing message: {e}")
             log.error(f"ID {identifier} | {traceback.format_exc()}")
     
+    def _target_group(self, device):
+        """
+        Look up the LINE group a device reports to.
+
+        Args:
+            device (str): Device name, the last segment of its topic
+
+        Returns:
+            str: Group name from TARGET_GROUPS, None for TARGET_GROUP_NAME
+        """
+        mapping = config.DEVICE_TARGET_GROUP
+        if device in mapping:
+            return mapping[device]
+        for pattern, group in mapping.items():
+            if fnmatch.fnmatchcase(device, pattern):
+                return group
+        return None
+
     def _compose_message(self, data):
         """
         Compose a message for LINE based on MQTT data.
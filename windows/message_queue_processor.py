@@ -1,14 +1,79 @@
 """
 Message queue processor for handling MQTT messages.
 """
+import heapq
+import itertools
 import queue
 import time
 import traceback
-from threading import Thread, Event
+from collections import deque
+from threading import Thread, Event, Lock
 
 import config
-from line_messenger import send_message
+from cancellation import CancelToken
+from delivery import Delivery, LineChannel, fallback_channels
+from history import get_history
+from line_messenger import send_message, self_check
 from logger import setup_logger
+from outbox import MessageOutbox, SENT, FAILED, DROPPED, EXPIRED
+from slo_monitor import LatencyMonitor
+from tracing import Trace
+
+
+def priority(action):
+    """Rank of an action in ACTION_PRIORITY, lower is more urgent."""
+    return config.ACTION_PRIORITY.get(action, len(config.ACTION_PRIORITY))
+
+
+class JobQueue(queue.Queue):
+    """
+    Queue of message items ordered by the urgency of their action, then by
+    arrival, so a "cancel" pressed behind a few calls is sent first.
+    """
+
+    def _init(self, maxsize):
+        self.queue = []
+        self.counter = itertools.count()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        action, enqueued_at = item[1], item[4]
+        heapq.heappush(self.queue, (priority(action), enqueued_at, next(self.counter), item))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+    def peek(self):
+        """
+        Returns:
+            tuple: The item get() would return next, None if empty
+        """
+        with self.mutex:
+            return self.queue[0][-1] if self.queue else None
+
+    def remove(self, predicate):
+        """
+        Take items out of the queue, counting them as done.
+
+        Args:
+            predicate (callable): Called with each item, True to remove it
+
+        Returns:
+            list: The removed items
+        """
+        with self.mutex:
+            removed = [entry[-1] for entry in self.queue if predicate(entry[-1])]
+            if removed:
+                self.queue = [entry for entry in self.queue if not predicate(entry[-1])]
+                heapq.heapify(self.queue)
+                self.unfinished_tasks -= len(removed)
+                if not self.unfinished_tasks:
+                    self.all_tasks_done.notify_all()
+                self.not_full.notify(len(removed))
+        return removed
+
 
 class MessageQueueProcessor(Thread):
     """
@@ -16,28 +81,71 @@ class MessageQueueProcessor(Thread):
     Ensures only one message is being sent to LINE at a time.
     """
     
-    def __init__(self, message_queue=None):
+    def __init__(self, message_queue=None, outbox=None, cluster=None, latency_monitor=None, ui=None,
+                 delivery=None, history=None):
         """
         Initialize the message queue processor.
         
         Args:
-            message_queue (Queue): Queue for message processing
+            message_queue (JobQueue): Queue for message processing
+            outbox (MessageOutbox): Durable journal of queued messages,
+                created from config if not given and OUTBOX_ENABLED is set
+            cluster (ClusterMember): Coordination with other bridge instances;
+                messages another instance is responsible for are held until it
+                acknowledges them
+            latency_monitor (LatencyMonitor): Latency objective of delivered
+                messages, created from config if not given and SLO_ENABLED is set
+            ui (UIWorker): Process running the LINE automation; it runs in this
+                process through line_messenger if None
+            delivery (Delivery): Channels messages are sent on, LINE with the
+                DELIVERY_FALLBACKS channels if None
+            history (EventHistory): Store of processed events, the shared one
+                if None and HISTORY_ENABLED is set
         """
         super().__init__(daemon=True)
-        self.queue = message_queue or queue.Queue(maxsize=100)
+        self.queue = message_queue or JobQueue(maxsize=100)
         self.should_stop = Event()
         self.logger = setup_logger("msg_queue")
+        if outbox is None and config.OUTBOX_ENABLED:
+            outbox = MessageOutbox()
+        self.outbox = outbox
+        if latency_monitor is None and config.SLO_ENABLED:
+            latency_monitor = LatencyMonitor()
+        self.latency_monitor = latency_monitor
+        if delivery is None:
+            delivery = Delivery(LineChannel(ui.send_message if ui is not None else send_message),
+                                fallback_channels())
+        self.delivery = delivery
+        if history is None and config.HISTORY_ENABLED:
+            history = get_history()
+        self.history = history
+        self.self_check = ui.self_check if ui is not None else self_check
+        self.last_busy = time.monotonic()
+        self.last_check = time.monotonic()
+        self.ui_problems = []
+        self.busy_since = None
+        self.cluster = cluster
+        self.held = deque()        # queue items received while standby
+        self.early_acks = deque()  # (time, key, received) acknowledged before the item was held
+        self.held_lock = Lock()
+        self.current = None  # action, group and CancelToken of the message being sent
+        self.current_lock = Lock()
+        if cluster is not None:
+            cluster.add_listener(self._on_cluster_event)
     
     def run(self):
         """Main processing loop."""
         self.logger.info("Message processor started")
+        self._replay_outbox()
         
         while not self.should_stop.is_set():
             try:
                 # Get message from queue with timeout to check stop condition periodically
                 try:
-                    identifier, action, message = self.queue.get(timeout=1.0)
+                    item = self.queue.get(timeout=1.0)
+                    identifier, action, message, trace, enqueued_at, key, group = item
                 except queue.Empty:
+                    self._idle_check()
                     continue
                 
                 # Process background ping checks without logging
@@ -46,16 +154,60 @@ class MessageQueueProcessor(Thread):
                     self.queue.task_done()
                     continue
                 
+                # Only the responsible instance delivers, the others keep the message until it is acknowledged
+                if self.cluster is not None and not self.cluster.should_deliver(group):
+                    self._hold(item)
+                    self.queue.task_done()
+                    continue
+
                 # Process actual message
-                self.logger.info(f"ID {identifier} | Processing message with action: {action}")
-                result = send_message(action, message)
+                self.logger.info(f"ID {identifier} | Processing message with action: {action}"
+                                 + (f" for group {group}" if group else ""))
+                trace.record("queue_wait", enqueued_at)
+                result = False
+                preempted = False
+                token = CancelToken()
+                with self.current_lock:
+                    self.current = {"action": action, "group": group, "token": token, "superseded": False}
+                # Something more urgent may have arrived while this message was taken
+                waiting = self.queue.peek()
+                if waiting is not None:
+                    self._preempt_for(waiting[1], waiting[6])
+                self.busy_since = time.monotonic()
+                try:
+                    # A configuration reload waits until the message is sent
+                    with config.lock, trace.span("deliver", action=action) as span:
+                        result = self.delivery.deliver(action, message, trace=trace, group=group, token=token)
+                        span["ok"] = bool(result)
+                finally:
+                    with self.current_lock:
+                        superseded = self.current["superseded"]
+                        self.current = None
+                    self.busy_since = None
+                    # A send that posted its message ran to completion, whatever its result
+                    preempted = token.cancelled and not token.committed and not result
+                    if preempted:
+                        self._preempted(item, token.reason, superseded)
+                    else:
+                        self._journal(identifier, SENT if result else FAILED)
+                        if self.cluster is not None:
+                            self.cluster.ack(key, trace.received)
+                        trace.event("done", ok=bool(result), total=round(trace.elapsed(), 6))
+                        if self.latency_monitor is not None:
+                            self.latency_monitor.observe(trace, action, bool(result))
+                        if self.history is not None:
+                            self.history.record(self._device(identifier), action, result, group=group,
+                                                latency=trace.elapsed(), trace_id=trace.trace_id, message=message)
                 
-                if result:
+                if preempted:
+                    pass  # logged by _preempted
+                elif result:
                     self.logger.info(f"ID {identifier} | Message sent successfully to LINE\n")
                 else:
                     self.logger.critical(f"ID {identifier} | Failed to send message to LINE\n")
                 
                 # Mark task as done
+                self.last_busy = time.monotonic()
                 self.queue.task_done()
                 
             except Exception as e:
@@ -67,11 +219,231 @@ class MessageQueueProcessor(Thread):
                 except:
                     pass
     
+    def _idle_check(self):
+        """
+        Self-check the LINE UI after IDLE_CHECK_INTERVAL seconds without work,
+        and again every IDLE_CHECK_INTERVAL while idle. This keeps the cached UI
+        locations warm for the next press and reports a drifted UI (LINE logged
+        out, minimized, ...) before an emergency finds it. The check runs on this
+        thread between messages and stops as soon as a message arrives.
+        """
+        interval = config.IDLE_CHECK_INTERVAL
+        now = time.monotonic()
+        if not interval or now - self.last_busy < interval or now - self.last_check < interval:
+            return
+        self.last_check = now
+
+        try:
+            with config.lock:
+                problems = self.self_check(should_yield=lambda: not self.queue.empty() or self.should_stop.is_set())
+        except Exception as e:
+            self.logger.error(f"UI self-check failed: {e}")
+            self.logger.debug(traceback.format_exc())
+            return
+        self.logger.debug("UI self-check took %.2fs: %s", time.monotonic() - now,
+                          "interrupted" if problems is None else problems or "ok")
+        if problems is None:
+            return
+
+        # Alert on changes only, so a lasting problem is not reported every interval
+        if problems and problems != self.ui_problems:
+            self.logger.critical(f"UI self-check: {'; '.join(problems)}. The next message may fail.")
+        elif not problems and self.ui_problems:
+            self.logger.critical("UI self-check: LINE is ready again.")
+        self.ui_problems = problems
+
+    def is_healthy(self):
+        """
+        Returns:
+            bool: False if the current message has been processing for longer
+                than CLUSTER_STUCK_TIMEOUT, e.g. because the UI automation hangs
+        """
+        busy_since = self.busy_since
+        return busy_since is None or time.monotonic() - busy_since < config.CLUSTER_STUCK_TIMEOUT
+
+    def _hold(self, item):
+        """Keep a message another instance is responsible for, unless it was already handled."""
+        identifier, key = item[0], item[5]
+        with self.held_lock:
+            self._expire_early_acks()
+            for i, (_, acked_key, received) in enumerate(self.early_acks):
+                if self._same_event(item, acked_key, received):
+                    del self.early_acks[i]
+                    self.logger.info(f"ID {identifier} | Already handled by the leader")
+                    self._journal(identifier, SENT)
+                    return
+            # The view may have changed since run() checked it; a takeover scan
+            # that ran in between has missed this item, so deliver it here
+            responsible = self.cluster.should_deliver(item[6])
+            if not responsible:
+                # Anything this old would not be delivered after a takeover anyway
+                while self.held and time.monotonic() - self.held[0][4] > config.OUTBOX_REPLAY_MAX_AGE:
+                    self._journal(self.held.popleft()[0], EXPIRED)
+                self.held.append(item)
+        if responsible:
+            self.logger.warning(f"ID {identifier} | Became responsible while holding it, delivering it")
+            self._requeue(item)
+            return
+        self.logger.info(f"ID {identifier} | Not responsible, holding message until it is handled")
+
+    def _on_cluster_event(self, kind, value):
+        """Listener of ClusterMember: release acknowledged messages and take over held ones."""
+        if kind == "acked":
+            key, received = value
+            with self.held_lock:
+                for item in self.held:
+                    if self._same_event(item, key, received):
+                        self.held.remove(item)
+                        self.logger.info(f"ID {item[0]} | Handled by another instance")
+                        self._journal(item[0], SENT)
+                        return
+                self.early_acks.append((time.monotonic(), key, received))
+                self._expire_early_acks()
+            return
+
+        # Leadership or membership changed: deliver what this instance is now responsible for
+        with self.held_lock:
+            takeover = [item for item in self.held if self.cluster.should_deliver(item[6])]
+            for item in takeover:
+                self.held.remove(item)
+        for item in takeover:
+            self.logger.warning(f"ID {item[0]} | Taking over message not handled by the previous instance")
+            self._requeue(item)
+
+    @staticmethod
+    def _same_event(item, key, received):
+        """
+        Whether an acknowledgement is for this queue item. Repeated presses
+        can have the same key; they are told apart by their receive time,
+        unless the acknowledging instance did not send one.
+        """
+        if key is None or item[5] != key:
+            return False
+        return received is None or abs(item[3].received - received) <= config.CLUSTER_ACK_TOLERANCE
+
+    def _expire_early_acks(self):
+        """Forget early acknowledgements whose message would have expired anyway. Called with held_lock held."""
+        while self.early_acks and time.monotonic() - self.early_acks[0][0] > config.OUTBOX_REPLAY_MAX_AGE:
+            self.early_acks.popleft()
+
+    def _requeue(self, item):
+        """Queue a held message this instance has become responsible for."""
+        try:
+            self.queue.put_nowait(item)
+            self._preempt_for(item[1], item[6])
+        except queue.Full:
+            self.logger.error(f"ID {item[0]} | Message queue is full! Dropping message.")
+            self._journal(item[0], DROPPED)
+
+    def _preempt_for(self, action, group):
+        """
+        Make way for a message that just arrived. A "cancel" supersedes the
+        calls to its group that are queued or being sent; any more urgent
+        action interrupts the send in progress, which is queued again.
+
+        Args:
+            action (str): Action of the new message
+            group (str): Its target group
+        """
+        if not config.PREEMPT_ENABLED or action == "bg_ping":
+            return
+        if self.cluster is not None and not self.cluster.should_deliver(group):
+            return  # held until the responsible instance handles it
+        if action == "cancel":
+            for item in self.queue.remove(lambda item: item[1] == "call" and item[6] == group):
+                self.logger.warning(f"ID {item[0]} | Call superseded by a cancel before it was sent")
+                self._journal(item[0], DROPPED)
+                if self.cluster is not None:
+                    self.cluster.ack(item[5], item[3].received)
+
+        with self.current_lock:
+            current = self.current
+            if current is None or current["token"].cancelled:
+                return
+            if action == "cancel" and current["action"] == "call" and current["group"] == group:
+                current["superseded"] = True
+            elif priority(action) >= priority(current["action"]):
+                return
+            current["token"].cancel(f"{action} for {group or 'the default group'}")
+
+    def _preempted(self, item, reason, superseded):
+        """
+        Finish a message whose send was interrupted: drop it if the message
+        that interrupted it made it pointless, otherwise queue it again.
+        """
+        identifier, action, trace, key = item[0], item[1], item[3], item[5]
+        trace.event("preempted", reason=reason, superseded=superseded)
+        if superseded:
+            self.logger.warning(f"ID {identifier} | {action} superseded by a {reason}, not sending it again")
+            self._journal(identifier, DROPPED)
+            if self.cluster is not None:
+                self.cluster.ack(key, trace.received)
+            return
+        self.logger.warning(f"ID {identifier} | {action} interrupted by a {reason}, sending it again afterwards")
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.logger.error(f"ID {identifier} | Message queue is full! Dropping message.")
+            self._journal(identifier, DROPPED)
+
+    def _replay_outbox(self):
+        """
+        Re-queue the entries left unfinished by a previous run.
+        Entries older than OUTBOX_REPLAY_MAX_AGE are marked expired instead,
+        so a stale call is not placed hours after the button was pressed.
+        """
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.purge(older_than=config.OUTBOX_RETENTION)
+            entries = self.outbox.pending()
+        except Exception as e:
+            self.logger.error(f"Could not read outbox: {e}")
+            return
+
+        now = time.time()
+        for identifier, action, message, created_at, group, key in entries:
+            age = now - created_at
+            if age > config.OUTBOX_REPLAY_MAX_AGE:
+                self.logger.warning(f"ID {identifier} | Unfinished {action} from {age:.0f}s ago expired, not replaying")
+                self._journal(identifier, EXPIRED)
+                continue
+            if group is not None and group not in config.TARGET_GROUPS:
+                self.logger.warning(f"ID {identifier} | Group {group} is no longer configured, replaying to the default group")
+                group = None
+            trace = Trace(identifier.split(" - ")[0], received=created_at)
+            trace.event("replayed", action=action, age=round(age, 3))
+            try:
+                self.queue.put_nowait((identifier, action, message, trace, time.monotonic(), key, group))
+                self.logger.warning(f"ID {identifier} | Replaying unfinished {action} from {age:.0f}s ago")
+            except queue.Full:
+                self.logger.error(f"ID {identifier} | Message queue is full! Dropping replayed message.")
+                self._journal(identifier, DROPPED)
+
+    @staticmethod
+    def _device(identifier):
+        """Device name in an identifier such as `Ab3dE9xY - zigbee2mqtt/button-1`."""
+        _, _, topic = identifier.partition(" - ")
+        return topic.rsplit("/", 1)[-1] or None
+
+    def _journal(self, identifier, state):
+        """
+        Record the outcome of a message in the outbox, if enabled.
+        Journal failures are logged and never stop a message from being sent.
+        """
+        if self.outbox is None:
+            return
+        try:
+            self.outbox.mark(identifier, state)
+        except Exception as e:
+            self.logger.error(f"ID {identifier} | Could not journal state {state}: {e}")
+
     def stop(self):
         """Signal the processor to stop."""
         self.should_stop.set()
     
-    def enqueue_message(self, identifier, action, message, block=False, timeout=None):
+    def enqueue_message(self, identifier, action, message, block=False, timeout=None, trace=None, key=None,
+                        group=None):
         """
         Add a message to the processing queue.
         
@@ -81,15 +453,27 @@ class MessageQueueProcessor(Thread):
             message (str): Message content
             block (bool): Whether to block if queue is full
             timeout (float): Timeout for blocking operation
+            trace (Trace): Trace of the event, a new one is started if None
+            key (str): Key of the event shared by all bridge instances, see cluster.event_key
+            group (str): Target group from TARGET_GROUPS, None for TARGET_GROUP_NAME
             
         Returns:
             bool: True if message was added to queue, False otherwise
         """
+        trace = trace or Trace(identifier.split(" - ")[0])
+        if self.outbox is not None and action != "bg_ping":
+            try:
+                self.outbox.append(identifier, action, message, group=group, key=key)
+            except Exception as e:
+                self.logger.error(f"ID {identifier} | Could not journal message: {e}")
         try:
-            self.queue.put((identifier, action, message), block=block, timeout=timeout)
+            self.queue.put((identifier, action, message, trace, time.monotonic(), key, group), block=block, timeout=timeout)
+            trace.event("enqueued", depth=self.queue.qsize())
+            self._preempt_for(action, group)
             return True
         except queue.Full:
             self.logger.error(f"ID {identifier} | Message queue is full! Dropping message.")
+            self._journal(identifier, DROPPED)
             return False
             
     def wait_completion(self):
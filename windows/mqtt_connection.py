@@ -2,8 +2,10 @@
 MQTT connection handler for managing broker connections and subscriptions.
 """
 import paho.mqtt.client as mqtt
+import random
 import time
 import traceback
+import uuid
 from threading import Thread, Event
 
 import config
@@ -15,9 +17,14 @@ log = setup_logger("mqtt_conn")
 class MQTTConnection:
     """
     Manages MQTT broker connection, reconnection, and basic callbacks.
+
+    A single network thread drives paho's loop and owns reconnection: after a
+    disconnect it retries forever with capped exponential backoff and jitter.
+    A watchdog probes the broker when no traffic arrived for a while and forces
+    a reconnect if the probe does not come back (half-open connection).
     """
 
-    def __init__(self, broker=None, port=None, topic=None, message_callback=None):
+    def __init__(self, broker=None, port=None, topic=None, message_callback=None, cluster=None):
         """
         Initialize the MQTT connection manager.
 
@@ -26,15 +33,23 @@ class MQTTConnection:
             port (int): MQTT broker port
             topic (str): MQTT topic to subscribe to
             message_callback (callable): Callback function for messages
+            cluster (ClusterMember): Leader election to join, if any
         """
         self.broker = broker or config.MQTT_BROKER
         self.port = port or config.MQTT_PORT
         self.topic = topic or config.MQTT_TOPIC
         self.message_callback = message_callback
+        self.cluster = cluster
+        self.controls = {}  # control topic -> callback
         self.client = None
         self.connected = Event()
         self.should_stop = Event()
         self.reconnect_count = 0
+        self.thread = None
+        self.socket_open = False
+        self.last_activity = time.monotonic()
+        self.probe_sent_at = None
+        self.watchdog_topic = f"{config.MQTT_WATCHDOG_TOPIC}/{uuid.uuid4().hex[:12]}"
 
     def _on_connect(self, client, userdata, flags, rc, *args, **kwargs):
         """
@@ -44,10 +59,17 @@ class MQTTConnection:
         """
         if rc == 0:
             log.info(f"Connected to MQTT broker at {self.broker}:{self.port}")
-            self.client.subscribe(self.topic)
+            self.client.subscribe(self.topic, qos=config.MQTT_QOS)
+            self.client.subscribe(self.watchdog_topic)
             log.info(f"Subscribed to topic: {self.topic}")
+            for topic in self.controls:
+                self.client.subscribe(topic, qos=1)
+            if self.cluster is not None:
+                self.cluster.on_connected()
             self.connected.set()
             self.reconnect_count = 0
+            self.last_activity = time.monotonic()
+            self.probe_sent_at = None
         else:
             log.error(f"Failed to connect to MQTT broker, code: {rc}")
             self.connected.clear()
@@ -55,20 +77,34 @@ class MQTTConnection:
     def _on_disconnect(self, client, userdata, rc, *args, **kwargs):
         """
         Callback for when the client disconnects from the broker.
+        The network thread notices the closed socket and reconnects.
 
         Note: The signature includes *args, **kwargs to handle different paho-mqtt versions.
         """
         log.warning(f"Disconnected from MQTT broker with code: {rc}")
         self.connected.clear()
-
-        # Attempt reconnection if not stopping
-        if not self.should_stop.is_set():
-            self._schedule_reconnect()
+        self.socket_open = False
 
     def _on_message(self, client, userdata, msg):
         """
         Callback for when a message is received from the broker.
         """
+        self.last_activity = time.monotonic()
+        if msg.topic == self.watchdog_topic:
+            self.probe_sent_at = None
+            return
+        if self.cluster is not None and self.cluster.handles(msg.topic):
+            try:
+                self.cluster.on_message(msg)
+            except Exception as e:
+                log.error(f"Error handling cluster message on {msg.topic}: {e}")
+            return
+        if msg.topic in self.controls:
+            try:
+                self.controls[msg.topic](msg)
+            except Exception as e:
+                log.error(f"Error handling control message on {msg.topic}: {e}")
+            return
         if self.message_callback:
             try:
                 self.message_callback(msg)
@@ -76,35 +112,88 @@ class MQTTConnection:
                 log.error(f"Error in message callback: {e}")
                 log.error(traceback.format_exc())
 
-    def _schedule_reconnect(self):
+    def _backoff_delay(self):
         """
-        Schedule a reconnection attempt.
+        Delay before the next reconnection attempt.
+        Capped exponential backoff with jitter in [ceiling/2, ceiling], so a
+        fleet of clients does not hammer a restarted broker in lockstep.
+
+        Returns:
+            float: Seconds to wait
         """
-        if self.reconnect_count < config.MQTT_MAX_RECONNECT_ATTEMPTS:
+        if self.reconnect_count == 0:
+            return 0
+        ceiling = min(config.MQTT_RECONNECT_MAX_DELAY,
+                      config.MQTT_RECONNECT_DELAY * 2 ** (self.reconnect_count - 1))
+        return random.uniform(ceiling / 2, ceiling)
+
+    def _open_socket(self):
+        """
+        Open the connection to the broker once, after the backoff delay.
+
+        Returns:
+            bool: True if the socket was opened
+        """
+        delay = self._backoff_delay()
+        if delay:
+            log.info(f"Scheduling reconnection attempt {self.reconnect_count} in {delay:.1f} seconds")
+            if self.should_stop.wait(delay):
+                return False
+        try:
+            if self.reconnect_count:
+                log.info("Attempting to reconnect to MQTT broker")
+            self.client.reconnect()
+            self.socket_open = True
+            self.last_activity = time.monotonic()
+            self.probe_sent_at = None
+            return True
+        except Exception as e:
+            log.error(f"Reconnection attempt failed: {e}")
             self.reconnect_count += 1
-            delay = config.MQTT_RECONNECT_DELAY * self.reconnect_count
-            log.info(f"Scheduling reconnection attempt {self.reconnect_count} in {delay} seconds")
+            return False
 
-            Thread(target=self._delayed_reconnect, args=(delay,), daemon=True).start()
-        else:
-            log.error(f"Maximum reconnection attempts ({config.MQTT_MAX_RECONNECT_ATTEMPTS}) reached")
+    def _check_watchdog(self):
+        """
+        Probe the broker after a period of silence and force a reconnect
+        if the probe does not come back in time.
+        """
+        if not self.connected.is_set():
+            return
+        now = time.monotonic()
+        if self.probe_sent_at is not None:
+            if now - self.probe_sent_at > config.MQTT_WATCHDOG_PROBE_TIMEOUT:
+                log.warning(f"No traffic for {now - self.last_activity:.0f} seconds and watchdog probe unanswered, "
+                            "forcing reconnect")
+                self.connected.clear()
+                self.socket_open = False
+                self.reconnect_count = 0
+        elif now - self.last_activity > config.MQTT_WATCHDOG_SILENCE:
+            log.debug("No traffic for %.0f seconds, sending watchdog probe", now - self.last_activity)
+            self.probe_sent_at = now
+            self.client.publish(self.watchdog_topic, b"ping")
 
-    def _delayed_reconnect(self, delay):
+    def _network_loop(self):
         """
-        Attempt to reconnect after a delay.
+        Run paho's network loop and reconnect whenever the connection is lost.
         """
-        time.sleep(delay)
-        if not self.should_stop.is_set():
-            try:
-                log.info(f"Attempting to reconnect to MQTT broker")
-                self.client.reconnect()
-            except Exception as e:
-                log.error(f"Reconnection attempt failed: {e}")
-                self._schedule_reconnect()
+        while not self.should_stop.is_set():
+            if not self.socket_open:
+                self._open_socket()
+                continue
+            rc = self.client.loop(timeout=1.0)
+            if rc != mqtt.MQTT_ERR_SUCCESS and not self.should_stop.is_set():
+                if self.socket_open:
+                    log.warning(f"MQTT network loop error: {mqtt.error_string(rc)}")
+                self.connected.clear()
+                self.socket_open = False
+                self.reconnect_count += 1
+                continue
+            self._check_watchdog()
 
     def connect(self):
         """
-        Connect to the MQTT broker.
+        Connect to the MQTT broker. Reconnection attempts continue in the
+        background even if the initial connection is not established in time.
         
         Returns:
             bool: True if connection was established, False otherwise
@@ -117,13 +206,16 @@ class MQTTConnection:
             self.client.on_connect = self._on_connect
             self.client.on_disconnect = self._on_disconnect
             self.client.on_message = self._on_message
+            if self.cluster is not None:
+                self.cluster.attach(self.client)
 
             # Connect to broker
             log.info(f"Connecting to MQTT broker at {self.broker}:{self.port}")
-            self.client.connect(self.broker, self.port, 60)
+            self.client.connect_async(self.broker, self.port, config.MQTT_KEEPALIVE)
 
             # Start the network loop
-            self.client.loop_start()
+            self.thread = Thread(target=self._network_loop, name="mqtt-network", daemon=True)
+            self.thread.start()
 
             # Wait for connection
             if not self.connected.wait(timeout=10):
@@ -136,6 +228,19 @@ class MQTTConnection:
             log.error(traceback.format_exc())
             return False
 
+    def add_control(self, topic, callback):
+        """
+        Route messages on a control topic to a callback instead of the
+        message handler.
+
+        Args:
+            topic (str): Exact topic, subscribed on every connect
+            callback (callable): Called with the MQTT message
+        """
+        self.controls[topic] = callback
+        if self.connected.is_set():
+            self.client.subscribe(topic, qos=1)
+
     def disconnect(self):
         """
         Disconnect from the MQTT broker.
@@ -143,10 +248,39 @@ class MQTTConnection:
         if self.client:
             log.info("Disconnecting from MQTT broker")
             self.should_stop.set()
-            self.client.loop_stop()
+            if self.thread:
+                self.thread.join(timeout=5)
             self.client.disconnect()
             log.info("Disconnected from MQTT broker")
 
+    def on_config_changed(self, changed_keys, changed_templates):
+        """
+        Apply a configuration reload to the live connection: resubscribe if the
+        topic changed and move to a new broker if its address changed, without
+        recreating the client or the network thread.
+
+        Args:
+            changed_keys (set): Names of the changed settings
+            changed_templates (set): Paths of the changed template images
+        """
+        if self.client is None:
+            return
+        if changed_keys & {"MQTT_BROKER", "MQTT_PORT"}:
+            self.broker, self.port = config.MQTT_BROKER, config.MQTT_PORT
+            log.info(f"Broker changed, reconnecting to {self.broker}:{self.port}")
+            self.topic = config.MQTT_TOPIC
+            # The network thread replaces the old socket on its next iteration
+            self.client.connect_async(self.broker, self.port, config.MQTT_KEEPALIVE)
+            self.connected.clear()
+            self.reconnect_count = 0
+            self.socket_open = False
+        elif changed_keys & {"MQTT_TOPIC", "MQTT_QOS"}:
+            old_topic, self.topic = self.topic, config.MQTT_TOPIC
+            if self.connected.is_set():
+                self.client.unsubscribe(old_topic)
+                self.client.subscribe(self.topic, qos=config.MQTT_QOS)
+            log.info(f"Subscription changed from {old_topic} to {self.topic}")
+
     def wait_for_messages(self):
         """
         Wait for messages until interrupted.
@@ -157,4 +291,4 @@ class MQTTConnection:
                 time.sleep(1)
         except KeyboardInterrupt:
             log.info("Received interrupt signal, shutting down...")
-            self.disconnect()
\ No newline at end of file
+            self.disconnect()
@@ -0,0 +1,196 @@
+"""
+On-demand sampling profiler for the running bridge.
+
+Restarting a slow bridge to profile it clears the state worth looking at, so
+the profiler attaches to the live process instead: while active, a
+background thread samples the stack of every thread (MQTT network loop,
+message processor, parse workers, ...) at a fixed interval. At the end of
+the window the samples are written to the logs directory in the folded
+format read by flamegraph.pl, speedscope and similar tools:
+
+    <thread>;<outermost function>;...;<innermost function> <samples>
+
+It can be started by a signal (Ctrl+Break on Windows, SIGUSR1 elsewhere), a
+message on PROFILE_CONTROL_TOPIC, or the /profile Discord command.
+"""
+import json
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from threading import Thread, Event, Lock
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("profiler")
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_label(name):
+    # Parse workers are numbered, e.g. "Thread-12 (_parse_message)"; fold them together
+    return re.sub(r"-\d+", "", name).replace(";", ",")
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads during a time window.
+    """
+
+    def __init__(self, interval=None, directory=None):
+        """
+        Initialize the profiler.
+
+        Args:
+            interval (float): Seconds between samples, PROFILE_SAMPLE_INTERVAL if None
+            directory (str): Where dumps are written, PROFILE_DIR if None
+        """
+        self.interval = interval or config.PROFILE_SAMPLE_INTERVAL
+        self.directory = directory or config.PROFILE_DIR
+        self.lock = Lock()
+        self.thread = None
+        self.should_stop = Event()
+        self.finished = Event()
+        self.last_dump = None
+
+    def is_running(self):
+        """Whether a profiling window is active."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds=None):
+        """
+        Start profiling for a time window.
+
+        Args:
+            seconds (float): Length of the window, PROFILE_DEFAULT_SECONDS if None,
+                capped at PROFILE_MAX_SECONDS
+
+        Returns:
+            bool: True if started, False if a window is already active
+        """
+        seconds = min(seconds or config.PROFILE_DEFAULT_SECONDS, config.PROFILE_MAX_SECONDS)
+        with self.lock:
+            if self.is_running():
+                return False
+            self.should_stop.clear()
+            self.finished.clear()
+            self.thread = Thread(target=self._run, args=(seconds,), name="profiler", daemon=True)
+            self.thread.start()
+        log.warning(f"Profiling all threads for {seconds:g}s")
+        return True
+
+    def stop(self):
+        """
+        End the active window early; the dump is written as usual.
+
+        Returns:
+            bool: True if a window was active
+        """
+        if not self.is_running():
+            return False
+        self.should_stop.set()
+        return True
+
+    def wait(self, timeout=None):
+        """
+        Wait for the active window to end.
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            str: Path of the dump, or None if none was written in time
+        """
+        return self.last_dump if self.finished.wait(timeout) else None
+
+    def _run(self, seconds):
+        stacks = Counter()
+        samples = 0
+        own_id = threading.get_ident()
+        started = time.perf_counter()
+        deadline = time.monotonic() + seconds
+        try:
+            while not self.should_stop.wait(self.interval) and time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    stack.append(_thread_label(names.get(thread_id, f"thread {thread_id}")))
+                    stacks[";".join(reversed(stack))] += 1
+                samples += 1
+            self.last_dump = self._write(stacks, samples, time.perf_counter() - started)
+        except Exception as e:
+            log.error(f"Error while profiling: {e}")
+            self.last_dump = None
+        finally:
+            self.finished.set()
+
+    def _write(self, stacks, samples, elapsed):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Innermost frames over all threads, idle waits included
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        top = ", ".join(f"{leaf} {count}" for leaf, count in leaves.most_common(5))
+        log.warning(f"Profile written to {path}: {samples} samples in {elapsed:.1f}s. Top frames: {top}")
+        return path
+
+    # ---- triggers ----------------------------------------------------------
+
+    def toggle(self, *args):
+        """Start a window with the default length, or end the active one."""
+        if not self.stop():
+            self.start()
+
+    def install_signal_handler(self):
+        """
+        Toggle profiling on Ctrl+Break (Windows) or SIGUSR1. Must be called
+        from the main thread.
+
+        Returns:
+            bool: True if the platform has a suitable signal
+        """
+        signum = getattr(signal, "SIGBREAK", None) or getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return False
+        signal.signal(signum, self.toggle)
+        log.info(f"Send {signal.Signals(signum).name} to toggle profiling")
+        return True
+
+    def on_control_message(self, msg):
+        """
+        Handle a message on PROFILE_CONTROL_TOPIC. The payload is empty for a
+        window of the default length, or JSON such as {"seconds": 60},
+        {"action": "stop"} or {"node": "<CLUSTER_NODE_ID>", ...} to profile
+        a single bridge instance.
+
+        Args:
+            msg: MQTT message object from paho-mqtt
+        """
+        data = json.loads(msg.payload) if msg.payload else {}
+        if data.get("node") not in (None, config.CLUSTER_NODE_ID):
+            return
+        if data.get("action") == "stop":
+            self.stop()
+        elif not self.start(data.get("seconds")):
+            log.warning("Profiling already in progress")
+
+
+# Shared instance for the signal handler, MQTT and Discord triggers
+profiler = SamplingProfiler()
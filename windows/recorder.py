@@ -0,0 +1,329 @@
+"""
+Session recorder and replay for the LINE UI automation.
+
+While recording, every screenshot the messenger matches a template against is
+appended to a frame store, together with every locate result, click and
+keystroke. The store is one append-only data file plus a fixed-size index:
+
+    <name>.lnrec      magic, then records: type (B), payload length (I),
+                      timestamp (d), payload
+    <name>.lnrec.idx  one entry per frame: record offset (Q), payload length (I),
+                      keyframe flag (B), 3 bytes padding
+
+Frame payloads are a (height, width, channels) header and the zlib compressed
+pixels; between keyframes the pixels are XORed with the previous frame, so an
+unchanged screen compresses to almost nothing. Event payloads are JSON.
+
+`SessionReader` memory-maps both files and decodes frames into a reused
+buffer without copying the compressed data. `ReplayScreen` feeds the
+recorded frames back to the messenger so a session runs through the same
+locate/wait logic at full speed.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+MAGIC = b"LNREC1\n\0"
+FRAME = 1
+EVENT = 2
+RECORD = struct.Struct("<BId")
+FRAME_HEADER = struct.Struct("<III")
+INDEX_ENTRY = struct.Struct("<QIB3x")
+
+# Same fields as the boxes pyautogui returns
+Box = namedtuple("Box", "left top width height")
+
+
+class SessionRecorder:
+    """
+    Append-only writer of one recorded session.
+    """
+
+    def __init__(self, path, keyframe_interval=30, level=1):
+        """
+        Create the session files.
+
+        Args:
+            path (str): Data file path, the index is written next to it
+            keyframe_interval (int): Frames between full frames
+            level (int): zlib compression level
+        """
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.level = level
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.data = open(path, "wb")
+        self.index = open(path + ".idx", "wb")
+        self.data.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.previous = None
+        self.frames = 0
+
+    def _write(self, kind, payload):
+        offset = self.offset
+        self.data.write(RECORD.pack(kind, len(payload), time.time()))
+        self.data.write(payload)
+        self.offset += RECORD.size + len(payload)
+        return offset
+
+    def frame(self, image):
+        """
+        Append a frame.
+
+        Args:
+            image (numpy.ndarray): HxWxC uint8 screenshot
+
+        Returns:
+            int: Index of the frame
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.ndim == 2:
+            image = image[:, :, None]
+        keyframe = (self.previous is None or self.previous.shape != image.shape
+                    or self.frames % self.keyframe_interval == 0)
+        pixels = image if keyframe else np.bitwise_xor(image, self.previous)
+        payload = FRAME_HEADER.pack(*image.shape) + zlib.compress(pixels.tobytes(), self.level)
+        offset = self._write(FRAME, payload)
+        self.index.write(INDEX_ENTRY.pack(offset, len(payload), keyframe))
+        self.previous = image
+        self.frames += 1
+        return self.frames - 1
+
+    def capture(self, image):
+        """
+        Append a screenshot.
+
+        Args:
+            image (PIL.Image.Image): RGB screenshot from pyautogui
+
+        Returns:
+            tuple: (BGR numpy.ndarray as used for template matching, frame index)
+        """
+        frame = np.ascontiguousarray(np.asarray(image.convert("RGB"))[:, :, ::-1])
+        return frame, self.frame(frame)
+
+    def event(self, kind, **fields):
+        """
+        Append an event, e.g. a locate result, click or keystroke.
+
+        Args:
+            kind (str): Event type
+            **fields: JSON serializable details
+        """
+        self._write(EVENT, json.dumps(dict(kind=kind, **fields)).encode())
+
+    def close(self):
+        """Flush and close the session files."""
+        self.data.close()
+        self.index.close()
+
+
+def prune(directory, keep):
+    """
+    Delete the oldest recorded sessions.
+
+    Args:
+        directory (str): Session directory
+        keep (int): Number of sessions to keep
+    """
+    sessions = sorted((os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".lnrec")),
+                      key=os.path.getmtime)
+    for session in sessions[:max(0, len(sessions) - keep)]:
+        for path in (session, session + ".idx"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def crop(frame, region):
+    """
+    Cut a (left, top, width, height) region out of a frame.
+
+    Returns:
+        numpy.ndarray: Contiguous copy of the region, the frame itself if region is None
+    """
+    if region is None:
+        return frame
+    left, top, width, height = region
+    return np.ascontiguousarray(frame[top:top + height, left:left + width])
+
+
+class SessionReader:
+    """
+    Memory-mapped reader of a recorded session.
+    """
+
+    def __init__(self, path):
+        """
+        Open a session.
+
+        Args:
+            path (str): Data file path
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a recorded session")
+        with open(path + ".idx", "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # A crash may leave a partial last entry, only complete frames count
+        self.frame_count = len(self.index) // INDEX_ENTRY.size
+        while self.frame_count and self._entry(self.frame_count - 1)[0] + RECORD.size + \
+                self._entry(self.frame_count - 1)[1] > len(self.data):
+            self.frame_count -= 1
+        self.events = list(self._read_events())
+        self.buffer = None
+        self.current = -1
+        self.decoded = 0
+
+    def __len__(self):
+        return self.frame_count
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self.index, i * INDEX_ENTRY.size)
+
+    def _read_events(self):
+        offset = len(MAGIC)
+        view = memoryview(self.data)
+        while offset + RECORD.size <= len(self.data):
+            kind, length, timestamp = RECORD.unpack_from(self.data, offset)
+            start = offset + RECORD.size
+            if start + length > len(self.data):
+                break
+            if kind == EVENT:
+                event = json.loads(bytes(view[start:start + length]))
+                event["t"] = timestamp
+                yield event
+            offset = start + length
+        view.release()
+
+    def _decode(self, i):
+        offset, length, keyframe = self._entry(i)
+        start = offset + RECORD.size
+        view = memoryview(self.data)[start:start + length]
+        try:
+            shape = FRAME_HEADER.unpack_from(view)
+            pixels = np.frombuffer(zlib.decompress(view[FRAME_HEADER.size:]), dtype=np.uint8).reshape(shape)
+        finally:
+            view.release()
+        if keyframe:
+            self.buffer = pixels.copy()
+        else:
+            np.bitwise_xor(self.buffer, pixels, out=self.buffer)
+        self.current = i
+        self.decoded += 1
+
+    def frame(self, i):
+        """
+        Decode a frame. Sequential access decodes one delta per frame,
+        random access starts from the nearest keyframe before it.
+
+        Args:
+            i (int): Frame index
+
+        Returns:
+            numpy.ndarray: Read-only view of the frame, valid until the next call
+        """
+        if not 0 <= i < self.frame_count:
+            raise IndexError(f"frame {i} out of range")
+        if i != self.current:
+            start = i
+            while start > 0 and not self._entry(start)[2]:
+                start -= 1
+            # Continue from the current frame if it lies between the keyframe and i
+            if start <= self.current < i:
+                start = self.current + 1
+            for j in range(start, i + 1):
+                self._decode(j)
+        view = self.buffer.view()
+        view.flags.writeable = False
+        return view[:, :, 0] if view.shape[2] == 1 else view
+
+    def close(self):
+        """Unmap the session files."""
+        self.data.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+
+
+class ReplayScreen:
+    """
+    Screen source that returns the recorded frames in order instead of
+    taking screenshots, and tracks where a replay departs from the recording.
+    """
+
+    def __init__(self, reader):
+        """
+        Args:
+            reader (SessionReader): The session to replay
+        """
+        self.reader = reader
+        self.lookups = [e for e in reader.events if e["kind"] in ("locate", "cached")]
+        self.position = 0
+        self.locates = 0
+        self.divergences = []
+
+    def cached(self, key):
+        """
+        Whether the recorded session used the cached location of a key at
+        this point, instead of searching the screen.
+
+        Args:
+            key (str): Cache key the messenger is about to look up
+
+        Returns:
+            Box: The cached location, or None to search the next frame
+        """
+        if self.position < len(self.lookups):
+            event = self.lookups[self.position]
+            if event["kind"] == "cached" and event["key"] == key:
+                self.position += 1
+                return Box(*event["box"])
+        return None
+
+    def grab(self, target):
+        """
+        Return the frame the next recorded locate matched against.
+
+        Args:
+            target (str): Template the messenger is about to search for
+
+        Returns:
+            numpy.ndarray: Frame, or None if the recording has no more locates
+        """
+        name = os.path.basename(target)
+        self.locates += 1
+        while self.position < len(self.lookups) and self.lookups[self.position]["kind"] == "cached":
+            self.divergences.append(f"lookup {self.position + 1}: recording used the cached "
+                                    f"{self.lookups[self.position]['key']}, replay searched {name}")
+            self.position += 1
+        if self.position >= len(self.lookups):
+            if self.position == len(self.lookups):
+                self.divergences.append(f"replay searched {name} after the end of the recording")
+                self.position += 1
+            return None
+        event = self.lookups[self.position]
+        self.position += 1
+        if event["target"] != name:
+            self.divergences.append(f"lookup {self.position}: expected {event['target']}, replay searched {name}")
+        return self.reader.frame(event["frame"])
+
+    def finish(self):
+        """
+        Record the lookups of the recording the replay never reached.
+
+        Returns:
+            list: All divergences
+        """
+        if self.position < len(self.lookups):
+            self.divergences.append(f"replay stopped after {self.position} of {len(self.lookups)} lookups")
+        return self.divergences
@@ -0,0 +1,204 @@
+"""
+Latency objective for button presses.
+
+A press that takes 40 seconds to become a LINE call is almost as bad as a
+failed one. The monitor measures every delivered press from MQTT receive to
+the end of the send (the call click for "call"), keeps rolling percentiles
+of the total and of every stage, and escalates with a critical log (and so
+to Discord) when a single press or the window's p95 goes over budget,
+naming the stages that used the time.
+
+Percentiles come from log-bucketed histograms with a fixed relative error,
+so memory stays constant however many presses the window holds. The window
+is a ring of SLO_WINDOW_SLOTS histograms; the oldest is dropped as time
+moves on.
+"""
+import math
+import time
+from collections import Counter, deque
+from threading import Lock
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("slo")
+
+# Stages of send_message(), nested in "deliver"; the rest of "deliver" is reported as "other"
+DELIVER_STAGES = ("cancel_call", "ensure_line", "navigate", "input_text", "call_click")
+TOTAL = "total"
+# Smallest distinguished latency, in seconds
+MIN_VALUE = 0.001
+
+
+class LatencySketch:
+    """
+    Histogram with logarithmic buckets: every quantile is within the given
+    relative error of the true value, and the number of buckets only grows
+    with the logarithm of the value range.
+    """
+
+    __slots__ = ("gamma", "log_gamma", "buckets", "count", "max")
+
+    def __init__(self, accuracy=None):
+        """
+        Args:
+            accuracy (float): Relative error of the quantiles, SLO_SKETCH_ACCURACY if None
+        """
+        accuracy = accuracy or config.SLO_SKETCH_ACCURACY
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, value):
+        """Add a latency in seconds."""
+        self.buckets[math.ceil(math.log(max(value, MIN_VALUE) / MIN_VALUE) / self.log_gamma)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Add the values of another sketch with the same accuracy."""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Args:
+            q (float): Quantile between 0 and 1
+
+        Returns:
+            float: Estimated value, None if the sketch is empty
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Middle of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return min(self.max, MIN_VALUE * 2 * self.gamma ** index / (self.gamma + 1))
+        return self.max
+
+
+def stage_breakdown(stages):
+    """
+    Split the time of a trace into stages that do not overlap.
+
+    Args:
+        stages (dict): Trace.stages, seconds per stage
+
+    Returns:
+        dict: Seconds per stage, "other" for the rest of the delivery
+    """
+    breakdown = {stage: seconds for stage, seconds in stages.items() if stage != "deliver"}
+    if "deliver" in stages:
+        other = stages["deliver"] - sum(stages.get(stage, 0.0) for stage in DELIVER_STAGES)
+        if other > 0:
+            breakdown["other"] = other
+    return breakdown
+
+
+def format_breakdown(breakdown, total):
+    """e.g. `navigate 12.3s (41%), queue_wait 9.0s (30%)`"""
+    parts = sorted(breakdown.items(), key=lambda item: item[1], reverse=True)
+    return ", ".join(f"{stage} {seconds:.1f}s ({seconds / total:.0%})"
+                     for stage, seconds in parts if seconds >= 0.05 * total) or "no stage data"
+
+
+class LatencyMonitor:
+    """
+    Rolling latency percentiles of delivered presses, with escalation when
+    they go over budget.
+    """
+
+    def __init__(self, window=None, slots=None, clock=time.monotonic):
+        """
+        Initialize the monitor.
+
+        Args:
+            window (float): Seconds covered by the percentiles, SLO_WINDOW if None
+            slots (int): Histograms the window is split into, SLO_WINDOW_SLOTS if None
+            clock (callable): Time source, monotonic seconds
+        """
+        self.window = window or config.SLO_WINDOW
+        self.slots = deque(maxlen=slots or config.SLO_WINDOW_SLOTS)
+        self.slot_length = self.window / self.slots.maxlen
+        self.clock = clock
+        self.breached = False
+        self.lock = Lock()
+
+    def _current_slot(self, now):
+        start = now - now % self.slot_length
+        while self.slots and self.slots[0][0] <= start - self.window:
+            self.slots.popleft()
+        if not self.slots or self.slots[-1][0] != start:
+            self.slots.append((start, {}))
+        return self.slots[-1][1]
+
+    def observe(self, trace, action, ok=True, now=None):
+        """
+        Record a finished press.
+
+        Args:
+            trace (Trace): Trace of the press, with its stage durations
+            action (str): Action that was sent, only SLO_ACTIONS are measured
+            ok (bool): Whether the send succeeded
+            now (float): Monotonic time, the clock if None
+        """
+        if action not in config.SLO_ACTIONS:
+            return
+        now = self.clock() if now is None else now
+        total = now - trace.start
+        breakdown = stage_breakdown(trace.stages)
+        with self.lock:
+            sketches = self._current_slot(now)
+            for stage, seconds in list(breakdown.items()) + [(TOTAL, total)]:
+                if stage not in sketches:
+                    sketches[stage] = LatencySketch()
+                sketches[stage].add(seconds)
+
+        if total > config.SLO_EVENT_BUDGET:
+            log.critical(f"ID {trace.trace_id} | {action} took {total:.1f}s"
+                         f"{'' if ok else ' and failed'}, budget {config.SLO_EVENT_BUDGET}s. "
+                         f"Time went to: {format_breakdown(breakdown, total)}")
+        self._check_window(now)
+
+    def summary(self, now=None):
+        """
+        Args:
+            now (float): Monotonic time, the clock if None
+
+        Returns:
+            dict: Per stage and "total", (count, p50, p95, p99) over the window
+        """
+        with self.lock:
+            self._current_slot(self.clock() if now is None else now)
+            merged = {}
+            for _, sketches in self.slots:
+                for stage, sketch in sketches.items():
+                    if stage not in merged:
+                        merged[stage] = LatencySketch()
+                    merged[stage].merge(sketch)
+        return {stage: (sketch.count, sketch.quantile(0.5), sketch.quantile(0.95), sketch.quantile(0.99))
+                for stage, sketch in merged.items()}
+
+    def _check_window(self, now):
+        summary = self.summary(now)
+        count, p50, p95, _ = summary[TOTAL]
+        minutes = self.window / 60
+        log.info(f"Press latency over the last {minutes:g}m: p50 {p50:.1f}s, p95 {p95:.1f}s (n={count})")
+        if count < config.SLO_MIN_SAMPLES:
+            return
+        if p95 > config.SLO_P95_BUDGET and not self.breached:
+            self.breached = True
+            stages = sorted(((values[2], stage) for stage, values in summary.items() if stage != TOTAL), reverse=True)
+            log.critical(f"Press latency p95 is {p95:.1f}s over the last {minutes:g}m (n={count}), "
+                         f"budget {config.SLO_P95_BUDGET}s. Stage p95: "
+                         + ", ".join(f"{stage} {seconds:.1f}s" for seconds, stage in stages[:4]))
+        elif p95 <= config.SLO_P95_BUDGET and self.breached:
+            self.breached = False
+            log.warning(f"Press latency p95 back within budget: {p95:.1f}s")
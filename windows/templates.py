@@ -0,0 +1,87 @@
+"""
+Cache of decoded template images used for screen matching.
+
+PyAutoGUI decodes the template file on every search when given a path.
+Handing it the already decoded array skips that work on every locate.
+"""
+import threading
+
+import config
+from logger import setup_logger
+
+try:
+    import cv2
+except ImportError:  # Matching without OpenCV only accepts paths
+    cv2 = None
+
+# Setup logger
+log = setup_logger("templates")
+
+# Match in grayscale, PyScreeze's default, stated so tools/calibrate_templates.py
+# scores templates exactly as every locate does
+GRAYSCALE = True
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def template_paths():
+    """
+    Returns:
+        list: Paths of every template image configured in config.py, including TARGET_GROUPS
+    """
+    return [getattr(config, key) for key in config.TEMPLATE_KEYS] + list(config.TARGET_GROUPS.values())
+
+
+def get(path):
+    """
+    Return the decoded template for a path, loading it on first use.
+
+    Args:
+        path (str): Path to the template image
+
+    Returns:
+        numpy.ndarray or str: Decoded BGR image, or the path itself if it
+            cannot be decoded so PyAutoGUI reports the problem as before
+    """
+    image = _cache.get(path)
+    if image is not None:
+        return image
+    if cv2 is None:
+        return path
+    image = cv2.imread(path, cv2.IMREAD_COLOR)
+    if image is None:
+        log.warning(f"Could not decode template {path}")
+        return path
+    with _lock:
+        _cache[path] = image
+    return image
+
+
+def preload(paths=None):
+    """
+    Decode templates ahead of the first search.
+
+    Args:
+        paths (list): Template paths, every configured template if None
+
+    Returns:
+        int: Number of templates in the cache
+    """
+    for path in paths or template_paths():
+        get(path)
+    return len(_cache)
+
+
+def invalidate(path=None):
+    """
+    Drop a template from the cache, or all of them if path is None.
+
+    Args:
+        path (str): Template path
+    """
+    with _lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
@@ -0,0 +1,111 @@
+"""
+Per-stage latency report from the JSON-lines trace logs.
+
+Streams `trace.log` and its rotated segments, gzipped ones included, line
+by line (files are never loaded into memory as a whole) and prints latency
+percentiles per stage, plus the end-to-end time from MQTT receipt to the end
+of delivery.
+
+Usage:
+    python tools/analyze_latency.py                   # logs/trace.log*
+    python tools/analyze_latency.py path/to/trace.log.2025-01-06 --stage navigate
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import glob
+import gzip
+import json
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(curr_folder), "logs")
+PERCENTILES = (50, 90, 95, 99)
+
+
+def open_segment(path):
+    """Open a trace log segment for streaming text reads, decompressing .gz segments."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def iter_spans(paths):
+    """
+    Yield every span dict from the given files, skipping malformed lines.
+    """
+    for path in paths:
+        with open_segment(path) as f:
+            for line in f:
+                if not line.startswith("{"):
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def collect(spans, stages=None):
+    """
+    Group durations by stage.
+
+    Returns:
+        tuple: ({stage: [seconds]}, {stage: failed count})
+    """
+    durations, failures = {}, {}
+    for span in spans:
+        stage = span.get("stage")
+        if stages and stage not in stages:
+            continue
+        if stage == "done" and "total" in span:
+            durations.setdefault("end_to_end", []).append(span["total"])
+            if not span.get("ok", True):
+                failures["end_to_end"] = failures.get("end_to_end", 0) + 1
+        elif "dur" in span:
+            durations.setdefault(stage, []).append(span["dur"])
+            if not span.get("ok", True):
+                failures[stage] = failures.get(stage, 0) + 1
+    return durations, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="trace log files (default: logs/trace.log*)")
+    parser.add_argument("--stage", action="append", help="only report these stages")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(DEFAULT_LOG_DIR, "trace.log*")))
+    # A segment being compressed briefly exists in both forms
+    paths = [p for p in paths if not (p.endswith(".gz") and p[:-3] in paths)]
+    if not paths:
+        print("No trace logs found")
+        return 1
+
+    stages = set(args.stage) if args.stage else None
+    if stages and "end_to_end" in stages:
+        stages.add("done")
+    durations, failures = collect(iter_spans(paths), stages)
+
+    header = f"{'stage':<14}{'count':>8}{'failed':>8}" + "".join(f"{'p' + str(q):>10}" for q in PERCENTILES) + f"{'max':>10}"
+    print(header)
+    print("-" * len(header))
+    for stage, values in sorted(durations.items(), key=lambda kv: kv[0] == "end_to_end"):
+        values.sort()
+        row = f"{stage:<14}{len(values):>8}{failures.get(stage, 0):>8}"
+        row += "".join(f"{percentile(values, q) * 1000:>8.1f}ms" for q in PERCENTILES)
+        row += f"{values[-1] * 1000:>8.1f}ms"
+        print(row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
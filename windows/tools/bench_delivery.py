@@ -0,0 +1,149 @@
+"""
+Measure alert delivery with fallback channels against a local HTTP stand-in.
+
+Two parts:
+- webhook: latency of WebhookChannel posts over pooled keep-alive
+  connections compared to a new connection per post.
+- hedging: a simulated LINE channel that is fast, slow or failing, with and
+  without the webhook fallback. Reported is the time until the alert was
+  out on some channel (LINE confirmed or the stand-in received the POST),
+  the time until deliver() returned, its result (LINE's outcome) and
+  whether the alert went out on the fallback.
+
+Usage:
+    python tools/bench_delivery.py --posts 200 --hedge-after 0.5 --line-slow 2
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import json
+import statistics
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+
+import config
+from delivery import Channel, Delivery, WebhookChannel
+from tracing import Trace
+
+
+class StandIn(ThreadingHTTPServer):
+    """Webhook receiver recording the arrival time of every alert."""
+
+    daemon_threads = True
+
+    def __init__(self, delay=0.0):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.delay = delay
+        self.lock = Lock()
+        self.received = []  # (monotonic time, payload)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/alert"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.received.append((time.monotonic(), payload))
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SimulatedLine(Channel):
+    """LINE stand-in taking a fixed time and then succeeding or failing."""
+
+    name = "line"
+
+    def __init__(self, seconds, ok):
+        self.seconds = seconds
+        self.ok = ok
+        self.confirmed_at = None
+
+    def deliver(self, action, message, trace=None, group=None, token=None):
+        time.sleep(self.seconds)
+        if self.ok:
+            self.confirmed_at = time.monotonic()
+        return self.ok
+
+
+def percentiles(values):
+    values = sorted(values)
+    return (f"p50 {statistics.median(values) * 1000:.2f}ms  "
+            f"p95 {values[int(0.95 * (len(values) - 1))] * 1000:.2f}ms  max {values[-1] * 1000:.2f}ms")
+
+
+def bench_webhook(server, posts):
+    for label, headers in (("keep-alive pool", {}), ("new connection", {"Connection": "close"})):
+        channel = WebhookChannel(server.url, headers=headers)
+        channel.warm()
+        latencies = []
+        for i in range(posts):
+            start = time.perf_counter()
+            if not channel.deliver("call", f"bench {i}"):
+                print(f"{label}: post {i} failed")
+                return
+            latencies.append(time.perf_counter() - start)
+        print(f"webhook {label:16} {percentiles(latencies)}  connections opened: {channel.connections_opened}")
+
+
+def bench_hedging(server, args):
+    config.DELIVERY_HEDGE_AFTER = args.hedge_after
+    scenarios = [("fast", args.line_fast, True), ("slow", args.line_slow, True), ("failing", args.line_fast, False)]
+    webhook = WebhookChannel(server.url)
+    webhook.warm()
+    print(f"\nhedging after {args.hedge_after}s, webhook stand-in delay {args.webhook_delay * 1000:.0f}ms")
+    for name, seconds, ok in scenarios:
+        for fallbacks in ([], [webhook]):
+            line = SimulatedLine(seconds, ok)
+            delivery = Delivery(line, fallbacks)
+            with server.lock:
+                server.received.clear()
+            trace = Trace(f"bench-{name}")
+            start = time.monotonic()
+            result = delivery.deliver("call", f"{name} press", trace=trace)
+            returned = time.monotonic() - start
+            outs = [t for t in [line.confirmed_at] + [t for t, _ in server.received] if t is not None]
+            out = f"{min(outs) - start:6.2f}s" if outs else "  never"
+            fallback = bool(server.received)
+            label = "line + webhook" if fallbacks else "line only"
+            print(f"LINE {name:8} {label:15} delivered={str(result):5} fallback={str(fallback):5} "
+                  f"alert out after {out}, deliver() returned after {returned:5.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=200, help="webhook posts per connection mode")
+    parser.add_argument("--hedge-after", type=float, default=0.5, help="override DELIVERY_HEDGE_AFTER")
+    parser.add_argument("--line-fast", type=float, default=0.2, help="seconds a normal LINE send takes")
+    parser.add_argument("--line-slow", type=float, default=2.0, help="seconds a slow LINE send takes")
+    parser.add_argument("--webhook-delay", type=float, default=0.0, help="seconds the stand-in takes to answer")
+    args = parser.parse_args()
+
+    server = StandIn(args.webhook_delay)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        bench_webhook(server, args.posts)
+        bench_hedging(server, args)
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Benchmark the device liveness monitor with many simulated devices.
+
+Drives DeviceMonitor with a simulated clock: every device reports on its
+own period with some jitter, a fraction of them dies half way through.
+Reports the cost per message and per tick of the timer wheel next to a
+naive scan of all devices every tick, and checks that exactly the dead
+devices were reported.
+
+Usage:
+    python tools/bench_device_monitor.py --devices 10000 --hours 6
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import heapq
+import random
+import time
+
+import config
+import device_monitor
+from device_monitor import DeviceMonitor
+
+
+def naive_scan(last_seen, timeouts, now):
+    """The straightforward alternative: look at every device every tick."""
+    return [d for d, seen in last_seen.items() if now - seen > timeouts[d]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--hours", type=float, default=6, help="simulated time")
+    parser.add_argument("--dead", type=float, default=0.01, help="fraction of devices that die")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    config.DEVICE_MIN_SAMPLES = 3
+    clock = [0.0]
+    monitor = DeviceMonitor(clock=lambda: clock[0])
+    # Silence the per-device alerts, only the counts are of interest here
+    device_monitor.log.disabled = True
+
+    duration = args.hours * 3600
+    periods = {f"button-{i}": rng.choice([60, 300, 600, 1200]) for i in range(args.devices)}
+    dies_at = {d: duration / 2 for d in rng.sample(sorted(periods), int(args.devices * args.dead))}
+    events = [(rng.uniform(0, p), d) for d, p in periods.items()]
+    heapq.heapify(events)
+
+    messages = 0
+    seen_time = tick_time = naive_time = 0.0
+    last_seen, timeouts = {}, {}
+    reported = set()
+    for second in range(1, int(duration) + 1):
+        while events and events[0][0] <= second:
+            at, device = heapq.heappop(events)
+            if at >= dies_at.get(device, float("inf")):
+                continue
+            clock[0] = at
+            start = time.perf_counter()
+            monitor.seen(device, at)
+            seen_time += time.perf_counter() - start
+            messages += 1
+            last_seen[device] = at
+            timeouts[device] = monitor.devices[device].timeout()
+            heapq.heappush(events, (at + periods[device] * rng.uniform(0.9, 1.1), device))
+        clock[0] = second
+        start = time.perf_counter()
+        reported.update(s.name for s in monitor.advance(second))
+        tick_time += time.perf_counter() - start
+        if second % 60 == 0:  # the naive scan is too slow to run every simulated second
+            start = time.perf_counter()
+            naive_scan(last_seen, timeouts, second)
+            naive_time += (time.perf_counter() - start) * 60
+
+    ticks = int(duration)
+    print(f"{args.devices} devices, {args.hours:g}h simulated, {messages} messages")
+    print(f"timer wheel: {seen_time / messages * 1e6:.2f}us per message, {tick_time / ticks * 1e6:.2f}us per tick")
+    print(f"naive scan:  {naive_time / ticks * 1e6:.2f}us per tick")
+    missed = set(dies_at) - reported
+    false_alarms = reported - set(dies_at)
+    print(f"dead devices: {len(dies_at)}, reported: {len(reported & set(dies_at))}, "
+          f"missed: {len(missed)}, false alarms: {len(false_alarms)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""
+Failover harness for the hot-standby cluster.
+
+Starts a local broker and two bridge instances as separate processes, each
+with the synthetic UI backend, then repeatedly takes the leader down and
+measures:
+- takeover: from the failure until the standby has become leader
+- delivery: from a press published right after the failure until it was
+  sent by the new leader
+
+Two failure modes are exercised: `kill` (SIGKILL, the broker publishes the
+last will) and `freeze` (SIGSTOP, the socket stays open so only the missing
+heartbeats reveal the hang).
+
+Usage:
+    python tools/bench_failover.py --rounds 3 --mode kill --mode freeze
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import json
+import re
+import signal
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import synthetic_ui
+from local_broker import start_local_broker
+
+EVENT_PREFIX = "EVENT "
+PRESS_TOPIC = "zigbee2mqtt/failover-press-{seq}"
+PRESS_PATTERN = re.compile(r"press-(\d+)")
+
+
+# ---- bridge instance (child process) ---------------------------------------
+
+def emit(kind, **fields):
+    # Events go to stderr so they never interleave with the log output on stdout
+    print(EVENT_PREFIX + json.dumps(dict(kind=kind, t=time.time(), **fields)), file=sys.stderr, flush=True)
+
+
+def run_node(args):
+    """Run one bridge instance with the synthetic UI until killed."""
+    messenger = synthetic_ui.install(send_delay=args.send_ms / 1000)
+    module = sys.modules["line_messenger"]
+
+    def send_message(action, msg="", trace=None, group=None, token=None):
+        started = time.time()
+        result = messenger.send_message(action, msg, trace, group, token)
+        match = PRESS_PATTERN.search(msg)
+        if match:
+            emit("sent", seq=int(match.group(1)), group=group, started=started)
+        return result
+
+    module.send_message = send_message
+
+    import config
+    config.MQTT_PORT = args.port
+    config.MQTT_BROKER = "127.0.0.1"
+    config.CLUSTER_ENABLED = True
+    config.CLUSTER_HEARTBEAT_INTERVAL = args.heartbeat
+    config.CLUSTER_FAILOVER_TIMEOUT = args.failover_timeout
+    config.OUTBOX_PATH = os.path.join(tempfile.mkdtemp(), "outbox.sqlite3")
+    config.HISTORY_PATH = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    config.IDLE_CHECK_INTERVAL = 0
+    config.CLUSTER_MODE = args.cluster_mode
+    # Devices g<n>-* report to group-<n>, all groups share the default template
+    config.TARGET_GROUPS = {f"group-{g}": config.TARGET_GROUP_NAME for g in range(args.groups)}
+    config.DEVICE_TARGET_GROUP = {f"g{g}-*": f"group-{g}" for g in range(args.groups)}
+
+    from cluster import ClusterMember
+    from message_handler import MessageHandler
+    from message_queue_processor import MessageQueueProcessor
+    from mqtt_connection import MQTTConnection
+
+    cluster = ClusterMember(node_id=args.node)
+    def on_cluster_event(kind, value):
+        if kind == "leadership":
+            emit("leader", value=value)
+        elif kind == "membership":
+            emit("members", value=list(value))
+
+    cluster.add_listener(on_cluster_event)
+    processor = MessageQueueProcessor(cluster=cluster)
+    cluster.health = processor.is_healthy
+    processor.start()
+    handler = MessageHandler(processor)
+    connection = MQTTConnection(message_callback=handler.handle_message, cluster=cluster)
+    connection.connect()
+    emit("ready")
+    connection.wait_for_messages()
+    return 0
+
+
+# ---- harness ---------------------------------------------------------------
+
+class Node:
+    """A bridge instance running in a child process."""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.events = []
+        self.proc = None
+
+    def start(self):
+        self.events = []
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--node", self.name,
+             "--port", str(self.args.port), "--send-ms", str(self.args.send_ms),
+             "--heartbeat", str(self.args.heartbeat),
+             "--failover-timeout", str(self.args.failover_timeout),
+             "--cluster-mode", getattr(self.args, "cluster_mode", "standby"),
+             "--groups", str(getattr(self.args, "groups", 0))],
+            stdout=None if self.args.verbose else subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        threading.Thread(target=self._read, daemon=True).start()
+        return self
+
+    def _read(self):
+        for line in self.proc.stderr:
+            if line.startswith(EVENT_PREFIX):
+                self.events.append(json.loads(line[len(EVENT_PREFIX):]))
+            elif self.args.verbose:
+                print(f"[{self.name}] {line}", end="", file=sys.stderr)
+
+    def is_leader(self):
+        states = [e["value"] for e in self.events if e["kind"] == "leader"]
+        return bool(states) and states[-1]
+
+    def first(self, kind, since, **fields):
+        for event in list(self.events):
+            if event["kind"] == kind and event["t"] >= since and all(event.get(k) == v for k, v in fields.items()):
+                return event
+        return None
+
+    def sent(self, seq):
+        return [e for e in list(self.events) if e["kind"] == "sent" and e["seq"] == seq]
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.send_signal(signal.SIGCONT)
+            self.proc.kill()
+            self.proc.wait()
+
+
+def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.01)
+    return None
+
+
+def run_round(mode, nodes, publisher, seq, timeout):
+    leader = wait_until(lambda: next((n for n in nodes if n.is_leader()), None), timeout)
+    if leader is None:
+        raise RuntimeError("no leader elected")
+    standby = next(n for n in nodes if n is not leader)
+
+    failed_at = time.time()
+    if mode == "kill":
+        leader.proc.kill()
+    else:
+        leader.proc.send_signal(signal.SIGSTOP)
+    pressed_at = time.time()
+    publisher.publish(PRESS_TOPIC.format(seq=seq), json.dumps({"action": "long"}))
+
+    took_over = wait_until(lambda: standby.first("leader", failed_at, value=True), timeout)
+    delivered = wait_until(lambda: standby.sent(seq), timeout)
+    takeover = took_over["t"] - failed_at if took_over else None
+    delivery = delivered[0]["t"] - pressed_at if delivered else None
+
+    # Bring the old leader back as a fresh standby for the next round
+    leader.stop()
+    leader.start()
+    wait_until(lambda: leader.first("ready", 0), timeout)
+    return leader, takeover, delivery
+
+
+def summary(name, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return f"{name}: no successful rounds"
+    return f"{name}: n={len(values)} median={statistics.median(values):.3f}s max={max(values):.3f}s"
+
+
+def run_harness(args):
+    broker = start_local_broker(prefer=args.broker)
+    args.port = broker.port
+    print(f"Using {type(broker).__name__} on port {broker.port}, "
+          f"heartbeat {args.heartbeat}s, failover timeout {args.failover_timeout}s")
+
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect("127.0.0.1", broker.port)
+    publisher.loop_start()
+
+    nodes = [Node("bridge-a", args).start(), Node("bridge-b", args).start()]
+    seq = 0
+    results = {}
+    try:
+        for mode in args.mode:
+            for i in range(args.rounds):
+                seq += 1
+                _, takeover, delivery = run_round(mode, nodes, publisher, seq, args.timeout)
+                results.setdefault(mode, []).append((takeover, delivery))
+                print(f"{mode} round {i + 1}: takeover "
+                      f"{'timeout' if takeover is None else f'{takeover:.3f}s'}, delivery "
+                      f"{'timeout' if delivery is None else f'{delivery:.3f}s'}")
+        # Let the cluster settle and check that nothing was delivered twice
+        time.sleep(args.failover_timeout)
+        duplicates = sum(1 for s in range(1, seq + 1) if sum(len(n.sent(s)) for n in nodes) > 1)
+        for mode, rounds in results.items():
+            print(summary(f"{mode} takeover", [t for t, _ in rounds]))
+            print(summary(f"{mode} delivery", [d for _, d in rounds]))
+        print(f"presses delivered twice within a process lifetime: {duplicates}")
+    finally:
+        for node in nodes:
+            node.stop()
+        publisher.loop_stop()
+        broker.stop()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--mode", action="append", choices=["kill", "freeze"],
+                        help="failure to inject (default: both)")
+    parser.add_argument("--heartbeat", type=float, default=1.0, help="seconds between heartbeats")
+    parser.add_argument("--failover-timeout", type=float, default=3.0,
+                        help="seconds without heartbeat before the leader is considered dead")
+    parser.add_argument("--send-ms", type=float, default=200, help="synthetic time per LINE send")
+    parser.add_argument("--broker", choices=["mosquitto", "inprocess"], default="mosquitto")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each step")
+    parser.add_argument("--verbose", action="store_true", help="show the instances' output")
+    parser.add_argument("--node", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--cluster-mode", default="standby", help=argparse.SUPPRESS)
+    parser.add_argument("--groups", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.node:
+        return run_node(args)
+    args.mode = args.mode or ["kill", "freeze"]
+    return run_harness(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
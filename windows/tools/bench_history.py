@@ -0,0 +1,84 @@
+"""
+Measure the event history: cost of recording an event on the processor's
+thread, batched write throughput, and latency of the queries behind the
+/presses and /failed_sends Discord commands on a filled database.
+
+Usage:
+    python tools/bench_history.py --events 1000000 --devices 50
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+import config
+from history import EventHistory, day_start
+
+
+def timed(func, rounds):
+    """Median milliseconds of a call."""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000, help="events spread over the last year")
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--rounds", type=int, default=20, help="repetitions of every query")
+    args = parser.parse_args()
+
+    config.HISTORY_QUEUE_SIZE = args.events
+    path = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    history = EventHistory(path, flush_interval=3600)
+    history.start()
+
+    now = time.time()
+    rng = random.Random(1)
+    devices = [f"button-{i}" for i in range(args.devices)]
+    actions = ["call"] * 8 + ["cancel"] + ["debug"]
+    rows = [(rng.choice(devices), rng.choice(actions), rng.random() >= args.failure_rate,
+             now - rng.random() * 365 * 24 * 3600) for _ in range(args.events)]
+
+    start = time.perf_counter()
+    for device, action, ok, at in rows:
+        history.record(device, action, ok, latency=1.5, trace_id="bench", message="press", at=at)
+    record_us = (time.perf_counter() - start) * 1e6 / args.events
+    start = time.perf_counter()
+    history.flush()
+    write_s = time.perf_counter() - start
+    print(f"record(): {record_us:.2f}us per event on the caller's thread")
+    print(f"batched write: {args.events} events in {write_s:.2f}s ({args.events / write_s:,.0f}/s), "
+          f"{os.path.getsize(path) / 2 ** 20:.0f}MiB")
+
+    for label, sql, params in (
+            ("presses last 7 days", "SELECT device, action, COUNT(*), SUM(ok = 0) FROM events "
+                                    "WHERE time >= ? AND time < ? GROUP BY device, action", (day_start(6), now)),
+            ("failed sends today", "SELECT time, device, action, group_name, trace_id FROM events "
+                                   "WHERE ok = 0 AND time >= ? ORDER BY time DESC LIMIT ?", (day_start(0), 20))):
+        plan = "; ".join(row[-1] for row in history.reader.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+        print(f"{label}: {plan}")
+
+    print(f"/presses 7 days:      {timed(lambda: history.presses_per_device(day_start(6)), args.rounds):.2f}ms")
+    print(f"/presses 365 days:    {timed(lambda: history.presses_per_device(day_start(364)), args.rounds):.2f}ms")
+    print(f"/failed_sends today:  {timed(lambda: history.failures(day_start(0)), args.rounds):.2f}ms")
+    print(f"/failed_sends 7 days: {timed(lambda: history.failures(day_start(6)), args.rounds):.2f}ms")
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
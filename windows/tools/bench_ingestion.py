@@ -0,0 +1,220 @@
+"""
+MQTT ingestion throughput benchmark.
+
+Starts a local broker, runs MQTTConnection + MessageHandler +
+MessageQueueProcessor against it with the synthetic UI backend, and publishes
+a realistic zigbee2mqtt traffic mix at a controlled rate. Reports per-stage
+latency (publish -> MQTT callback -> enqueue) and drop rate.
+
+Usage:
+    python tools/bench_ingestion.py --rate 200 --duration 10
+    python tools/bench_ingestion.py --rate 50 --send-ms 2000 --mix button=1
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import json
+import random
+import tempfile
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import synthetic_ui
+from local_broker import start_local_broker
+
+DEFAULT_MIX = "button=0.1,state=0.75,logging=0.14,devices=0.01"
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class TrafficMix:
+    """
+    Generates zigbee2mqtt-like messages: button presses, periodic device
+    state reports, bridge logging and the large `bridge/devices` dump.
+    """
+
+    def __init__(self, weights, n_devices=40, seed=0):
+        self.random = random.Random(seed)
+        self.kinds = list(weights)
+        self.weights = [weights[k] for k in self.kinds]
+        self.devices_payload = json.dumps([self._device_definition(i) for i in range(n_devices)]).encode()
+        self.n_devices = n_devices
+
+    def _device_definition(self, i):
+        return {
+            "ieee_address": f"0x00124b00{i:08x}",
+            "friendly_name": f"device-{i}",
+            "type": "EndDevice",
+            "power_source": "Battery",
+            "model_id": "WB01",
+            "definition": {
+                "model": "SNZB-01", "vendor": "SONOFF", "description": "Wireless button",
+                "exposes": [{"name": name, "type": "numeric", "access": 1}
+                            for name in ("battery", "voltage", "linkquality")]
+                           + [{"name": "action", "type": "enum", "values": ["single", "double", "long"]}],
+            },
+            "endpoints": {"1": {"bindings": [], "clusters": {"input": ["genBasic", "genPowerCfg"],
+                                                             "output": ["genOnOff"]}}},
+        }
+
+    def next(self, seq):
+        """
+        Returns:
+            tuple: (kind, topic, payload bytes)
+        """
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        device = self.random.randrange(self.n_devices)
+        if kind == "button":
+            payload = {"action": self.random.choice(["single", "double", "long"]),
+                       "battery": self.random.randint(20, 100),
+                       "voltage": self.random.randint(2300, 3100),
+                       "linkquality": self.random.randint(30, 255)}
+            return kind, f"zigbee2mqtt/bench-button-{seq}", json.dumps(payload).encode()
+        if kind == "state":
+            payload = {"battery": 87, "voltage": 3000, "linkquality": self.random.randint(30, 255),
+                       "temperature": 23.4, "humidity": 55.1}
+            return kind, f"zigbee2mqtt/device-{device}", json.dumps(payload).encode()
+        if kind == "logging":
+            payload = {"level": "info",
+                       "message": f"MQTT publish: topic 'zigbee2mqtt/device-{device}', payload '{{}}'"}
+            return kind, "zigbee2mqtt/bridge/logging", json.dumps(payload).encode()
+        return kind, "zigbee2mqtt/bridge/devices", self.devices_payload
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight)
+    unknown = set(weights) - {"button", "state", "logging", "devices"}
+    if unknown:
+        raise ValueError(f"Unknown traffic kinds: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=200, help="messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of publishing")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"traffic weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--send-ms", type=float, default=0, help="synthetic time per LINE send")
+    parser.add_argument("--broker", choices=["mosquitto", "inprocess"], default="mosquitto")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The synthetic backend must be installed before the bridge modules are imported
+    synthetic_ui.install(send_delay=args.send_ms / 1000)
+    import config
+    config.OUTBOX_PATH = os.path.join(tempfile.mkdtemp(), "outbox.sqlite3")
+    config.HISTORY_PATH = os.path.join(tempfile.mkdtemp(), "history.sqlite3")
+    from mqtt_connection import MQTTConnection
+    from message_handler import MessageHandler
+    from message_queue_processor import MessageQueueProcessor
+
+    broker = start_local_broker(prefer=args.broker)
+    print(f"Using {type(broker).__name__} on port {broker.port}")
+
+    published = {}      # seq -> publish time, button presses only
+    received = {}       # topic -> receive time, button presses only
+    enqueued = {}       # seq -> (enqueue time, accepted)
+    lock = threading.Lock()
+    max_depth = 0
+
+    processor = MessageQueueProcessor()
+    enqueue_message = processor.enqueue_message
+
+    def timed_enqueue(identifier, action, message, **kwargs):
+        nonlocal max_depth
+        accepted = enqueue_message(identifier, action, message, **kwargs)
+        now = time.monotonic()
+        topic = identifier.split(" - ", 1)[-1]
+        if "bench-button-" in topic:
+            with lock:
+                enqueued[int(topic.rsplit("-", 1)[-1])] = (now, accepted)
+                max_depth = max(max_depth, processor.queue.qsize())
+        return accepted
+
+    processor.enqueue_message = timed_enqueue
+    processor.start()
+    handler = MessageHandler(processor)
+
+    def timed_handle(msg):
+        if "bench-button-" in msg.topic:
+            received[msg.topic] = time.monotonic()
+        handler.handle_message(msg)
+
+    connection = MQTTConnection(broker="127.0.0.1", port=broker.port, topic="zigbee2mqtt/#",
+                                message_callback=timed_handle)
+    if not connection.connect():
+        print("Could not connect to local broker")
+        return 1
+
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect("127.0.0.1", broker.port)
+    publisher.loop_start()
+
+    mix = TrafficMix(parse_mix(args.mix), seed=args.seed)
+    counts = {}
+    interval = 1.0 / args.rate
+    start = time.monotonic()
+    seq = 0
+    while True:
+        target = start + seq * interval
+        now = time.monotonic()
+        if now - start >= args.duration:
+            break
+        if target > now:
+            time.sleep(target - now)
+        kind, topic, payload = mix.next(seq)
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind == "button":
+            published[seq] = time.monotonic()
+        publisher.publish(topic, payload)
+        seq += 1
+    publish_elapsed = time.monotonic() - start
+
+    # Give the pipeline time to drain what is still in flight
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and len(enqueued) < len(published):
+        time.sleep(0.05)
+
+    publisher.loop_stop()
+    publisher.disconnect()
+    connection.disconnect()
+    processor.stop()
+    broker.stop()
+
+    receive_latency = sorted((received[f"zigbee2mqtt/bench-button-{s}"] - t) * 1000
+                             for s, t in published.items() if f"zigbee2mqtt/bench-button-{s}" in received)
+    enqueue_latency = sorted((enqueued[s][0] - t) * 1000 for s, t in published.items() if s in enqueued)
+    rejected = sum(1 for _, accepted in enqueued.values() if not accepted)
+    lost = len(published) - len(enqueued)
+
+    print(f"\nPublished {seq} messages in {publish_elapsed:.1f}s ({seq / publish_elapsed:.0f} msg/s): "
+          + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+    for name, values in (("publish -> callback", receive_latency), ("publish -> enqueue", enqueue_latency)):
+        print(f"{name:>20}: n={len(values)} p50={percentile(values, 50):.2f}ms "
+              f"p95={percentile(values, 95):.2f}ms p99={percentile(values, 99):.2f}ms "
+              f"max={max(values, default=float('nan')):.2f}ms")
+    total = max(len(published), 1)
+    print(f"Button presses: {len(published)}, enqueued {len(enqueued) - rejected}, "
+          f"rejected by full queue {rejected} ({rejected / total:.1%}), "
+          f"never reached the queue {lost} ({lost / total:.1%}), max queue depth {max_depth}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""
+Measure the per-call cost of logging on the calling thread.
+
+Compares the previous setup (console and rotating file handlers attached
+directly to the logger, f-string messages) with the queue-based setup
+(records handed to the background listener, lazy %-style arguments).
+Console output goes to os.devnull and log files to a temporary directory.
+
+Usage:
+    python tools/bench_logging.py --calls 20000
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import importlib
+import tempfile
+import time
+
+import config
+from logger import setup_logger
+
+setup_module = importlib.import_module("logger.setup_logger")
+
+
+def make_logger(name, use_queue):
+    config.LOG_ASYNC = use_queue
+    return setup_logger(name, dc_output=False)
+
+
+def run(log, calls, lazy, burst=50):
+    """
+    Time `calls` debug calls issued in bursts, letting the listener drain
+    between bursts (untimed), as on the emergency path where log calls come
+    in short bursts between screen searches.
+
+    Returns:
+        float: Microseconds per call on the calling thread
+    """
+    target, confidence = "images/group-tab.png", 0.95
+    elapsed = 0.0
+    for first in range(0, calls, burst):
+        start = time.perf_counter()
+        if lazy:
+            for i in range(first, first + burst):
+                log.debug("Looking for %s with confidence %s, attempt %d", target, confidence, i)
+        else:
+            for i in range(first, first + burst):
+                log.debug(f"Looking for {target} with confidence {confidence}, attempt {i}")
+        elapsed += time.perf_counter() - start
+        while not setup_module.log_queue.empty():
+            time.sleep(0.0005)
+    return elapsed / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    setup_module.log_dir = tempfile.mkdtemp()
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w", encoding="utf-8")
+    try:
+        direct = make_logger("bench_direct", use_queue=False)
+        queued = make_logger("bench_queued", use_queue=True)
+        results = {
+            "direct handlers, f-string": run(direct, args.calls, lazy=False),
+            "queue listener,  f-string": run(queued, args.calls, lazy=False),
+            "queue listener,  lazy args": run(queued, args.calls, lazy=True),
+        }
+        setup_module.log_listener.stop()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for name, us in results.items():
+        print(f"{name}: {us:.2f} us/call")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
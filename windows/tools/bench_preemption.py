@@ -0,0 +1,83 @@
+"""
+Measure how long an urgent press waits for the send in progress.
+
+Runs MessageQueueProcessor with the synthetic UI backend, whose sends take
+--send-ms and stop early when their job is cancelled, like the messenger at
+its checkpoints. For each scenario a first message is being sent when a more
+urgent one arrives; the time from enqueueing the urgent message until its
+send starts is reported with PREEMPT_ENABLED off and on.
+
+Usage:
+    python tools/bench_preemption.py --send-ms 3000 --rounds 5
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import statistics
+import time
+
+import synthetic_ui
+
+SCENARIOS = (
+    # (label, first message, urgent message)
+    ("call during a debug send", ("debug", None), ("call", None)),
+    ("cancel during its call", ("call", "ops"), ("cancel", "ops")),
+    ("cancel during another group's call", ("call", "ops"), ("cancel", "office")),
+)
+
+
+def run(processor, messenger, first, urgent, arrive_after):
+    """
+    Returns:
+        tuple: (seconds until the urgent message's send started, actions sent in order)
+    """
+    messenger.sent.clear()
+    processor.enqueue_message("bench - first", first[0], "first", group=first[1])
+    time.sleep(arrive_after)
+    enqueued = time.monotonic()
+    processor.enqueue_message("bench - urgent", urgent[0], "urgent", group=urgent[1])
+    processor.wait_completion()
+    sent = list(messenger.sent)
+    urgent_at = next(at for at, _, message, _ in sent if message == "urgent")
+    return urgent_at - messenger.send_delay - enqueued, [f"{action}:{message}" for _, action, message, _ in sent]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--send-ms", type=float, default=3000, help="duration of every synthetic send")
+    parser.add_argument("--arrive-ms", type=float, default=500, help="when the urgent message arrives")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    messenger = synthetic_ui.install(send_delay=args.send_ms / 1000)
+    import config
+    config.OUTBOX_ENABLED = False
+    config.SLO_ENABLED = False
+    config.HISTORY_ENABLED = False
+    config.DELIVERY_FALLBACKS = ()
+    config.IDLE_CHECK_INTERVAL = 0
+    from message_queue_processor import MessageQueueProcessor
+
+    processor = MessageQueueProcessor()
+    processor.start()
+    print(f"sends take {args.send_ms:.0f}ms, the urgent message arrives {args.arrive_ms:.0f}ms into the first")
+    for label, first, urgent in SCENARIOS:
+        for enabled in (False, True):
+            config.PREEMPT_ENABLED = enabled
+            waits = []
+            for _ in range(args.rounds):
+                wait, order = run(processor, messenger, first, urgent, args.arrive_ms / 1000)
+                waits.append(wait)
+            print(f"{label:36} preempt {'on ' if enabled else 'off'}: urgent started after "
+                  f"{statistics.median(waits) * 1000:6.0f}ms, order {' '.join(order)}")
+    processor.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
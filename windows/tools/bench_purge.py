@@ -0,0 +1,133 @@
+"""
+Benchmark the log purge against a local stand-in for the Discord API.
+
+The fake channel pages history 100 messages per request and enforces
+per-route rate-limit buckets the way Discord does: a request beyond the
+bucket waits out the reset (as discord.py does after a 429) plus a penalty.
+Compares the previous sequential algorithm of /delete_time_range with
+logger.purge.purge_messages.
+
+Usage:
+    python tools/bench_purge.py --recent 600 --old 150
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import asyncio
+import importlib
+import time
+from datetime import datetime, timedelta, timezone
+
+purge = importlib.import_module("logger.purge")
+
+
+class FakeBucket:
+    """Discord-style rate-limit bucket: `limit` requests per `reset` seconds."""
+
+    def __init__(self, limit, reset, penalty):
+        self.limit, self.reset, self.penalty = limit, reset, penalty
+        self.window_start = 0.0
+        self.used = 0
+        self.limited = 0
+
+    async def request(self, latency):
+        now = time.monotonic()
+        if now - self.window_start >= self.reset:
+            self.window_start, self.used = now, 0
+        if self.used >= self.limit:
+            # 429: wait for the bucket to reset, plus the retry penalty
+            self.limited += 1
+            await asyncio.sleep(self.window_start + self.reset - now + self.penalty)
+            return await self.request(latency)
+        self.used += 1
+        await asyncio.sleep(latency)
+
+
+class FakeMessage:
+    def __init__(self, channel, created_at):
+        self.channel = channel
+        self.created_at = created_at
+        self.author = None
+
+    async def delete(self):
+        await self.channel.delete_bucket.request(self.channel.latency)
+        self.channel.deleted += 1
+
+
+class FakeChannel:
+    def __init__(self, recent, old, latency, penalty):
+        now = datetime.now(timezone.utc)
+        self.messages = ([FakeMessage(self, now - timedelta(minutes=i)) for i in range(recent)]
+                         + [FakeMessage(self, now - timedelta(days=20, minutes=i)) for i in range(old)])
+        self.latency = latency
+        self.deleted = 0
+        self.history_bucket = FakeBucket(5, 1.0, penalty)
+        self.delete_bucket = FakeBucket(5, 1.0, penalty)
+        self.bulk_bucket = FakeBucket(1, 1.0, penalty)
+
+    async def history(self, limit=None):
+        for page_start in range(0, min(limit or len(self.messages), len(self.messages)), 100):
+            await self.history_bucket.request(self.latency)
+            for message in self.messages[page_start:page_start + 100]:
+                yield message
+
+    async def delete_messages(self, messages):
+        if not 2 <= len(messages) <= 100:
+            raise ValueError("bulk delete needs 2-100 messages")
+        await self.bulk_bucket.request(self.latency)
+        self.deleted += len(messages)
+
+
+async def sequential_purge(channel):
+    """The previous /delete_time_range loop, without the Discord interaction."""
+    bulk_eligible = []
+    async for message in channel.history(limit=None):
+        two_weeks_ago = datetime.now(timezone.utc) - timedelta(days=14)
+        if message.created_at > two_weeks_ago:
+            bulk_eligible.append(message)
+            if len(bulk_eligible) >= 100:
+                await channel.delete_messages(bulk_eligible)
+                bulk_eligible = []
+        else:
+            await message.delete()
+    if len(bulk_eligible) == 1:
+        await bulk_eligible[0].delete()
+    elif bulk_eligible:
+        await channel.delete_messages(bulk_eligible)
+
+
+async def run(args):
+    results = {}
+    for name in ("sequential", "purge_messages"):
+        channel = FakeChannel(args.recent, args.old, args.latency / 1000, args.penalty)
+        start = time.monotonic()
+        if name == "sequential":
+            await sequential_purge(channel)
+        else:
+            await purge.purge_messages(channel, channel.history(limit=None))
+        elapsed = time.monotonic() - start
+        limited = (channel.history_bucket.limited + channel.delete_bucket.limited
+                   + channel.bulk_bucket.limited)
+        results[name] = elapsed
+        print(f"{name:>15}: deleted {channel.deleted}/{len(channel.messages)} in {elapsed:.2f}s, "
+              f"{limited} rate-limited requests")
+    print(f"speedup: {results['sequential'] / results['purge_messages']:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recent", type=int, default=600, help="messages younger than 14 days")
+    parser.add_argument("--old", type=int, default=150, help="messages older than 14 days")
+    parser.add_argument("--latency", type=float, default=80, help="API round trip in ms")
+    parser.add_argument("--penalty", type=float, default=0.5, help="extra seconds lost per 429")
+    asyncio.run(run(parser.parse_args()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Measure how fast MQTTConnection recovers when the broker goes away.
+
+Two scenarios against a local broker:
+- restart: the broker is killed, kept down for a while and restarted;
+  time-to-recover is measured from the restart until the client is
+  subscribed again.
+- half-open (in-process broker only): the broker silently stops serving
+  the connection while the socket stays open; time-to-recover is measured
+  from the freeze until the watchdog has reconnected.
+
+Usage:
+    python tools/bench_reconnect.py --rounds 5 --downtime 2
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import statistics
+import time
+
+import config
+from mqtt_connection import MQTTConnection
+from local_broker import InProcessBroker, start_local_broker
+
+
+def wait_until(predicate, timeout):
+    """Poll a predicate, returning the elapsed time or None on timeout."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if predicate():
+            return time.monotonic() - start
+        time.sleep(0.005)
+    return None
+
+
+def bench_restart(broker, connection, rounds, downtime):
+    results = []
+    for i in range(rounds):
+        broker.kill()
+        wait_until(lambda: not connection.connected.is_set(), timeout=30)
+        time.sleep(downtime)
+        broker.start()
+        recovered = wait_until(connection.connected.is_set, timeout=120)
+        print(f"restart round {i + 1}: recovered in "
+              f"{'timeout' if recovered is None else f'{recovered:.3f}s'}")
+        if recovered is not None:
+            results.append(recovered)
+    return results
+
+
+def bench_half_open(broker, connection, connects, rounds):
+    results = []
+    for i in range(rounds):
+        seen = len(connects)
+        frozen_at = time.monotonic()
+        broker.freeze_connections()
+        recovered = wait_until(lambda: len(connects) > seen, timeout=120)
+        if recovered is not None:
+            recovered = connects[seen] - frozen_at
+        print(f"half-open round {i + 1}: recovered in "
+              f"{'timeout' if recovered is None else f'{recovered:.3f}s'}")
+        if recovered is not None:
+            results.append(recovered)
+    return results
+
+
+def summary(name, results):
+    if not results:
+        print(f"{name}: no successful recoveries")
+        return
+    print(f"{name}: n={len(results)} median={statistics.median(results):.3f}s "
+          f"max={max(results):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--downtime", type=float, default=2.0, help="seconds the broker stays down")
+    parser.add_argument("--broker", choices=["mosquitto", "inprocess"], default="mosquitto")
+    parser.add_argument("--silence", type=float, default=2.0,
+                        help="override MQTT_WATCHDOG_SILENCE for the half-open scenario")
+    args = parser.parse_args()
+
+    config.MQTT_WATCHDOG_SILENCE = args.silence
+    config.MQTT_WATCHDOG_PROBE_TIMEOUT = min(config.MQTT_WATCHDOG_PROBE_TIMEOUT, args.silence)
+
+    broker = start_local_broker(prefer=args.broker)
+    print(f"Using {type(broker).__name__} on port {broker.port}")
+    connection = MQTTConnection(broker="127.0.0.1", port=broker.port, topic="zigbee2mqtt/#")
+
+    # Record the time of every successful (re)connection
+    connects = []
+    on_connect = connection._on_connect
+
+    def record_connect(*args, **kwargs):
+        on_connect(*args, **kwargs)
+        if connection.connected.is_set():
+            connects.append(time.monotonic())
+
+    connection._on_connect = record_connect
+    if not connection.connect():
+        print("Could not connect to local broker")
+        return 1
+
+    try:
+        summary("restart", bench_restart(broker, connection, args.rounds, args.downtime))
+        if isinstance(broker, InProcessBroker):
+            summary("half-open", bench_half_open(broker, connection, connects, args.rounds))
+        else:
+            print("half-open scenario needs --broker inprocess, skipped")
+    finally:
+        connection.disconnect()
+        broker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""
+Scale-out benchmark for partitioned delivery across several bridge hosts.
+
+Runs 1, 2, 4, ... bridge instances as processes on this machine, each with
+the synthetic UI backend standing in for its own LINE desktop, in
+CLUSTER_MODE "partitioned". A burst of presses spread over many target
+groups is published and the time until all of them were delivered is
+measured. Also checks that every group was delivered in publish order and
+that nothing was delivered twice.
+
+Usage:
+    python tools/bench_scaleout.py --hosts 1 --hosts 2 --hosts 4 --presses 96 --groups 16
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import json
+import time
+from collections import Counter
+
+import paho.mqtt.client as mqtt
+
+from bench_failover import Node, wait_until
+from local_broker import start_local_broker
+
+
+def run_cluster(hosts, args):
+    """
+    Publish the burst against `hosts` instances.
+
+    Returns:
+        dict: elapsed seconds, presses delivered, duplicates, groups out of order, groups per host
+    """
+    broker = start_local_broker(prefer=args.broker)
+    args.port = broker.port
+    publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    publisher.connect("127.0.0.1", broker.port)
+    publisher.loop_start()
+    nodes = [Node(f"bridge-{chr(ord('a') + i)}", args).start() for i in range(hosts)]
+    try:
+        def converged():
+            views = [[e["value"] for e in n.events if e["kind"] == "members"] for n in nodes]
+            return all(v and len(v[-1]) == hosts for v in views)
+        if not wait_until(converged, args.timeout):
+            raise RuntimeError("instances did not see each other")
+        time.sleep(2 * args.heartbeat + 0.5)  # until every instance has settled
+
+        started = time.time()
+        for seq in range(args.presses):
+            group = seq % args.groups
+            publisher.publish(f"zigbee2mqtt/g{group}-press-{seq}", json.dumps({"action": "long"}))
+
+        def all_sent():
+            return {e["seq"] for n in nodes for e in list(n.events) if e["kind"] == "sent"} >= set(range(args.presses))
+        wait_until(all_sent, args.timeout)
+
+        sent = [dict(e, node=n.name) for n in nodes for e in list(n.events) if e["kind"] == "sent"]
+        elapsed = max((e["t"] for e in sent), default=started) - started
+        counts = Counter(e["seq"] for e in sent)
+        out_of_order = 0
+        for group in range(args.groups):
+            seqs = [e["seq"] for e in sorted(sent, key=lambda e: e["started"]) if e["group"] == f"group-{group}"]
+            out_of_order += seqs != sorted(seqs)
+        owners = Counter(e["node"] for e in sent)
+        return {"elapsed": elapsed, "delivered": len(counts),
+                "duplicates": sum(1 for c in counts.values() if c > 1),
+                "out_of_order": out_of_order, "per_host": dict(sorted(owners.items()))}
+    finally:
+        for node in nodes:
+            node.stop()
+        publisher.loop_stop()
+        broker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, action="append", help="instances to run (default: 1, 2, 4)")
+    parser.add_argument("--presses", type=int, default=96)
+    parser.add_argument("--groups", type=int, default=16)
+    parser.add_argument("--send-ms", type=float, default=200, help="synthetic time per LINE send")
+    parser.add_argument("--heartbeat", type=float, default=0.5, help="seconds between heartbeats")
+    parser.add_argument("--failover-timeout", type=float, default=3.0)
+    parser.add_argument("--broker", choices=["mosquitto", "inprocess"], default="mosquitto")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for each step")
+    parser.add_argument("--verbose", action="store_true", help="show the instances' output")
+    args = parser.parse_args()
+    args.cluster_mode = "partitioned"
+
+    baseline = None
+    for hosts in args.hosts or [1, 2, 4]:
+        result = run_cluster(hosts, args)
+        throughput = result["delivered"] / result["elapsed"] if result["elapsed"] else 0
+        baseline = baseline or throughput
+        print(f"{hosts} host(s): {result['delivered']}/{args.presses} delivered in {result['elapsed']:.2f}s, "
+              f"{throughput:.1f}/s ({throughput / baseline:.2f}x), duplicates {result['duplicates']}, "
+              f"groups out of order {result['out_of_order']}, per host {result['per_host']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
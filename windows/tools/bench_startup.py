@@ -0,0 +1,57 @@
+"""
+Measure the import-time cost of the logger package.
+
+Each mode runs in a fresh interpreter:
+- lazy: `import logger` and `setup_logger()`, the Discord integration is not loaded
+- eager: the same plus loading the Discord integration, as importing
+  `logger` used to do (the bot itself is not started, no network is used)
+
+Usage:
+    python tools/bench_startup.py --runs 10
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+import statistics
+import subprocess
+
+SNIPPETS = {
+    "lazy": "from logger import setup_logger; setup_logger('bench_startup')",
+    "eager": "from logger import setup_logger; setup_logger('bench_startup'); "
+             "import logger.discord_bot_handler",
+}
+
+TEMPLATE = """
+import sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+{snippet}
+print(time.perf_counter() - start)
+print('discord' in sys.modules)
+"""
+
+
+def run_once(snippet):
+    out = subprocess.run([sys.executable, "-c", TEMPLATE.format(path=curr_folder, snippet=snippet)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[-2]), out[-1] == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    for mode, snippet in SNIPPETS.items():
+        results = [run_once(snippet) for _ in range(args.runs)]
+        times = [t * 1000 for t, _ in results]
+        print(f"{mode:>5}: median={statistics.median(times):.1f}ms min={min(times):.1f}ms "
+              f"discord imported={results[0][1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
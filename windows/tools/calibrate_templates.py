@@ -0,0 +1,256 @@
+"""
+Calibrate the match confidence and search region of every template.
+
+Every template configured in config.py (including TARGET_GROUPS) is matched
+against a set of labelled screenshots with the same score PyAutoGUI uses,
+in grayscale unless templates.GRAYSCALE is off.
+The score at the labelled location is a true match; the best score anywhere
+else, or anywhere on a screenshot the template is not on, is a false one.
+Per template the tool picks:
+
+- confidence: three quarters of the way from the best false to the worst
+  true match, so a first attempt leans towards not clicking a wrong element
+- floor: the lowest confidence a retry may decay to, halfway between them
+- region: the part of the screen the template was ever found in
+
+and writes them with the measured match time to CALIBRATION_PATH, which
+the messenger loads at startup. Templates whose true and false matches
+overlap are set to avoid the false ones and reported with their misses.
+
+Screenshots are PNG files next to a labels.json:
+
+    {
+        "main-window.png": {"group-tab.png": [12, 80, 28, 34], "input-box.png": true},
+        "call-window.png": {"cancel-call.png": [640, 512, 48, 48]}
+    }
+
+A box is [left, top, width, height] of the template's match; true means
+present at its best match. Templates not listed for a screenshot are not
+on it. --draft writes a labels.json from the current matches to start from.
+
+Usage:
+    python tools/calibrate_templates.py screenshots/ --draft
+    python tools/calibrate_templates.py screenshots/
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import json
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+import config
+import templates
+from calibration import template_hash
+
+# Window around a labelled location in which scores count as the true match
+POSITION_TOLERANCE = 3
+# A region larger than this part of the screen is no better than the whole screen
+REGION_MAX_FRACTION = 0.25
+DRAFT_CONFIDENCE = 0.9
+MAX_CONFIDENCE = 0.9999
+
+
+def prepare(image):
+    """Convert a BGR image to what PyScreeze matches, grayscale by default."""
+    if templates.GRAYSCALE and image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def match(screenshot, template):
+    """Scores of every template position, as PyAutoGUI computes them."""
+    return cv2.matchTemplate(screenshot, template, cv2.TM_CCOEFF_NORMED)
+
+
+def best(scores, exclude=None):
+    """
+    Args:
+        scores (numpy.ndarray): Output of match()
+        exclude (tuple): (left, top, right, bottom) of positions to ignore
+
+    Returns:
+        tuple: (score, (left, top)) of the best position
+    """
+    if exclude is not None:
+        scores = scores.copy()
+        left, top, right, bottom = exclude
+        scores[max(0, top):max(0, bottom), max(0, left):max(0, right)] = -1.0
+    _, score, _, location = cv2.minMaxLoc(scores)
+    return float(score), location
+
+
+def timed(func, rounds=5):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def load_screenshots(directory, labels):
+    shots = {}
+    for name in labels:
+        image = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Could not read {name}, skipped")
+            continue
+        shots[name] = prepare(image)
+    return shots
+
+
+def draft(directory, labels_path, template_paths):
+    """Write labels.json with every template matching above DRAFT_CONFIDENCE."""
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(".png"))
+    shots = load_screenshots(directory, names)
+    labels = {}
+    for name, shot in shots.items():
+        labels[name] = {}
+        for path in template_paths:
+            template = prepare(templates.get(path))
+            if template.shape[0] > shot.shape[0] or template.shape[1] > shot.shape[1]:
+                continue
+            score, (left, top) = best(match(shot, template))
+            if score >= DRAFT_CONFIDENCE:
+                labels[name][os.path.basename(path)] = [left, top, template.shape[1], template.shape[0]]
+    with open(labels_path, "w", encoding="utf-8") as f:
+        json.dump(labels, f, indent=2)
+    print(f"Wrote draft labels of {len(labels)} screenshots to {labels_path}, check them before calibrating")
+
+
+def calibrate(path, shots, labels):
+    """
+    Calibrate one template.
+
+    Returns:
+        dict: Profile entry, None if the template is on none of the screenshots
+    """
+    name = os.path.basename(path)
+    template = prepare(templates.get(path))
+    height, width = template.shape[:2]
+    positives, negatives, boxes, sizes = [], [], [], set()
+    for shot_name, shot in shots.items():
+        if height > shot.shape[0] or width > shot.shape[1]:
+            continue
+        scores = match(shot, template)
+        label = labels[shot_name].get(name)
+        if not label:
+            negatives.append(best(scores)[0])
+            continue
+        if label is True:
+            score, (left, top) = best(scores)
+        else:
+            left, top = label[0], label[1]
+            t = POSITION_TOLERANCE
+            score = float(scores[max(0, top - t):top + t + 1, max(0, left - t):left + t + 1].max())
+        positives.append(score)
+        boxes.append((left, top, width, height))
+        sizes.add(shot.shape[:2])
+        # Positions overlapping the element itself would click it anyway
+        negatives.append(best(scores, (left - width // 2, top - height // 2,
+                                       left + width // 2 + 1, top + height // 2 + 1))[0])
+    if not positives:
+        return None
+
+    worst_positive, best_negative = min(positives), max(negatives)
+    if worst_positive > best_negative:
+        gap = worst_positive - best_negative
+        confidence = best_negative + gap * 3 / 4
+        floor = best_negative + gap / 2
+    else:
+        # No threshold separates them: never match a wrong element, accept misses
+        confidence = floor = best_negative + 0.001
+    confidence, floor = min(confidence, MAX_CONFIDENCE), min(floor, MAX_CONFIDENCE)
+
+    region = None
+    if len(sizes) == 1:
+        screen_height, screen_width = sizes.pop()
+        margin = config.UI_HINT_MARGIN
+        left = max(0, min(b[0] for b in boxes) - margin)
+        top = max(0, min(b[1] for b in boxes) - margin)
+        right = min(screen_width, max(b[0] + b[2] for b in boxes) + margin)
+        bottom = min(screen_height, max(b[1] + b[3] for b in boxes) + margin)
+        if (right - left) * (bottom - top) <= REGION_MAX_FRACTION * screen_width * screen_height:
+            region = [left, top, right - left, bottom - top]
+
+    shot = next(iter(shots.values()))
+    match_ms = timed(lambda: match(shot, template))
+    region_ms = None
+    if region is not None and shot.shape[:2] == (screen_height, screen_width):
+        left, top, w, h = region
+        cropped = np.ascontiguousarray(shot[top:top + h, left:left + w])
+        region_ms = timed(lambda: match(cropped, template))
+
+    return {
+        "sha1": template_hash(path),
+        "confidence": round(confidence, 4),
+        "floor": round(floor, 4),
+        "region": region,
+        "positives": len(positives),
+        "negatives": len(negatives),
+        "worst_positive": round(worst_positive, 4),
+        "best_negative": round(best_negative, 4),
+        "misses": sum(score < confidence for score in positives),
+        "match_ms": round(match_ms, 2),
+        "region_match_ms": region_ms and round(region_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("screenshots", help="directory with the screenshots and labels.json")
+    parser.add_argument("--labels", help="labels file (default: labels.json in the screenshot directory)")
+    parser.add_argument("--output", default=config.CALIBRATION_PATH, help="profile to write (default: CALIBRATION_PATH)")
+    parser.add_argument("--draft", action="store_true", help="write draft labels from the current matches and exit")
+    parser.add_argument("--dry-run", action="store_true", help="report without writing the profile")
+    args = parser.parse_args()
+
+    labels_path = args.labels or os.path.join(args.screenshots, "labels.json")
+    template_paths = sorted(set(templates.template_paths()))
+    if args.draft:
+        draft(args.screenshots, labels_path, template_paths)
+        return 0
+
+    with open(labels_path, encoding="utf-8") as f:
+        labels = json.load(f)
+    shots = load_screenshots(args.screenshots, labels)
+    if not shots:
+        print("No screenshots to calibrate with")
+        return 1
+
+    profile = {}
+    print(f"{'template':32} {'conf':>7} {'floor':>7} {'true>=':>7} {'false<=':>7} {'miss':>5} "
+          f"{'full ms':>8} {'region ms':>9}")
+    for path in template_paths:
+        name = os.path.basename(path)
+        entry = calibrate(path, shots, labels)
+        if entry is None:
+            print(f"{name:32} not on any screenshot, not calibrated")
+            continue
+        profile[name] = entry
+        region_ms = "-" if entry["region_match_ms"] is None else f"{entry['region_match_ms']:.2f}"
+        print(f"{name:32} {entry['confidence']:7.4f} {entry['floor']:7.4f} {entry['worst_positive']:7.4f} "
+              f"{entry['best_negative']:7.4f} {entry['misses']:5d} {entry['match_ms']:8.2f} {region_ms:>9}"
+              + ("  overlaps, set to avoid false matches" if entry["misses"] else ""))
+
+    if args.dry_run:
+        return 0
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "screenshots": len(shots),
+                   "templates": profile}, f, indent=2)
+    print(f"Wrote calibration of {len(profile)} templates to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
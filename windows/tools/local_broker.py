@@ -0,0 +1,326 @@
+"""
+Local MQTT brokers for benchmarks and test harnesses.
+
+`MosquittoBroker` runs a real mosquitto binary on a free local port.
+`InProcessBroker` is a small MQTT 3.1.1 stand-in (QoS 0 delivery, retained
+messages, last will, keepalive expiry, `$share/` subscriptions) for machines
+without mosquitto. Both can be killed and restarted to exercise reconnection,
+and the in-process broker can also freeze connections to simulate half-open
+sockets.
+"""
+import asyncio
+import itertools
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+
+
+def free_port():
+    """Return a free TCP port on localhost."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=5.0):
+    """Block until something accepts connections on the port."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return True
+        except OSError:
+            time.sleep(0.02)
+    return False
+
+
+def topic_matches(topic_filter, topic):
+    """Match a topic against an MQTT filter with `+` and `#` wildcards."""
+    filter_parts = topic_filter.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(filter_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+class MosquittoBroker:
+    """
+    A mosquitto process listening on localhost.
+    """
+
+    def __init__(self, port=None, binary=None):
+        self.port = port or free_port()
+        self.binary = binary or shutil.which("mosquitto")
+        self.proc = None
+        self.conf = None
+
+    def start(self):
+        if self.binary is None:
+            raise FileNotFoundError("mosquitto binary not found")
+        if self.conf is None:
+            fd, self.conf = tempfile.mkstemp(suffix=".conf")
+            with os.fdopen(fd, "w") as f:
+                f.write(f"listener {self.port} 127.0.0.1\nallow_anonymous true\n")
+        self.proc = subprocess.Popen([self.binary, "-c", self.conf],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not wait_for_port(self.port):
+            raise RuntimeError(f"mosquitto did not start on port {self.port}")
+        return self
+
+    def kill(self):
+        """Kill the broker without a clean shutdown."""
+        if self.proc:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def stop(self):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.wait()
+            self.proc = None
+        if self.conf and os.path.exists(self.conf):
+            os.remove(self.conf)
+            self.conf = None
+
+
+class _Session:
+    """State of one connected client in the in-process broker."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions = set()
+        self.will = None
+        self.keepalive = 0
+        self.last_seen = time.monotonic()
+        self.frozen = False
+
+
+class InProcessBroker:
+    """
+    Minimal MQTT 3.1.1 broker running on an asyncio loop in a background thread.
+    Messages are always delivered at QoS 0; QoS 1 publishes are acknowledged.
+    """
+
+    def __init__(self, port=None):
+        self.port = port or free_port()
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.sessions = set()
+        self.retained = {}
+        self.killed = False
+        self._share_counter = itertools.count()
+
+    # ---- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self.killed = False
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve, "127.0.0.1", self.port))
+            self.loop.create_task(self._expire_keepalives())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def kill(self):
+        """Drop every connection and stop listening, like a crashed broker."""
+        if self.loop is None:
+            return
+
+        async def shutdown():
+            self.server.close()
+            self.killed = True
+            for session in list(self.sessions):
+                session.writer.transport.abort()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.sessions.clear()
+            self.retained.clear()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    stop = kill
+
+    def freeze_connections(self):
+        """
+        Silently stop serving the current connections while keeping their
+        sockets open, like a half-open connection. New connections still work.
+        """
+        def freeze():
+            for session in self.sessions:
+                session.frozen = True
+
+        self.loop.call_soon_threadsafe(freeze)
+
+    # ---- protocol ----------------------------------------------------------
+
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header[0], body
+
+    @staticmethod
+    def _packet(header, body=b""):
+        length, encoded = len(body), bytearray()
+        while True:
+            byte = length % 128
+            length //= 128
+            encoded.append(byte | 0x80 if length else byte)
+            if not length:
+                break
+        return bytes([header]) + bytes(encoded) + body
+
+    @staticmethod
+    def _string(data, offset):
+        (n,) = struct.unpack_from("!H", data, offset)
+        return data[offset + 2: offset + 2 + n], offset + 2 + n
+
+    @staticmethod
+    def _publish_packet(topic, payload, retain=False):
+        topic = topic.encode()
+        return InProcessBroker._packet(0x30 | (1 if retain else 0),
+                                       struct.pack("!H", len(topic)) + topic + payload)
+
+    def _route(self, topic, payload, retain):
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        packet = self._publish_packet(topic, payload)
+        shared = {}
+        for session in list(self.sessions):
+            if session.frozen:
+                continue
+            for topic_filter in session.subscriptions:
+                if topic_filter.startswith("$share/"):
+                    _, group, real_filter = topic_filter.split("/", 2)
+                    if topic_matches(real_filter, topic):
+                        shared.setdefault((group, real_filter), []).append(session)
+                elif topic_matches(topic_filter, topic):
+                    session.writer.write(packet)
+                    break
+        for members in shared.values():
+            members[next(self._share_counter) % len(members)].writer.write(packet)
+
+    async def _serve(self, reader, writer):
+        session = _Session(writer)
+        self.sessions.add(session)
+        clean = False
+        try:
+            while True:
+                header, body = await self._read_packet(reader)
+                if session.frozen:
+                    continue
+                session.last_seen = time.monotonic()
+                kind = header >> 4
+                if kind == 1:  # CONNECT
+                    _, offset = self._string(body, 0)
+                    flags = body[offset + 1]
+                    (session.keepalive,) = struct.unpack_from("!H", body, offset + 2)
+                    client_id, offset = self._string(body, offset + 4)
+                    session.client_id = client_id.decode()
+                    if flags & 0x04:
+                        will_topic, offset = self._string(body, offset)
+                        will_payload, offset = self._string(body, offset)
+                        session.will = (will_topic.decode(), will_payload, bool(flags & 0x20))
+                    writer.write(self._packet(0x20, b"\x00\x00"))
+                elif kind == 3:  # PUBLISH
+                    qos = (header >> 1) & 0x03
+                    topic, offset = self._string(body, 0)
+                    if qos:
+                        packet_id = body[offset: offset + 2]
+                        offset += 2
+                        if qos == 1:
+                            writer.write(self._packet(0x40, packet_id))
+                    self._route(topic.decode(), body[offset:], bool(header & 0x01))
+                elif kind == 8:  # SUBSCRIBE
+                    packet_id, offset, granted = body[:2], 2, bytearray()
+                    new_filters = []
+                    while offset < len(body):
+                        topic_filter, offset = self._string(body, offset)
+                        offset += 1
+                        session.subscriptions.add(topic_filter.decode())
+                        new_filters.append(topic_filter.decode())
+                        granted.append(0)
+                    writer.write(self._packet(0x90, packet_id + bytes(granted)))
+                    for topic, payload in list(self.retained.items()):
+                        if any(topic_matches(f, topic) for f in new_filters if not f.startswith("$share/")):
+                            writer.write(self._publish_packet(topic, payload, retain=True))
+                elif kind == 10:  # UNSUBSCRIBE
+                    offset = 2
+                    while offset < len(body):
+                        topic_filter, offset = self._string(body, offset)
+                        session.subscriptions.discard(topic_filter.decode())
+                    writer.write(self._packet(0xB0, body[:2]))
+                elif kind == 12:  # PINGREQ
+                    writer.write(self._packet(0xD0))
+                elif kind == 14:  # DISCONNECT
+                    clean = True
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            if not clean and session.will and not self.killed:
+                self._route(*session.will)
+            writer.close()
+
+    async def _expire_keepalives(self):
+        while True:
+            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            for session in list(self.sessions):
+                if session.keepalive and not session.frozen and now - session.last_seen > 1.5 * session.keepalive:
+                    session.writer.transport.abort()
+
+
+def start_local_broker(port=None, prefer="mosquitto"):
+    """
+    Start a local broker, using mosquitto when available.
+
+    Args:
+        port (int): Port to listen on, a free one if None
+        prefer (str): "mosquitto" or "inprocess"
+
+    Returns:
+        MosquittoBroker or InProcessBroker: The started broker
+    """
+    if prefer == "mosquitto" and shutil.which("mosquitto"):
+        return MosquittoBroker(port).start()
+    return InProcessBroker(port).start()
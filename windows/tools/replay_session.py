@@ -0,0 +1,92 @@
+"""
+Replay recorded LINE sessions against the current templates and settings.
+
+Sessions are recorded to RECORDER_DIR when RECORDER_ENABLED is set. A replay
+runs the same send through LineMessenger, but every screen search matches
+against the recorded screenshot instead of the screen and no click or
+keystroke is executed. This turns a failed send from production into a
+regression case: change a template or a confidence, replay, and see whether
+the send now succeeds and takes the same path. --calibration replays with
+a calibration profile from tools/calibrate_templates.py before installing it.
+
+Reported per session: recorded and replayed result, screen searches,
+milliseconds per search, and where the replay departed from the recording.
+
+Usage:
+    python tools/replay_session.py ../logs/sessions
+    python tools/replay_session.py --check path/to/session.lnrec
+    python tools/replay_session.py --calibration new-calibration.json ../logs/sessions
+"""
+import os
+import sys
+
+curr_folder = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+if curr_folder not in sys.path:
+    sys.path.insert(0, curr_folder)
+
+import argparse
+import time
+
+import config
+from line_messenger import LineMessenger
+from recorder import SessionReader, ReplayScreen
+
+
+def session_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".lnrec"))
+        else:
+            yield path
+
+
+def replay(path):
+    """
+    Replay one session.
+
+    Returns:
+        bool: True if the replay matched the recording
+    """
+    reader = SessionReader(path)
+    try:
+        session = next((e for e in reader.events if e["kind"] == "session"), None)
+        if session is None:
+            print(f"{os.path.basename(path)}: no session event, skipped")
+            return True
+        recorded = next((e["ok"] for e in reader.events if e["kind"] == "result"), None)
+
+        screen = ReplayScreen(reader)
+        messenger = LineMessenger(replay=screen)
+        started = time.perf_counter()
+        result = messenger.send_message(session["action"], session["message"], group=session["group"])
+        elapsed = time.perf_counter() - started
+        divergences = screen.finish()
+
+        per_locate = f"{elapsed * 1000 / screen.locates:.1f}ms" if screen.locates else "-"
+        print(f"{os.path.basename(path)}: {session['action']} recorded={recorded} replayed={result} "
+              f"frames={len(reader)} searches={screen.locates} ({per_locate} each) "
+              f"size={os.path.getsize(path) / 1024:.0f}KiB")
+        for divergence in divergences:
+            print(f"    {divergence}")
+        return result == recorded and not divergences
+    finally:
+        reader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[config.RECORDER_DIR],
+                        help="session files or directories (default: RECORDER_DIR)")
+    parser.add_argument("--check", action="store_true", help="exit with 1 if any replay differs from its recording")
+    parser.add_argument("--calibration", help="calibration profile to use instead of CALIBRATION_PATH")
+    args = parser.parse_args()
+    if args.calibration:
+        config.CALIBRATION_PATH = args.calibration
+
+    matched = [replay(path) for path in session_paths(args.paths)]
+    print(f"{sum(matched)}/{len(matched)} sessions replayed as recorded")
+    return 1 if args.check and not all(matched) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
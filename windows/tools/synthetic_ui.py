@@ -0,0 +1,63 @@
+"""
+Synthetic UI backend for benchmarks.
+
+Installs a stand-in `line_messenger` module before the bridge modules are
+imported, so the MQTT and queue layers can be driven on any machine without
+LINE, a display or pyautogui. Each send just sleeps for a fixed duration to
+model the time the real UI automation takes.
+"""
+import sys
+import threading
+import time
+import types
+
+
+class SyntheticMessenger:
+    """
+    Records sends instead of driving the LINE desktop application.
+    """
+
+    def __init__(self, send_delay=0.0):
+        """
+        Args:
+            send_delay (float): Seconds each send takes
+        """
+        self.send_delay = send_delay
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_message(self, action, message="", trace=None, group=None, token=None):
+        if self.send_delay:
+            if token is None:
+                time.sleep(self.send_delay)
+            elif token.wait(self.send_delay):
+                return False  # interrupted like the messenger at a checkpoint
+        with self.lock:
+            self.sent.append((time.monotonic(), action, message, group))
+        return True
+
+    def self_check(self, should_yield=None):
+        return []
+
+
+def install(send_delay=0.0):
+    """
+    Register the synthetic backend as the `line_messenger` module.
+
+    Args:
+        send_delay (float): Seconds each send takes
+
+    Returns:
+        SyntheticMessenger: The messenger receiving all sends
+    """
+    messenger = SyntheticMessenger(send_delay)
+    module = types.ModuleType("line_messenger")
+    module.messenger = messenger
+
+    def send_message(action, msg="", trace=None, group=None, token=None):
+        return messenger.send_message(action, msg, trace, group, token)
+
+    module.send_message = send_message
+    module.self_check = messenger.self_check
+    sys.modules["line_messenger"] = module
+    return messenger
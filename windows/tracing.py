@@ -0,0 +1,120 @@
+"""
+Structured event tracing for button presses.
+
+Every MQTT event gets a `Trace` carrying its trace id from MessageHandler
+through MessageQueueProcessor into LineMessenger. Each stage emits one
+compact JSON line to `trace.log`, with monotonic timestamps in seconds:
+
+    {"trace":"Xk3_a9Qz","stage":"navigate","t":1234.567891,"dur":0.842,"ok":true}
+
+`t` is the start of the stage and `dur` its duration; point events have no
+`dur`. `tools/analyze_latency.py` turns these files into per-stage percentiles.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+import nanoid
+
+import config
+from logger import setup_logger
+
+# Setup logger, spans go to logs/trace.log as raw JSON lines
+log = setup_logger("trace", console_output=False, dc_output=False, file_format="%(message)s")
+
+
+class _JsonLine:
+    """Serializes a span lazily, on the logging listener thread."""
+
+    __slots__ = ("fields",)
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def __str__(self):
+        return json.dumps(self.fields, ensure_ascii=False, separators=(",", ":"))
+
+
+class Trace:
+    """
+    Trace of one event through the processing stages.
+
+    Attributes:
+        trace_id (str): Identifier shared by every span of this event
+        start (float): Monotonic time the event was received
+        received (float): Wall-clock time the event was received, comparable
+            between bridge instances
+        stages (dict): Accumulated duration per stage name, in seconds
+    """
+
+    def __init__(self, trace_id=None, start=None, received=None):
+        """
+        Args:
+            trace_id (str): Trace id, a new one is generated if None
+            start (float): Monotonic receive time, defaults to now
+            received (float): Wall-clock receive time, defaults to now
+        """
+        self.trace_id = trace_id or nanoid.generate(size=8)
+        self.start = time.monotonic() if start is None else start
+        self.received = time.time() if received is None else received
+        self.stages = {}
+
+    def _emit(self, fields):
+        if config.TRACE_ENABLED:
+            log.info("%s", _JsonLine(fields))
+
+    def event(self, stage, **fields):
+        """
+        Emit a point event.
+
+        Args:
+            stage (str): Stage name
+            **fields: Extra JSON fields
+        """
+        self._emit({"trace": self.trace_id, "stage": stage, "t": round(time.monotonic(), 6), **fields})
+
+    def record(self, stage, start, end=None, ok=True, **fields):
+        """
+        Emit a span with explicit bounds.
+
+        Args:
+            stage (str): Stage name
+            start (float): Monotonic start time
+            end (float): Monotonic end time, defaults to now
+            ok (bool): Whether the stage succeeded
+            **fields: Extra JSON fields
+        """
+        end = time.monotonic() if end is None else end
+        duration = end - start
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+        self._emit({"trace": self.trace_id, "stage": stage, "t": round(start, 6),
+                    "dur": round(duration, 6), "ok": ok, **fields})
+
+    @contextmanager
+    def span(self, stage, **fields):
+        """
+        Time the enclosed block as a stage. The span is marked not ok if the
+        block raises; a block can also set `result["ok"] = False` itself.
+
+        Args:
+            stage (str): Stage name
+            **fields: Extra JSON fields
+        """
+        start = time.monotonic()
+        result = {"ok": True}
+        try:
+            yield result
+        except BaseException:
+            result["ok"] = False
+            raise
+        finally:
+            # The block may still read result["ok"] after the span closed
+            extra = {k: v for k, v in result.items() if k != "ok"}
+            self.record(stage, start, ok=result["ok"], **fields, **extra)
+
+    def elapsed(self):
+        """
+        Returns:
+            float: Seconds since the event was received
+        """
+        return time.monotonic() - self.start
@@ -0,0 +1,350 @@
+"""
+LINE UI automation in a supervised worker process.
+
+Template matching, pyautogui and the clipboard can hold the GIL or hang
+outright. Run in the bridge process, that starves paho's keepalives and the
+parse threads, and a hung pyautogui call freezes everything. With
+UI_WORKER_ENABLED the LineMessenger lives in a child process instead and
+MessageQueueProcessor sends it jobs over a pipe. MQTT ingestion and the
+outbox journal keep running whatever the UI does.
+
+The supervisor kills the worker when a job exceeds UI_WORKER_JOB_TIMEOUT,
+when it stops answering pings while idle, or when it dies. It then starts a
+new one, which warms up LINE again before taking jobs. A send is retried
+once on the new worker only if the old one never started it: a send that
+hung halfway may already have posted the message or placed the call. A send the bridge cancels for
+a more urgent one is interrupted through the shared interrupt event; a
+worker that does not stop within PREEMPT_TIMEOUT is restarted instead.
+
+The worker's log records are forwarded to this process, so the log files
+and the Discord bot are only ever written by the bridge process.
+"""
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import traceback
+from threading import Thread, Event, Lock
+
+import config
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("ui_worker")
+
+# Reply states
+DONE = "done"
+ERROR = "error"
+LOST = "lost"   # the worker crashed, hung or is not running
+STARTED = "started"  # the worker took a send, it may touch the UI from now on
+COMMITTED = "committed"  # the send posted its message, it runs to completion now
+
+
+def _worker_main(conn, log_queue, interrupt, settings):
+    """
+    Entry point of the worker process: warm up LINE, then run jobs until
+    the pipe closes.
+
+    Args:
+        conn (Connection): Pipe end for jobs and replies
+        log_queue (Queue): Where log records are forwarded
+        interrupt (Event): Set by the bridge to stop a self-check or a send early
+        settings (dict): The bridge's current configuration
+    """
+    import config
+    from logger import forward_records
+    for key, value in settings.items():
+        setattr(config, key, value)
+    forward_records(log_queue)
+
+    import line_messenger
+    import templates
+    from cancellation import CancelToken
+    try:
+        templates.preload()
+        line_messenger.get_messenger()
+    except BaseException as e:
+        conn.send((ERROR, f"warm-up failed: {e}", None))
+        return
+    conn.send((DONE, os.getpid(), None))
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        kind = job[0]
+        try:
+            if kind == "send":
+                _, action, message, trace, group = job
+                conn.send((STARTED, None, None))
+                token = CancelToken(interrupt, on_commit=lambda: conn.send((COMMITTED, None, None)))
+                result = line_messenger.send_message(action, message, trace, group, token=token)
+                conn.send((DONE, result, trace.stages))
+            elif kind == "self_check":
+                conn.send((DONE, line_messenger.self_check(should_yield=interrupt.is_set), None))
+            elif kind == "config":
+                _, changed_settings, changed_keys, changed_templates = job
+                for key, value in changed_settings.items():
+                    setattr(config, key, value)
+                line_messenger.on_config_changed(changed_keys, changed_templates)
+                conn.send((DONE, None, None))
+            elif kind == "ping":
+                conn.send((DONE, "pong", None))
+            elif kind == "stop":
+                return
+        except Exception as e:
+            conn.send((ERROR, f"{e}", traceback.format_exc()))
+
+
+def _forward_logs(log_queue, stopped):
+    """Write the worker's log records through this process's loggers."""
+    while not stopped.is_set():
+        try:
+            record = log_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        except (EOFError, OSError):
+            return
+        logger = logging.getLogger(record.name)
+        if not logger.handlers:
+            setup_logger(record.name)
+        logger.handle(record)
+
+
+class UIWorker:
+    """
+    Supervisor of the worker process, with the same send_message() and
+    self_check() as the line_messenger module.
+    """
+
+    def __init__(self):
+        # Spawn on every platform: forking a process with running threads is unsafe
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.conn = None
+        self.logs_stopped = None
+        self.interrupt = self.context.Event()
+        self.lock = Lock()  # one job at a time
+        self.ready = Event()
+        self.restarts = 0
+        self.next_restart = 0.0  # monotonic time before which the supervisor does not retry
+        self.should_stop = Event()
+        self.supervisor = None
+        self.job_started = False  # the worker reported STARTED for the current send
+        self.job_token = None     # CancelToken of the current send, committed when the worker reports it
+
+    # ---- process lifecycle -------------------------------------------------
+
+    def start(self):
+        """
+        Start the worker and wait until it has found LINE, if it is not running yet.
+
+        Returns:
+            bool: True if the worker is ready
+        """
+        with self.lock:
+            ready = self.ready.is_set() or self._spawn()
+        if self.supervisor is None:
+            self.supervisor = Thread(target=self._supervise, name="ui-supervisor", daemon=True)
+            self.supervisor.start()
+        return ready
+
+    def _spawn(self):
+        """Start a worker process and wait for its warm-up. Called with the lock held."""
+        started = time.monotonic()
+        conn, child_conn = self.context.Pipe()
+        log_queue = self.context.Queue()
+        self.logs_stopped = Event()
+        Thread(target=_forward_logs, args=(log_queue, self.logs_stopped), name="ui-worker-logs", daemon=True).start()
+        self.process = self.context.Process(
+            target=_worker_main, args=(child_conn, log_queue, self.interrupt, config.current_settings()),
+            name="ui-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = conn
+
+        state, value, _ = self._receive(config.UI_WORKER_START_TIMEOUT)
+        if state != DONE:
+            log.critical(f"UI worker failed to start: {value}")
+            self._kill()
+            self.next_restart = time.monotonic() + config.UI_WORKER_RESTART_DELAY
+            return False
+        log.info(f"UI worker {value} ready in {time.monotonic() - started:.1f}s")
+        self.ready.set()
+        return True
+
+    def _kill(self):
+        """Stop the worker process, forcibly if needed. Called with the lock held."""
+        self.ready.clear()
+        if self.process is not None and self.process.is_alive():
+            self.process.kill()
+            self.process.join(5)
+        if self.conn is not None:
+            self.conn.close()
+        if self.logs_stopped is not None:
+            self.logs_stopped.set()
+        self.process = self.conn = None
+
+    def _restart(self, reason):
+        """Replace the worker. Called with the lock held."""
+        log.critical(f"UI worker {reason}, restarting it")
+        self._kill()
+        self.restarts += 1
+        return self._spawn()
+
+    def _supervise(self):
+        """Restart a dead worker and ping an idle one."""
+        while not self.should_stop.wait(config.UI_WORKER_PING_INTERVAL):
+            if not self.lock.acquire(blocking=False):
+                continue  # a job is running and has its own timeout
+            try:
+                if self.should_stop.is_set():
+                    return
+                if self.process is None or not self.process.is_alive():
+                    if time.monotonic() >= self.next_restart:
+                        self._restart("is not running")
+                elif self._request(("ping",), config.UI_WORKER_PING_TIMEOUT)[0] == LOST:
+                    self._restart("stopped answering")
+            except Exception as e:
+                log.error(f"Error supervising UI worker: {e}")
+            finally:
+                self.lock.release()
+
+    def stop(self):
+        """Stop the supervisor and the worker."""
+        self.should_stop.set()
+        with self.lock:
+            if self.conn is not None:
+                try:
+                    self.conn.send(("stop",))
+                    self.process.join(5)
+                except (OSError, ValueError):
+                    pass
+            self._kill()
+
+    # ---- jobs --------------------------------------------------------------
+
+    def _receive(self, timeout, should_yield=None):
+        """
+        Wait for the worker's reply.
+
+        Returns:
+            tuple: (state, value, extra)
+        """
+        job_deadline = deadline = time.monotonic() + timeout
+        limit = timeout
+        try:
+            while True:
+                while not self.conn.poll(0.05):
+                    if should_yield is not None and not self.interrupt.is_set() and should_yield():
+                        self.interrupt.set()
+                        if time.monotonic() + config.PREEMPT_TIMEOUT < job_deadline:
+                            deadline, limit = time.monotonic() + config.PREEMPT_TIMEOUT, config.PREEMPT_TIMEOUT
+                    if time.monotonic() > deadline:
+                        return LOST, f"no reply after {limit}s", None
+                    if not self.process.is_alive():
+                        return LOST, f"exited with code {self.process.exitcode}", None
+                reply = self.conn.recv()
+                if reply[0] == STARTED:
+                    self.job_started = True
+                elif reply[0] == COMMITTED:
+                    # The send no longer stops when interrupted, give it the whole job time
+                    if self.job_token is not None:
+                        self.job_token.commit()
+                    deadline, limit = job_deadline, timeout
+                else:
+                    return reply
+        except (EOFError, OSError) as e:
+            self.process.join(1)
+            if self.process.exitcode is not None:
+                return LOST, f"exited with code {self.process.exitcode}", None
+            return LOST, f"connection lost ({e!r})", None
+
+    def _request(self, job, timeout, should_yield=None):
+        """Send a job and wait for its reply. Called with the lock held."""
+        if not self.ready.is_set() and not self._spawn():
+            return LOST, "is not running", None
+        try:
+            self.conn.send(job)
+        except (OSError, ValueError) as e:
+            return LOST, f"connection lost ({e})", None
+        return self._receive(timeout, should_yield)
+
+    def send_message(self, action, message="", trace=None, group=None, token=None):
+        """
+        Send a message through the worker, see line_messenger.send_message.
+        If the worker crashes or hangs, it is restarted. The send is retried
+        once only if the worker died before it started the send; one that
+        started may already have posted the message or placed the call.
+
+        Returns:
+            bool: True if message sent successfully, False otherwise
+        """
+        should_yield = None if token is None else (lambda: token.cancelled and not token.committed)
+        with self.lock:
+            self.job_token = token
+            try:
+                for attempt in range(2):
+                    self.interrupt.clear()
+                    self.job_started = False
+                    state, value, stages = self._request(("send", action, message, trace, group),
+                                                         config.UI_WORKER_JOB_TIMEOUT, should_yield)
+                    if state == DONE:
+                        if trace is not None and stages is not None:
+                            trace.stages = stages
+                        return value
+                    if state == ERROR:
+                        log.error(f"UI worker failed to send: {value}")
+                        return False
+                    if token is not None and token.cancelled and not token.committed:
+                        self._restart(f"did not stop when interrupted ({value})")
+                        return False
+                    if self.job_started:
+                        log.error(f"UI worker {value} during {action}, not retrying: it may have been sent already")
+                        self._restart(value)
+                        return False
+                    if not self._restart(value) or attempt:
+                        return False
+                    log.warning(f"Retrying {action} on the new UI worker")
+            finally:
+                self.job_token = None
+        return False
+
+    def self_check(self, should_yield=None):
+        """
+        Run the UI self-check in the worker, see line_messenger.self_check.
+
+        Returns:
+            list: Problems found, or None if the check was interrupted
+        """
+        with self.lock:
+            self.interrupt.clear()
+            state, value, extra = self._request(("self_check",), config.UI_WORKER_JOB_TIMEOUT, should_yield)
+            if state == LOST:
+                self._restart(value)
+                return None
+        if state == ERROR:
+            raise RuntimeError(value)
+        return value
+
+    def on_config_changed(self, changed_keys, changed_templates):
+        """
+        Configuration reload listener: apply the changed settings in the
+        worker. A worker started later reads the whole configuration anyway.
+
+        Args:
+            changed_keys (set): Names of the changed settings
+            changed_templates (set): Paths of the changed template images
+        """
+        changed_settings = {key: getattr(config, key) for key in changed_keys}
+        with self.lock:
+            if not self.ready.is_set():
+                return
+            state, value, _ = self._request(("config", changed_settings, changed_keys, changed_templates),
+                                            config.UI_WORKER_PING_TIMEOUT)
+            if state == LOST:
+                self._restart(value)
+        if state == ERROR:
+            log.error(f"UI worker could not apply the configuration: {value}")
@@ -0,0 +1,85 @@
+"""
+Parallel startup warm-up.
+
+Independent startup steps (loading templates, detecting LINE, connecting
+to MQTT, starting the Discord bot, ...) run at the same time. The bridge is
+reported ready with a per-step timing breakdown once all of them finished.
+"""
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import setup_logger
+
+# Setup logger
+log = setup_logger("warmup")
+
+
+class WarmupStep:
+    """Outcome of one warm-up step."""
+
+    def __init__(self, name, required):
+        self.name = name
+        self.required = required
+        self.result = None
+        self.error = None
+        self.duration = None
+
+
+class Warmup:
+    """
+    Runs registered startup steps concurrently and reports their timings.
+    """
+
+    def __init__(self):
+        self.steps = []
+
+    def add(self, name, func, required=True):
+        """
+        Register a step.
+
+        Args:
+            name (str): Step name used in the report
+            func (callable): Function to run, its return value is kept as the result
+            required (bool): Whether a failure of this step should abort startup
+        """
+        self.steps.append((WarmupStep(name, required), func))
+
+    def _run_step(self, step, func, started):
+        start = time.monotonic()
+        try:
+            step.result = func()
+        except BaseException as e:
+            step.error = e
+            log.error(f"Warm-up step {step.name} failed: {e}")
+            log.debug(traceback.format_exc())
+        finally:
+            step.duration = time.monotonic() - start
+            log.debug("Warm-up step %s finished %.3fs after start", step.name, time.monotonic() - started)
+        return step
+
+    def run(self):
+        """
+        Run every step in parallel and wait for all of them.
+
+        Returns:
+            dict: Step name to the step's return value
+
+        Raises:
+            BaseException: The error of the first failed required step,
+                after every step has finished
+        """
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self.steps) or 1, thread_name_prefix="warmup") as pool:
+            futures = [pool.submit(self._run_step, step, func, started) for step, func in self.steps]
+            steps = [future.result() for future in futures]
+        total = time.monotonic() - started
+
+        breakdown = ", ".join(
+            f"{s.name} {s.duration:.2f}s" + (" (failed)" if s.error else "") for s in steps)
+        failed = [s for s in steps if s.error is not None and s.required]
+        if failed:
+            log.critical(f"Warm-up failed after {total:.2f}s: {breakdown}")
+            raise failed[0].error
+        log.info(f"Ready in {total:.2f}s: {breakdown}")
+        return {s.name: s.result for s in steps}